@@ -0,0 +1,167 @@
+# Parquet archive of all the crawls, partitioned by crawl date and postcode:
+#
+#   archive/crawl_date=2026-10-19/postcode=8004/part-....parquet
+#
+# The columns are typed (prices, rooms and surfaces as numbers) so nothing has to be parsed
+# again at analysis time. ArchiveQuery scans the archive lazily: filters on crawl_date and
+# postcode skip whole directories, filters on the other columns are pushed down to the
+# Parquet row groups, only the requested columns are read, and the files are memory-mapped.
+#
+#   Archive('archive').query().postcodes(range(8001, 8009)).last_days(90) \
+#       .where(pc.field('n_of_rooms') >= 3.5).columns('link', 'rent').to_pandas()
+
+import datetime
+import uuid
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from listing_batch import ListingBatch
+from records import LISTING_FIELDS
+
+NUMBER_COLUMNS = ['net_rent', 'expenses', 'rent', 'n_of_rooms', 'n_of_floors', 'surface_living',
+                  'floor_space', 'room_height']
+YEAR_COLUMNS = ['last_refurbishment', 'year_built']
+PARTITIONING = ds.partitioning(pa.schema([('crawl_date', pa.date32()), ('postcode', pa.string())]), flavor='hive')
+
+
+def _column_type(name):
+    if name in NUMBER_COLUMNS:
+        return pa.float64()
+    if name in YEAR_COLUMNS:
+        return pa.int32()
+    if name == 'features':
+        return pa.list_(pa.string())
+    return pa.string()
+
+
+# The schema of the whole archive. Files written before a column was added (description,
+# site...) read it as nulls, instead of the dataset taking its schema from whichever file
+# comes first.
+ARCHIVE_SCHEMA = pa.schema([(name, _column_type(name)) for name in LISTING_FIELDS]
+                           + [('scraped_at', pa.timestamp('s')), ('crawl_date', pa.date32())])
+
+
+def _to_number(array):
+    # "CHF 2,450.–" -> 2450.0, "3.5" -> 3.5, "80 m²" -> 80.0, "On request" -> null
+    array = pc.cast(array, pa.string())
+    matched = pc.struct_field(pc.extract_regex(array, r"(?P<n>\d[\d',’]*(?:\.\d+)?)"), [0])
+    return pc.cast(pc.replace_substring_regex(matched, r"[',’]", ''), pa.float64())
+
+
+def typed_table(batch, crawl_date, scraped_at=None):
+    # Arrow table of a ListingBatch with the archive's column types
+    return type_columns(batch.to_arrow(), crawl_date, scraped_at)
+
+
+def type_columns(record_batch, crawl_date, scraped_at=None):
+    # the listing columns (strings) of an Arrow table/record batch as the archive's column types
+    columns = {}
+    for name in record_batch.schema.names:
+        column = record_batch.column(name)
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(pa.string())
+        if name in NUMBER_COLUMNS:
+            column = _to_number(column)
+        elif name in YEAR_COLUMNS:
+            column = pc.cast(_to_number(column), _column_type(name))
+        elif name == 'features':
+            column = column.cast(_column_type(name))
+        columns[name] = column
+    n = record_batch.num_rows
+    columns['scraped_at'] = pa.array([scraped_at or datetime.datetime.now()] * n, type=pa.timestamp('s'))
+    columns['crawl_date'] = pa.array([crawl_date] * n, type=pa.date32())
+    return pa.table(columns)
+
+
+class ParquetSink:
+    # Buffers the listings and writes them to the archive every `flush_every` listings.
+    # Without a crawl_date the listings go to the partition of the day they are flushed on
+    # (the watch mode runs for days).
+
+    def __init__(self, root='archive', crawl_date=None, flush_every=500):
+        self.root = root
+        self.crawl_date = crawl_date
+        self.flush_every = flush_every
+        self.batch = ListingBatch()
+        self.n_written = 0
+
+    def write(self, listing, worker=None):
+        self.batch.append(listing)
+        if len(self.batch) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not len(self.batch):
+            return
+        table = typed_table(self.batch, self.crawl_date or datetime.date.today())
+        ds.write_dataset(table, self.root, format='parquet', partitioning=PARTITIONING,
+                         basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet',
+                         existing_data_behavior='overwrite_or_ignore')
+        self.n_written += len(self.batch)
+        self.batch.clear()
+
+    def close(self):
+        self.flush()
+        print(f'{self.n_written} flats were written to the archive {self.root}')
+
+
+class Archive:
+
+    def __init__(self, root='archive'):
+        self.root = root
+
+    def dataset(self):
+        return ds.dataset(self.root, schema=ARCHIVE_SCHEMA, format='parquet', partitioning=PARTITIONING,
+                          filesystem=fs.LocalFileSystem(use_mmap=True))
+
+    def query(self):
+        return ArchiveQuery(self)
+
+
+class ArchiveQuery:
+    # Nothing is read until to_table()/to_pandas()/count()/batches() is called
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.filter = None
+        self.selected = None
+
+    def where(self, expression):
+        self.filter = expression if self.filter is None else self.filter & expression
+        return self
+
+    def columns(self, *names):
+        self.selected = list(names)
+        return self
+
+    def postcodes(self, postcodes):
+        return self.where(pc.field('postcode').isin([str(postcode) for postcode in postcodes]))
+
+    def between(self, start=None, end=None):
+        if start is not None:
+            self.where(pc.field('crawl_date') >= pa.scalar(start, pa.date32()))
+        if end is not None:
+            self.where(pc.field('crawl_date') <= pa.scalar(end, pa.date32()))
+        return self
+
+    def last_days(self, days):
+        return self.between(datetime.date.today() - datetime.timedelta(days=days))
+
+    def scanner(self):
+        return self.archive.dataset().scanner(columns=self.selected, filter=self.filter)
+
+    def batches(self):
+        # record batches one at a time, for results bigger than memory
+        return self.scanner().to_batches()
+
+    def to_table(self):
+        return self.scanner().to_table()
+
+    def to_pandas(self):
+        return self.to_table().to_pandas()
+
+    def count(self):
+        return self.scanner().count_rows()
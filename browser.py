@@ -0,0 +1,177 @@
+# Lifecycle of the Chrome sessions used by the crawler.
+#
+# A Chrome that runs for hours keeps growing, and when it dies every later page fails. A
+# ManagedBrowser counts the page loads of its session and looks at the memory of the
+# chromedriver + Chrome processes every few loads. It recycles the session after
+# `max_pages` loads or above `max_mb` MB, and replaces it when it crashed. The cookies
+# (consent!) are carried over to the new session, so recycling is invisible to the crawl.
+
+import functools
+import time
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import WebDriverException
+from webdriver_manager.chrome import ChromeDriverManager
+
+try:
+    import psutil
+except ImportError:  # no memory watchdog, recycling on page count only
+    psutil = None
+
+
+@functools.lru_cache(maxsize=None)
+def chromedriver_path():
+    # ChromeDriverManager checks the installed Chrome version every time, once per process is enough
+    return ChromeDriverManager().install()
+
+
+class ManagedBrowser:
+
+    def __init__(self, make_driver, max_pages=200, max_mb=1500, memory_check_every=10, home_urls=None,
+                 close_driver=None):
+        self.make_driver = make_driver
+        # close_driver(driver, retire) instead of driver.quit(), e.g. to give a leased browser
+        # back (retire=True when it's worn out or crashed)
+        self.close_driver = close_driver
+        self.max_pages = max_pages
+        self.max_mb = max_mb
+        self.memory_check_every = memory_check_every
+        # site name -> page to open before restoring the site's cookies (they can only be set
+        # on their domain)
+        self.home_urls = home_urls or {}
+        self.driver = None
+        self.pages = 0
+        self.started = None
+        self.cookies = []
+        # the sites whose cookie banner was dealt with in this session
+        self.consented_sites = set()
+        self.n_recycled = 0
+        self.n_crashes = 0
+
+    def get(self):
+        if self.driver is None:
+            self.start()
+        return self.driver
+
+    def start(self):
+        self.driver = self.make_driver()
+        self.pages = 0
+        self.started = time.time()
+        # a warm browser from the browser service comes with its consent already given
+        warm_sites = getattr(self.driver, 'consented_sites', None)
+        if warm_sites:
+            self.consented_sites = set(warm_sites)
+        elif self.cookies:
+            self._restore_cookies()
+        else:
+            self.consented_sites = set()
+
+    def for_navigation(self):
+        # The driver to load the next page with, recycled first when it's worn out and
+        # replaced when it crashed since the last page
+        if self.driver is not None and not self.is_alive():
+            print('The browser session is gone, starting a new one')
+            self.replace()
+        driver = self.get()
+        self.pages += 1
+        if self.max_pages and self.pages > self.max_pages:
+            print(f'Recycling the browser after {self.pages - 1} pages')
+            self.recycle()
+        elif self.max_mb and self.memory_check_every and self.pages % self.memory_check_every == 0:
+            memory = self.memory_mb()
+            if memory is not None and memory > self.max_mb:
+                print(f'Recycling the browser at {memory:.0f} MB')
+                self.recycle()
+        if self.driver is not driver:
+            self.pages = 1
+        return self.driver
+
+    def memory_mb(self):
+        # resident memory of chromedriver and all the Chrome processes it started
+        if psutil is None or self.driver is None:
+            return None
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            rss = 0
+            for p in processes:
+                try:
+                    rss += p.memory_info().rss
+                except psutil.Error:
+                    pass
+            return rss / 2 ** 20
+        except (psutil.Error, AttributeError):
+            return None
+
+    def is_alive(self):
+        if self.driver is None:
+            return False
+        try:
+            self.driver.window_handles
+            return True
+        except WebDriverException:
+            return False
+
+    def recycle(self):
+        # planned restart: keep the cookies of the old session
+        self._save_cookies()
+        self.quit(retire=True)
+        self.start()
+        self.n_recycled += 1
+
+    def replace(self, reopen_url=None):
+        # after a crash: the old session can't tell us its cookies any more, reuse the ones
+        # saved at the last recycle/consent
+        self.n_crashes += 1
+        self.quit(retire=True)
+        self.start()
+        if reopen_url:
+            self.driver.get(reopen_url)
+
+    def remember_session(self):
+        # call once the session is in a good state (e.g. consent given)
+        self._save_cookies()
+
+    def quit(self, retire=False):
+        driver, self.driver = self.driver, None
+        if driver is not None:
+            try:
+                if self.close_driver is not None:
+                    self.close_driver(driver, retire)
+                else:
+                    driver.quit()
+            except Exception:
+                pass  # the old session is usually dead already
+
+    def _save_cookies(self):
+        try:
+            cookies = self.driver.get_cookies()
+        except (WebDriverException, AttributeError):
+            return
+        # the driver only gives the cookies of the current page's site: keep the ones of the
+        # other sites saved earlier
+        saved = {(c.get('domain'), c['name'], c.get('path')): c for c in self.cookies + (cookies or [])}
+        self.cookies = list(saved.values())
+
+    def _restore_cookies(self):
+        for site, home_url in self.home_urls.items():
+            host = urlsplit(home_url).hostname
+            cookies = [cookie for cookie in self.cookies if _on_host(cookie, host)]
+            if not cookies:
+                continue
+            try:
+                self.driver.get(home_url)
+                for cookie in cookies:
+                    cookie = {key: value for key, value in cookie.items() if key != 'sameSite' or value in ('Strict', 'Lax', 'None')}
+                    try:
+                        self.driver.add_cookie(cookie)
+                    except WebDriverException:
+                        pass  # e.g. a cookie of a subdomain
+            except WebDriverException as e:
+                print(f'Could not restore the cookies of {site}: {e}')
+                self.consented_sites.discard(site)
+
+
+def _on_host(cookie, host):
+    domain = (cookie.get('domain') or '').lstrip('.')
+    return bool(domain) and (host == domain or host.endswith('.' + domain))
@@ -0,0 +1,371 @@
+# Warm browser service: a pool of Chrome instances that outlive the crawl runs.
+#
+# Starting Chrome, its profile and chromedriver and getting past the cookie banner takes
+# seconds, which is most of a short scheduled run. The service starts `size` Chromes once,
+# each with its own debugging port and profile, opens the home page of the sites and accepts
+# their cookies, and then hands them out over a small local http API:
+#
+#   POST /lease    {"client": "node-1"}        -> {"id", "token", "debugger_address", "consented_sites"}
+#   POST /release  {"id", "token", "retire"}   -> the Chrome goes back to the pool (restarted if retired)
+#   GET  /status                               -> the state of every Chrome
+#
+# A crawl run with BROWSER_SERVICE=http://127.0.0.1:9400 leases a Chrome per thread and
+# attaches chromedriver to it (debuggerAddress) instead of launching its own; when the
+# service is not there or has no free Chrome it falls back to launching one. A health check
+# restarts the Chromes that died or grew too big and takes back the leases of runs that
+# never returned them.
+#
+#   python browser_service.py
+
+import json
+import os
+import secrets
+import shutil
+import subprocess
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+import config
+from browser import ManagedBrowser, chromedriver_path
+from sites import site_for_url
+
+try:
+    import psutil
+except ImportError:  # no memory check of the pooled Chromes
+    psutil = None
+
+# the flags of make_driver() in web_scraper.py
+CHROME_ARGUMENTS = ['--headless', '--disable-gpu', '--no-sandbox', '--disable-dev-shm-usage',
+                    '--window-size=1500,1080', '--disable-blink-features=AutomationControlled']
+CHROME_BINARIES = ['google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome']
+
+
+def attach_driver(debugger_address):
+    # chromedriver session on a Chrome that is already running
+    options = Options()
+    options.debugger_address = debugger_address
+    return webdriver.Chrome(service=Service(chromedriver_path()), options=options)
+
+
+def detach_driver(driver):
+    # Stops chromedriver but leaves the Chrome running (quit() would close it)
+    try:
+        driver.service.stop()
+    except Exception:
+        pass
+
+
+def _cdp(port, path, timeout=2):
+    # the DevTools http endpoints of a Chrome (/json/version, /json/list, /json/close/<id>)
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=timeout) as response:
+        body = response.read()
+    return json.loads(body) if body.strip().startswith((b'{', b'[')) else body
+
+
+class BrowserSlot:
+
+    def __init__(self, id, port, profile_dir):
+        self.id = id
+        self.port = port
+        self.profile_dir = profile_dir
+        self.process = None
+        self.state = 'starting'
+        self.consented_sites = set()
+        self.token = None
+        self.client = None
+        self.lease_expires = None
+        self.started = None
+        self.n_leases = 0
+        self.n_restarts = 0
+
+    @property
+    def debugger_address(self):
+        return f'127.0.0.1:{self.port}'
+
+    def to_dict(self):
+        return {'id': self.id, 'state': self.state, 'debugger_address': self.debugger_address,
+                'client': self.client, 'consented_sites': sorted(self.consented_sites),
+                'uptime': round(time.time() - self.started) if self.started else None,
+                'n_leases': self.n_leases, 'n_restarts': self.n_restarts}
+
+
+class BrowserService:
+
+    def __init__(self, size=4, first_port=9300, profiles_dir='browser_profiles', chrome_binary=None,
+                 warm_urls=(), lease_seconds=7200, max_mb=1500):
+        self.chrome_binary = chrome_binary or next(filter(None, map(shutil.which, CHROME_BINARIES)), None)
+        if self.chrome_binary is None:
+            raise RuntimeError('Chrome not found, set CHROME_BINARY')
+        self.slots = [BrowserSlot(i, first_port + i, os.path.abspath(os.path.join(profiles_dir, f'chrome-{i}')))
+                      for i in range(size)]
+        self.warm_urls = list(warm_urls)
+        self.lease_seconds = lease_seconds
+        self.max_mb = max_mb
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def start(self):
+        threads = [threading.Thread(target=self._restart, args=(slot,)) for slot in self.slots]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _launch(self, slot):
+        os.makedirs(slot.profile_dir, exist_ok=True)
+        slot.process = subprocess.Popen([self.chrome_binary, *CHROME_ARGUMENTS,
+                                         f'--remote-debugging-port={slot.port}',
+                                         f'--user-data-dir={slot.profile_dir}', 'about:blank'],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        slot.started = time.time()
+        deadline = time.time() + 30
+        while not self._is_alive(slot):
+            if time.time() > deadline or slot.process.poll() is not None:
+                raise RuntimeError(f'Chrome {slot.id} did not start')
+            time.sleep(0.2)
+
+    def _warm(self, slot):
+        # opens every site once and deals with its cookie banner, the consent stays in the
+        # profile of the Chrome
+        driver = attach_driver(slot.debugger_address)
+        browser = ManagedBrowser(lambda: driver)
+        try:
+            for url in self.warm_urls:
+                site = site_for_url(url)
+                driver.get(url)
+                if site.accept_cookies(browser, url):
+                    slot.consented_sites.add(site.name)
+            driver.get('about:blank')
+        finally:
+            detach_driver(driver)
+
+    def _restart(self, slot):
+        self._stop_process(slot)
+        slot.consented_sites = set()
+        try:
+            self._launch(slot)
+            self._warm(slot)
+        except Exception as e:
+            print(f'{time.ctime()} Could not start Chrome {slot.id}: {e}')
+            self._stop_process(slot)
+            with self.lock:
+                slot.state = 'dead'
+            return
+        with self.lock:
+            slot.state = 'idle'
+        print(f'{time.ctime()} Chrome {slot.id} ready on {slot.debugger_address} '
+              f'(consent: {sorted(slot.consented_sites) or "none"})')
+
+    def _stop_process(self, slot):
+        process, slot.process = slot.process, None
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def _is_alive(self, slot):
+        if slot.process is None or slot.process.poll() is not None:
+            return False
+        try:
+            _cdp(slot.port, '/json/version')
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def _memory_mb(self, slot):
+        if psutil is None or slot.process is None:
+            return None
+        try:
+            process = psutil.Process(slot.process.pid)
+            return sum(p.memory_info().rss for p in [process] + process.children(recursive=True)) / 2 ** 20
+        except psutil.Error:
+            return None
+
+    def _reset_tabs(self, slot):
+        # a run may leave tabs behind, the next one expects a single window
+        pages = [target for target in _cdp(slot.port, '/json/list') if target.get('type') == 'page']
+        for target in pages[1:]:
+            _cdp(slot.port, f"/json/close/{target['id']}")
+
+    def lease(self, client=None):
+        with self.lock:
+            slot = next((slot for slot in self.slots if slot.state == 'idle'), None)
+            if slot is None:
+                return None
+            slot.state = 'leased'
+            slot.token = secrets.token_hex(8)
+            slot.client = client
+            slot.lease_expires = time.time() + self.lease_seconds
+            slot.n_leases += 1
+            return {'id': slot.id, 'token': slot.token, 'debugger_address': slot.debugger_address,
+                    'consented_sites': sorted(slot.consented_sites)}
+
+    def release(self, id, token, retire=False):
+        with self.lock:
+            slot = self.slots[id]
+            if slot.state != 'leased' or slot.token != token:
+                return False
+            slot.state = 'starting'
+            slot.token = slot.client = slot.lease_expires = None
+        self._recycle_or_return(slot, retire)
+        return True
+
+    def _recycle_or_return(self, slot, retire=False):
+        memory = self._memory_mb(slot)
+        if retire or not self._is_alive(slot) or (self.max_mb and memory and memory > self.max_mb):
+            slot.n_restarts += 1
+            threading.Thread(target=self._restart, args=(slot,), daemon=True).start()
+            return
+        try:
+            self._reset_tabs(slot)
+        except (OSError, ValueError):
+            pass
+        with self.lock:
+            slot.state = 'idle'
+
+    def check_health(self):
+        # restarts the dead Chromes and takes back the expired leases
+        now = time.time()
+        for slot in self.slots:
+            with self.lock:
+                expired = slot.state == 'leased' and slot.lease_expires < now
+                idle = slot.state == 'idle'
+                dead = slot.state == 'dead'
+                if expired:
+                    print(f'{time.ctime()} Lease of Chrome {slot.id} by {slot.client} expired')
+                    slot.state = 'starting'
+                    slot.token = slot.client = slot.lease_expires = None
+                elif idle and not self._is_alive(slot):
+                    print(f'{time.ctime()} Chrome {slot.id} is gone')
+                    slot.state = 'starting'
+                elif dead:
+                    slot.state = 'starting'
+            if expired:
+                # the run that held it may have left it in any state
+                self._recycle_or_return(slot, retire=True)
+            elif slot.state == 'starting' and (idle or dead):
+                slot.n_restarts += 1
+                threading.Thread(target=self._restart, args=(slot,), daemon=True).start()
+
+    def health_loop(self, every=30):
+        while not self.stopping.wait(every):
+            self.check_health()
+
+    def status(self):
+        with self.lock:
+            return [slot.to_dict() for slot in self.slots]
+
+    def serve(self, port=9400, health_every=30):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == '/status':
+                    self._reply(200, service.status())
+                else:
+                    self._reply(404, {'error': 'not found'})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._reply(400, {'error': 'invalid json'})
+                if self.path == '/lease':
+                    lease = service.lease(request.get('client'))
+                    self._reply(200, lease) if lease else self._reply(503, {'error': 'no free browser'})
+                elif self.path == '/release':
+                    released = service.release(int(request['id']), request.get('token'), bool(request.get('retire')))
+                    self._reply(200 if released else 409, {'released': released})
+                else:
+                    self._reply(404, {'error': 'not found'})
+
+            def log_message(self, format, *args):
+                pass  # one line per lease would drown the service output
+
+        threading.Thread(target=self.health_loop, args=(health_every,), daemon=True).start()
+        server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        print(f'{time.ctime()} Browser service on http://127.0.0.1:{port} with {len(self.slots)} Chromes')
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            self.shutdown()
+
+    def shutdown(self):
+        self.stopping.set()
+        for slot in self.slots:
+            self._stop_process(slot)
+
+
+def _post(service_url, path, body, timeout=5):
+    request = urllib.request.Request(service_url.rstrip('/') + path, data=json.dumps(body).encode(),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def lease_driver(service_url, client=None):
+    # A chromedriver session on a warm Chrome of the service, or None when the service is not
+    # running or all its Chromes are leased. The lease is kept on the driver for release_driver().
+    try:
+        lease = _post(service_url, '/lease', {'client': client})
+    except OSError as e:
+        print(f'No browser from the service at {service_url} ({e}), starting one')
+        return None
+    try:
+        driver = attach_driver(lease['debugger_address'])
+    except Exception as e:
+        print(f"Could not attach to {lease['debugger_address']} ({e}), starting a browser")
+        _release(service_url, lease, retire=True)
+        return None
+    driver.browser_lease = lease
+    driver.consented_sites = set(lease['consented_sites'])
+    # the warm Chrome has a single window, the crawl expects it to be the current one
+    driver.switch_to.window(driver.window_handles[0])
+    return driver
+
+
+def release_driver(service_url, driver, retire=False):
+    lease = getattr(driver, 'browser_lease', None)
+    if lease is None:
+        return False
+    detach_driver(driver)
+    _release(service_url, lease, retire)
+    return True
+
+
+def _release(service_url, lease, retire):
+    try:
+        _post(service_url, '/release', {'id': lease['id'], 'token': lease['token'], 'retire': retire})
+    except OSError as e:
+        print(f"Could not return Chrome {lease['id']} to the service: {e}")
+
+
+if __name__ == '__main__':
+    service = BrowserService(size=config.BROWSER_SERVICE_SIZE, first_port=config.BROWSER_SERVICE_FIRST_PORT,
+                             profiles_dir=config.BROWSER_SERVICE_PROFILES, chrome_binary=config.CHROME_BINARY or None,
+                             warm_urls=list(dict.fromkeys(site_for_url(url).home_url for url in config.SEARCH_URLS)),
+                             lease_seconds=config.BROWSER_SERVICE_LEASE, max_mb=config.BROWSER_MAX_MB)
+    service.start()
+    try:
+        service.serve(config.BROWSER_SERVICE_PORT, config.BROWSER_SERVICE_HEALTH_EVERY)
+    except KeyboardInterrupt:
+        print('Browser service stopped.')
@@ -0,0 +1,110 @@
+# Adaptive concurrency for the page loads (AIMD, like TCP congestion control).
+#
+# Every page load takes a slot from the controller and gives it back with its latency and
+# outcome. After every `window` page loads the controller looks at the p95 latency and the
+# error rate of that window: when both are under target it allows one more page load in
+# flight (additive increase), otherwise it cuts the limit in half (multiplicative decrease).
+# A blocked page cuts the limit right away. The current limit is exported as a metric.
+
+import contextlib
+import os
+import threading
+import time
+
+from fetch_outcome import OK, BLOCKED, DRIVER_CRASH, TRANSIENT, classify_exception
+
+ERROR_OUTCOMES = {BLOCKED, DRIVER_CRASH, TRANSIENT}
+
+
+class AIMDController:
+
+    def __init__(self, initial=2, min_limit=1, max_limit=8, target_p95=8.0, max_error_rate=0.05,
+                 window=20, increase=1, decrease=0.5, metrics_path=None):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_p95 = target_p95
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.increase = increase
+        self.decrease = decrease
+        self.metrics_path = metrics_path
+        self.in_flight = 0
+        self.latencies = []
+        self.errors = 0
+        self.last_p95 = None
+        self.last_error_rate = None
+        self.n_increases = 0
+        self.n_decreases = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, outcome):
+        with self.condition:
+            self.in_flight -= 1
+            self.latencies.append(latency)
+            self.errors += outcome in ERROR_OUTCOMES
+            if outcome == BLOCKED:
+                self._adjust(ok=False, reason='blocked')
+            elif len(self.latencies) >= self.window:
+                latencies = sorted(self.latencies)
+                self.last_p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+                self.last_error_rate = self.errors / len(latencies)
+                ok = self.last_p95 <= self.target_p95 and self.last_error_rate <= self.max_error_rate
+                self._adjust(ok, reason=f'p95 {self.last_p95:.1f} s, errors {self.last_error_rate:.0%}')
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self):
+        # with controller.slot(): driver.get(url) -- waits for a free slot, times the load
+        # and takes its outcome from the exception it raised, if any
+        self.acquire()
+        start = time.monotonic()
+        outcome = OK
+        try:
+            yield
+        except Exception as e:
+            outcome = classify_exception(e)
+            raise
+        finally:
+            self.release(time.monotonic() - start, outcome)
+
+    def _adjust(self, ok, reason):
+        old = self.limit
+        if ok:
+            self.limit = min(self.max_limit, self.limit + self.increase)
+            self.n_increases += old != self.limit
+        else:
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            self.n_decreases += 1
+        # a new window for the new limit
+        self.latencies = []
+        self.errors = 0
+        if int(old) != int(self.limit):
+            print(f'{time.ctime()} Concurrency {int(old)} -> {int(self.limit)} ({reason})')
+        self.export_metrics()
+
+    def metrics(self):
+        return {'scraper_concurrency_limit': int(self.limit),
+                'scraper_in_flight': self.in_flight,
+                'scraper_latency_p95_seconds': self.last_p95,
+                'scraper_error_rate': self.last_error_rate,
+                'scraper_concurrency_increases_total': self.n_increases,
+                'scraper_concurrency_decreases_total': self.n_decreases}
+
+    def export_metrics(self):
+        # Prometheus text format (node_exporter textfile collector), written atomically
+        if not self.metrics_path:
+            return
+        lines = [f'{name} {value}' for name, value in self.metrics().items() if value is not None]
+        with open(self.metrics_path + '.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        try:
+            os.replace(self.metrics_path + '.tmp', self.metrics_path)
+        except OSError as e:
+            print(f'Could not write the metrics: {e}')
@@ -0,0 +1,157 @@
+# Settings shared by web_scraper.py and the helper modules.
+#
+# Every value can be overridden with an environment variable of the same name, so
+# running more worker nodes (or pointing them at another queue/sink) is a config
+# change and not a code change, e.g.:
+#
+#   SCRAPER_MODE=coordinator python web_scraper.py
+#   SCRAPER_MODE=worker SCRAPER_WORKER_ID=node-2 python web_scraper.py
+
+import os
+import socket
+import time
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return cast(value)
+
+
+# 'single' keeps the original behaviour (one process walks every page and listing),
+# 'coordinator' only seeds the shared queue and reports progress,
+# 'worker' pulls result pages and listings from the shared queue,
+# 'watch' keeps polling the newest listings of the saved searches (WATCH_SEARCHES).
+SCRAPER_MODE = _env('SCRAPER_MODE', 'single')
+
+# Result list url(s) to crawl, comma separated. Every url is handled by the adapter of its site
+# (sites.py), so searches on several portals can run in the same crawl.
+SEARCH_URL = _env('SEARCH_URL', 'https://www.homegate.ch/rent/real-estate/city-zurich/matching-list')
+SEARCH_URLS = [url.strip() for url in SEARCH_URL.split(',') if url.strip()]
+
+# Shared work queue (SQLite file). With the default WAL journal all the workers must run on
+# the same host; set SCRAPER_JOURNAL_MODE=DELETE when the queue (and the SQLite sink) live on
+# a shared disk used by several hosts.
+QUEUE_PATH = _env('SCRAPER_QUEUE', 'flats_queue.sqlite')
+JOURNAL_MODE = _env('SCRAPER_JOURNAL_MODE', 'WAL')
+# Identifies one crawl in the queue, tasks are only deduplicated inside a crawl
+CRAWL_ID = _env('SCRAPER_CRAWL_ID', time.strftime('%Y-%m-%d'))
+WORKER_ID = _env('SCRAPER_WORKER_ID', f'{socket.gethostname()}-{os.getpid()}')
+LEASE_SECONDS = _env('SCRAPER_LEASE_SECONDS', 300, int)
+MAX_ATTEMPTS = _env('SCRAPER_MAX_ATTEMPTS', 3, int)
+
+# Where the listings end up: 'csv' (flats.csv, original behaviour), 'sqlite' (shared by all
+# workers) and/or 'parquet' (the partitioned archive, see archive.py), separated by commas.
+# Workers write to the shared sinks by default: several processes can't write one csv file, so
+# a worker that is asked for 'csv' gets a file of its own (flats-<worker id>.csv).
+SINK = _env('SCRAPER_SINK', 'sqlite,parquet' if SCRAPER_MODE == 'worker' else 'csv,parquet')
+CSV_PATH = _env('SCRAPER_CSV', 'flats.csv')
+if SCRAPER_MODE == 'worker':
+    CSV_PATH = f'{os.path.splitext(CSV_PATH)[0]}-{WORKER_ID}.csv'
+SQLITE_SINK_PATH = _env('SCRAPER_SQLITE_SINK', 'flats.sqlite')
+ARCHIVE_ROOT = _env('SCRAPER_ARCHIVE', 'archive')
+
+# Chrome remote debugging port, 0 disables it (needed when several workers share a machine)
+CHROME_DEBUGGING_PORT = _env('CHROME_DEBUGGING_PORT', 9222, int)
+
+# Retries of failed page loads (see fetch_outcome.RetryPolicy)
+RETRY_ATTEMPTS = _env('SCRAPER_RETRY_ATTEMPTS', 4, int)
+RETRY_BASE_DELAY = _env('SCRAPER_RETRY_BASE_DELAY', 2.0, float)
+RETRY_BUDGET = _env('SCRAPER_RETRY_BUDGET', 200, int)
+# seconds the whole crawl pauses when a captcha / rate limit page shows up
+BLOCK_PAUSE = _env('SCRAPER_BLOCK_PAUSE', 120, int)
+
+# Pipeline of the single mode: listings are loaded by SCRAPER_FETCHERS threads (one browser
+# each) and parsed by SCRAPER_PARSERS processes (0 = one per cpu).
+# SCRAPER_FETCHERS=0 runs the original sequential loop in a single browser.
+FETCHERS = _env('SCRAPER_FETCHERS', 2, int)
+PARSERS = _env('SCRAPER_PARSERS', 0, int)
+PIPELINE_QUEUE_SIZE = _env('SCRAPER_PIPELINE_QUEUE_SIZE', 16, int)
+
+# Change detection (fingerprints.py): on revisits only load listings whose card on the result
+# page changed, and only write listings whose details changed. SCRAPER_SKIP_UNCHANGED=0 turns it off.
+SKIP_UNCHANGED = _env('SCRAPER_SKIP_UNCHANGED', 1, int) == 1
+FINGERPRINT_DB = _env('SCRAPER_FINGERPRINT_DB', 'fingerprints.sqlite')
+
+# Result pages fetched at the same time once the first page told us how many there are
+PAGE_FETCHERS = _env('SCRAPER_PAGE_FETCHERS', 4, int)
+# Page loads per second over all the browsers of a process (0 = no limit), and burst size
+REQUESTS_PER_SECOND = _env('SCRAPER_REQUESTS_PER_SECOND', 2.0, float)
+REQUESTS_BURST = _env('SCRAPER_REQUESTS_BURST', 4, int)
+
+# Adaptive concurrency (concurrency.py): page loads in flight over all the browsers of a
+# process, raised by one while the p95 load time and the error rate of the last
+# CONCURRENCY_WINDOW loads stay under target, halved otherwise. It can't go above the number
+# of browsers (SCRAPER_FETCHERS + SCRAPER_PAGE_FETCHERS). The limit is written to
+# CONCURRENCY_METRICS in Prometheus text format ('' = don't write it).
+CONCURRENCY_INITIAL = _env('CONCURRENCY_INITIAL', 2, int)
+CONCURRENCY_MIN = _env('CONCURRENCY_MIN', 1, int)
+CONCURRENCY_MAX = _env('CONCURRENCY_MAX', 6, int)
+CONCURRENCY_TARGET_P95 = _env('CONCURRENCY_TARGET_P95', 8.0, float)
+CONCURRENCY_MAX_ERROR_RATE = _env('CONCURRENCY_MAX_ERROR_RATE', 0.05, float)
+CONCURRENCY_WINDOW = _env('CONCURRENCY_WINDOW', 20, int)
+CONCURRENCY_METRICS = _env('CONCURRENCY_METRICS', 'scraper_metrics.prom')
+
+# Browser lifecycle (browser.py): recycle a Chrome session after this many page loads or when
+# chromedriver + Chrome use more than this many MB (checked every few page loads)
+BROWSER_MAX_PAGES = _env('BROWSER_MAX_PAGES', 200, int)
+BROWSER_MAX_MB = _env('BROWSER_MAX_MB', 1500, int)
+BROWSER_MEMORY_CHECK_EVERY = _env('BROWSER_MEMORY_CHECK_EVERY', 10, int)
+
+# Warm browser service (browser_service.py): runs lease their Chromes from the service at
+# BROWSER_SERVICE (e.g. http://127.0.0.1:9400, '' = every run starts its own Chromes).
+# The service keeps BROWSER_SERVICE_SIZE Chromes on the debugging ports from
+# BROWSER_SERVICE_FIRST_PORT, takes back leases older than BROWSER_SERVICE_LEASE seconds and
+# checks the Chromes every BROWSER_SERVICE_HEALTH_EVERY seconds.
+BROWSER_SERVICE = _env('BROWSER_SERVICE', '')
+BROWSER_SERVICE_PORT = _env('BROWSER_SERVICE_PORT', 9400, int)
+BROWSER_SERVICE_SIZE = _env('BROWSER_SERVICE_SIZE', 4, int)
+BROWSER_SERVICE_FIRST_PORT = _env('BROWSER_SERVICE_FIRST_PORT', 9300, int)
+BROWSER_SERVICE_PROFILES = _env('BROWSER_SERVICE_PROFILES', 'browser_profiles')
+BROWSER_SERVICE_LEASE = _env('BROWSER_SERVICE_LEASE', 7200, int)
+BROWSER_SERVICE_HEALTH_EVERY = _env('BROWSER_SERVICE_HEALTH_EVERY', 30, int)
+CHROME_BINARY = _env('CHROME_BINARY', '')
+
+# Failure artifacts (diagnostics.py): page source, screenshot and traceback of the pages that
+# failed, written in the background to FAILURES_DIR. The first FAILURES_KEEP_FIRST failures of
+# every error class are kept, then one in FAILURES_SAMPLE_EVERY; the oldest are deleted above
+# FAILURES_QUOTA_MB. SCRAPER_FAILURES=0 turns it off.
+FAILURES = _env('SCRAPER_FAILURES', 1, int) == 1
+FAILURES_DIR = _env('FAILURES_DIR', 'failures')
+FAILURES_KEEP_FIRST = _env('FAILURES_KEEP_FIRST', 20, int)
+FAILURES_SAMPLE_EVERY = _env('FAILURES_SAMPLE_EVERY', 50, int)
+FAILURES_QUOTA_MB = _env('FAILURES_QUOTA_MB', 200, int)
+
+# Near-duplicate detection (dedup.py): listings of the same flat get the same cluster_id.
+# The index is kept between runs in DEDUP_INDEX.
+DEDUP = _env('SCRAPER_DEDUP', 1, int) == 1
+DEDUP_INDEX = _env('SCRAPER_DEDUP_INDEX', 'dedup_index.pkl')
+DEDUP_THRESHOLD = _env('SCRAPER_DEDUP_THRESHOLD', 0.7, float)
+
+# Keyword analytics (text_analytics.py): index of the tokenized listing texts kept between
+# runs, the keywords scored for every listing (comma separated) and where the scores go
+TEXT_INDEX = _env('TEXT_INDEX', 'text_index.pkl')
+KEYWORDS = [keyword.strip() for keyword in _env('KEYWORDS', 'bright,view,attika,balcony,quiet,lake,hell,aussicht').split(',')
+            if keyword.strip()]
+KEYWORD_SCORES = _env('KEYWORD_SCORES', 'keyword_scores.csv')
+TOP_TERMS = _env('TOP_TERMS', 10, int)
+
+# PDF report (report.py): partition summaries and rendered sections are cached in REPORT_CACHE
+# and only recomputed when their part of the archive changed; REPORT_WORKERS=0 = one per cpu
+REPORT_PATH = _env('REPORT_PATH', 'report.pdf')
+REPORT_CACHE = _env('REPORT_CACHE', 'report_cache')
+REPORT_WORKERS = _env('REPORT_WORKERS', 0, int)
+
+# Watch mode: saved searches (comma separated, sorted by newest; by default the SEARCH_URLS
+# sorted by newest by their site adapter), how many of their first pages to poll, and the
+# bounds of the adaptive polling interval in seconds
+WATCH_SEARCHES = [url.strip() for url in _env('WATCH_SEARCHES', '').split(',') if url.strip()]
+WATCH_PAGES = _env('WATCH_PAGES', 1, int)
+WATCH_MIN_INTERVAL = _env('WATCH_MIN_INTERVAL', 60, float)
+WATCH_MAX_INTERVAL = _env('WATCH_MAX_INTERVAL', 600, float)
+# new listings go to the notifiers (see notify.py) and to the sink
+WATCH_NOTIFY = _env('WATCH_NOTIFY', 'stdout,file:new_listings.jsonl')
+WATCH_SINK = _env('WATCH_SINK', 'parquet')
+HTTP_USER_AGENT = _env('HTTP_USER_AGENT', 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+                                          '(KHTML, like Gecko) Chrome/141.0 Safari/537.36')
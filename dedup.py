@@ -0,0 +1,201 @@
+# Near-duplicate listings (the same flat posted again under a new listing_ID, or by several
+# agencies at once) with MinHash signatures and an LSH index.
+#
+# Every listing becomes a set of tokens (address words, postcode, surface, rooms, floor,
+# features) and a MinHash signature of that set. The signature is cut in bands; listings
+# sharing one band are candidates, and candidates whose estimated Jaccard similarity is above
+# the threshold go to the same cluster. A lookup only touches the listings in the same
+# buckets, not the whole archive, so listings can be clustered one at a time as they arrive.
+#
+# Two flats in the same building share most of their tokens, so the floor and the house
+# number have to match as well (when both listings have them). Listings with fewer than
+# MIN_TOKENS tokens say too little about the flat to be compared and are not clustered.
+
+import hashlib
+import os
+import pickle
+import re
+
+import numpy as np
+
+from fingerprints import listing_key
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+MIN_TOKENS = 3
+
+
+def _number(value):
+    match = re.search(r'\d+(?:[.,]\d+)?', value or '')
+    return float(match.group().replace(',', '.')) if match else None
+
+
+def house_number(address):
+    # 'Seestrasse 12a, 8002 Zürich' -> '12a': the number right after the street name, not
+    # the postcode
+    match = re.search(r'[^\W\d_]\.?\s+(\d+\s?[a-z]?)\b', address or '', re.IGNORECASE)
+    return match.group(1).replace(' ', '').lower() if match else None
+
+
+def required_match(listing):
+    # (floor, house number): the parts that must be the same for two listings to be one flat
+    floor = (listing.floor or '').strip().lower() or None
+    return floor, house_number(listing.address)
+
+
+def _compatible(required, other):
+    return all(a is None or b is None or a == b for a, b in zip(required, other))
+
+
+def listing_tokens(listing):
+    # The set the similarity is computed on. The surface goes in two 5 m2 bins so that
+    # 79 m2 and 81 m2 still share a token.
+    tokens = set()
+    address = (listing.address or '').lower()
+    tokens.update(f'addr:{word}' for word in re.findall(r'\w+', address))
+    if listing.postcode:
+        tokens.add(f'pc:{listing.postcode}')
+    surface = _number(listing.surface_living)
+    if surface is not None:
+        tokens.add(f'surf:{int(surface // 5)}')
+        tokens.add(f'surf:{int((surface + 2.5) // 5)}b')
+    rooms = _number(listing.n_of_rooms)
+    if rooms is not None:
+        tokens.add(f'rooms:{rooms:g}')
+    if listing.floor:
+        tokens.add(f'floor:{listing.floor.strip().lower()}')
+    tokens.update(f'feat:{feature}' for feature in listing.features or ())
+    return tokens
+
+
+class MinHasher:
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, tokens):
+        if not tokens:
+            raise ValueError('MinHash of an empty set')
+        hashes = np.array([int.from_bytes(hashlib.blake2b(token.encode(), digest_size=4).digest(), 'little')
+                           for token in tokens], dtype=np.uint64)
+        # (a * h + b) mod p for all the tokens x permutations at once
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0)
+
+
+class NearDuplicateIndex:
+
+    def __init__(self, threshold=0.7, num_perm=128, bands=16):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+        # union-find over the listing keys, the root is the cluster id
+        self.parent = {}
+        # insertion order of the keys, the oldest listing of a cluster is its id
+        self.order = {}
+        # key -> required_match() of the listing
+        self.required = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _find(self, key):
+        root = key
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[key] != root:  # path compression
+            self.parent[key], key = root, self.parent[key]
+        return root
+
+    def _union(self, key, other):
+        root, other_root = self._find(key), self._find(other)
+        if root != other_root:
+            # the oldest listing stays the cluster id
+            root, other_root = sorted((root, other_root), key=lambda k: self.order[k])
+            self.parent[other_root] = root
+        return root
+
+    def similarity(self, key, other):
+        return float(np.mean(self.signatures[key] == self.signatures[other]))
+
+    def candidates(self, signature):
+        found = set()
+        for band, band_key in self._band_keys(signature):
+            found.update(self.buckets[band].get(band_key, ()))
+        return found
+
+    def add(self, listing):
+        # Indexes the listing and returns its cluster id (the key of the first listing seen
+        # of this flat). A listing that is already indexed keeps its cluster, one with too few
+        # tokens is not indexed and gets None.
+        key = listing_key(listing.link) or listing.listing_ID
+        if key in self.signatures:
+            return self._find(key)
+        tokens = listing_tokens(listing)
+        if len(tokens) < MIN_TOKENS:
+            return None
+        signature = self.hasher.signature(tokens)
+        required = required_match(listing)
+        matches = [other for other in self.candidates(signature)
+                   if np.mean(self.signatures[other] == signature) >= self.threshold
+                   and _compatible(required, self.required[other])]
+        self.signatures[key] = signature
+        self.required[key] = required
+        self.parent[key] = key
+        self.order[key] = len(self.order)
+        for band, band_key in self._band_keys(signature):
+            self.buckets[band].setdefault(band_key, []).append(key)
+        cluster = key
+        for other in matches:
+            cluster = self._union(key, other)
+        return cluster
+
+    def cluster_of(self, listing_or_key):
+        key = listing_or_key if isinstance(listing_or_key, str) else listing_key(listing_or_key.link)
+        return self._find(key) if key in self.parent else None
+
+    def clusters(self):
+        # cluster id -> keys, only the clusters with more than one listing
+        groups = {}
+        for key in self.parent:
+            groups.setdefault(self._find(key), []).append(key)
+        return {cluster: keys for cluster, keys in groups.items() if len(keys) > 1}
+
+    def save(self, path):
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        # kwargs as for a new index. A saved index takes the threshold for the listings added
+        # from now on; its signatures can't be turned into another num_perm or bands.
+        if not os.path.exists(path):
+            return cls(**kwargs)
+        with open(path, 'rb') as f:
+            index = pickle.load(f)
+        index.threshold = kwargs.get('threshold', index.threshold)
+        layout = (kwargs.get('num_perm', index.hasher.num_perm), kwargs.get('bands', index.bands))
+        if layout != (index.hasher.num_perm, index.bands):
+            raise ValueError(f'{path} has num_perm={index.hasher.num_perm}, bands={index.bands}, '
+                             f'delete it to build an index with num_perm={layout[0]}, bands={layout[1]}')
+        return index
+
+
+def cluster_listings(listings, index):
+    # Pipeline stage: sets the cluster_id of the listings as they stream through
+    for listing in listings:
+        listing.cluster_id = index.add(listing)
+        yield listing
@@ -0,0 +1,175 @@
+# Evidence of the pages that failed: page source, screenshot, url and traceback.
+#
+# capture_failure() is called where a page fails (cookie banner, listing, result page). It
+# decides first whether to keep this failure at all: the first `keep_first` failures of every
+# error class (stage + outcome/exception) are kept, after that one in `sample_every`. Only
+# then the page source and the screenshot are taken from the driver, and the writing (gzip,
+# png, index line) is left to a background thread, so the crawl doesn't wait on the disk.
+# When the artifacts grow above the quota the oldest ones are deleted.
+#
+#   failures/index.jsonl                      one line per artifact (and per eviction)
+#   failures/20261019-120501-3f9a1c-0007.html.gz     page source
+#   failures/20261019-120501-3f9a1c-0007.png         screenshot
+#
+# The middle part of the id is random per FailureCapture: the workers of a crawl share the
+# folder and fail in the same second.
+#
+# Without configure() (e.g. in the helper scripts) failures are only printed.
+
+import collections
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+from fetch_outcome import classify_exception
+from fingerprints import listing_key
+
+
+class FailureCapture:
+
+    def __init__(self, root='failures', keep_first=20, sample_every=50, quota_mb=200, queue_size=64):
+        self.root = root
+        self.keep_first = keep_first
+        self.sample_every = sample_every
+        self.quota = quota_mb * 2 ** 20
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self.seen = collections.Counter()  # error class -> failures
+        self.n_captured = 0
+        self.n_dropped = 0
+        self.sequence = 0
+        self.run_id = uuid.uuid4().hex[:6]
+        self.lock = threading.Lock()
+        # (id, [paths], bytes) of the artifacts on disk, oldest first
+        self.artifacts = collections.deque(self._load_artifacts())
+        self.bytes = sum(size for _, _, size in self.artifacts)
+        self.queue = queue.Queue(queue_size)
+        self.writer = threading.Thread(target=self._write_loop, name='failure-writer', daemon=True)
+        self.writer.start()
+
+    def _load_artifacts(self):
+        entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get('evicted'):
+                        entries.pop(entry['id'], None)
+                    else:
+                        entries[entry['id']] = (entry['id'], entry['files'], entry['bytes'])
+        return entries.values()
+
+    def should_capture(self, error_class):
+        with self.lock:
+            self.seen[error_class] += 1
+            n = self.seen[error_class]
+        return n <= self.keep_first or (self.sample_every and n % self.sample_every == 0)
+
+    def capture(self, driver, url, stage, exc):
+        error_class = f'{stage}:{classify_exception(exc)}:{type(exc).__name__}'
+        if not self.should_capture(error_class):
+            return None
+        with self.lock:
+            self.sequence += 1
+            artifact_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.run_id}-{self.sequence:04d}"
+        entry = {'id': artifact_id, 'time': time.time(), 'url': url, 'key': listing_key(url), 'stage': stage,
+                 'error_class': error_class, 'message': str(exc)[:2000],
+                 'traceback': ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__)),
+                 'occurrence': self.seen[error_class], 'thread': threading.current_thread().name}
+        # the only part that runs on the crawling thread: asking the driver for the page
+        page_source = screenshot = None
+        if driver is not None:
+            try:
+                entry['current_url'] = driver.current_url
+                page_source = driver.page_source
+                screenshot = driver.get_screenshot_as_png()
+            except Exception as e:  # the session may be the thing that failed
+                entry['capture_error'] = str(e)[:500]
+        try:
+            self.queue.put_nowait((entry, page_source, screenshot))
+        except queue.Full:
+            self.n_dropped += 1  # the disk can't keep up, don't slow the crawl down for it
+            return None
+        return artifact_id
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                print(f'Could not write the failure artifact: {e}')
+            finally:
+                self.queue.task_done()
+
+    def _write(self, entry, page_source, screenshot):
+        files = []
+        base = os.path.join(self.root, entry['id'])
+        if page_source is not None:
+            with gzip.open(base + '.html.gz', 'wt', encoding='utf-8', compresslevel=6) as f:
+                f.write(page_source)
+            files.append(base + '.html.gz')
+        if screenshot is not None:
+            with open(base + '.png', 'wb') as f:
+                f.write(screenshot)
+            files.append(base + '.png')
+        entry['files'] = files
+        entry['bytes'] = sum(os.path.getsize(path) for path in files)
+        with open(self.index_path, 'a') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.artifacts.append((entry['id'], files, entry['bytes']))
+        self.bytes += entry['bytes']
+        self.n_captured += 1
+        self._enforce_quota()
+
+    def _enforce_quota(self):
+        evicted = []
+        while self.bytes > self.quota and len(self.artifacts) > 1:
+            artifact_id, files, size = self.artifacts.popleft()
+            for path in files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.bytes -= size
+            evicted.append(artifact_id)
+        if evicted:
+            with open(self.index_path, 'a') as f:
+                for artifact_id in evicted:
+                    f.write(json.dumps({'id': artifact_id, 'evicted': True, 'time': time.time()}) + '\n')
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+        print(f'{self.n_captured} failure artifacts written to {self.root} '
+              f'({self.bytes / 2 ** 20:.1f} MB on disk, {self.n_dropped} dropped), '
+              f'failures per class: {dict(self.seen)}')
+
+
+_capture = None
+
+
+def configure(root='failures', keep_first=20, sample_every=50, quota_mb=200):
+    global _capture
+    _capture = FailureCapture(root, keep_first, sample_every, quota_mb)
+    return _capture
+
+
+def capture_failure(driver, url, stage, exc):
+    if _capture is None:
+        return None
+    return _capture.capture(driver, url, stage, exc)
+
+
+def close():
+    global _capture
+    if _capture is not None:
+        _capture.close()
+        _capture = None
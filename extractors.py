@@ -0,0 +1,239 @@
+# ## Functions to get the elements from the website
+#
+# These are the homegate.ch extractors, used by the Homegate adapter in sites.py.
+#
+# The extractors work on a snapshot of the page (the html parsed with BeautifulSoup, like in
+# the Webscrapping_Homegate notebook) instead of the live driver, so they don't depend on
+# module globals, don't wait for elements that are not there, and can run anywhere the html
+# can be sent to.
+
+import re
+from dataclasses import dataclass, field
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, FeatureNotFound
+
+from records import Listing, SearchSummary
+from fingerprints import fingerprint
+
+CORE_ATTRIBUTES = "div.CoreAttributes_coreAttributes_e2NAm"
+TECH_REFERENCES = "dl.ListingTechReferences_techReferencesList_jlZwL"
+ADDRESS = "address.AddressDetails_address_i3koO"
+FEATURES = "ul.FeaturesFurnishings_list_S54KV"
+COSTS = 'div[data-test="costs"] dl'
+DESCRIPTION = '[class*="Description_descriptionBody"], [data-test="description"]'
+RESULT_LIST_ITEM = '[data-test="result-list-item"]'
+RESULTS_NUMBER = '[class*="ResultsNumber_results"], [class*="ResultListHeader_locations"]'
+PAGINATION = '[class*="ResultListPage_paginationHolder"], nav[aria-label*="agination"]'
+
+
+@dataclass
+class ListingPage:
+    url: str
+    soup: BeautifulSoup
+    main_info: dict = field(default_factory=dict)
+
+
+def make_soup(html):
+    try:
+        return BeautifulSoup(html, "lxml")
+    except FeatureNotFound:  # lxml not installed
+        return BeautifulSoup(html, "html.parser")
+
+
+def _text(element):
+    return re.sub(r'\s+', ' ', element.get_text(' ', strip=True))
+
+
+def main_info(soup):
+    # Creating a dictionary with the 'Main Information'
+    key_type = [_text(dt) for dt in soup.select(f'{CORE_ATTRIBUTES} > dl > dt')]
+    value_type = [_text(dd) for dd in soup.select(f'{CORE_ATTRIBUTES} > dl > dd')]
+    return dict(zip(key_type, value_type))
+
+
+def snapshot(html, url):
+    soup = make_soup(html)
+    return ListingPage(url, soup, main_info(soup))
+
+
+def listing_ID(page):
+    try:
+        id_raw = list(page.soup.select_one(TECH_REFERENCES).stripped_strings)
+        id_flat = id_raw[1]
+        return id_flat
+    except:
+        print(f'No id_flat value for {page.url}')
+        return None
+
+def object_ref(page):
+    try:
+        ref_raw = list(page.soup.select_one(TECH_REFERENCES).stripped_strings)
+        ref_flat = ref_raw[3]
+        return ref_flat
+    except:
+        print(f'No object_ref value for {page.url}')
+        return None
+
+def flat_address(page):
+    try:
+        address = _text(page.soup.select_one(ADDRESS))
+        return address
+    except:
+        print(f'None address value for {page.url}')
+        return None
+
+def postcode(page):
+    try:
+        postcode_find = page.soup.select_one('address[class*="AddressDetails_address"] span:nth-of-type(2)')
+        postcode_text = _text(postcode_find).split()[0]
+        return postcode_text
+    except:
+        print(f'No postcode value for {page.url}')
+        return None
+
+def _cost_prices(page):
+    # all the CHF amounts in the costs list: net rent, expenses, ...
+    spans = page.soup.select(f'{COSTS} dt ~ dd > span')
+    return [_text(span) for span in spans if 'CHF' in span.get_text()]
+
+def net_rent_price(page):
+    net_rent_elements = _cost_prices(page)
+    if len(net_rent_elements) > 1:
+        return net_rent_elements[0]
+    print(f'No net price value for {page.url}')
+    return None  # Handle cases where there is only one element
+
+def expenses_price(page):
+    expenses_elements = _cost_prices(page)
+    if len(expenses_elements) > 1:
+        return expenses_elements[1]
+    print(f'No expenses value for {page.url}')
+    return None
+
+def rent_price(page):
+    spans = page.soup.select(f'{COSTS} dd:has(> strong) span')
+    for span in spans:
+        if 'CHF' in span.get_text():
+            return _text(span)
+    print(f'No rent price value for {page.url}')
+    return None
+
+def flat_availability(page):
+    return page.main_info.get('Available from:')
+
+def flat_type(page):
+    return page.main_info.get('Type:')
+
+def flat_n_rooms(page):
+    return page.main_info.get('No. of rooms:')
+
+def flat_floor(page):
+    return page.main_info.get('Floor:')
+
+def flat_n_floors(page):
+    return page.main_info.get('Number of floors:')
+
+def flat_surface(page):
+    return page.main_info.get('Surface living:')
+
+def flat_floor_space(page):
+    return page.main_info.get('Floor space:')
+
+def flat_Room_height(page):
+    return page.main_info.get('Room height:')
+
+def flat_last_refurbishment(page):
+    return page.main_info.get('Last refurbishment:')
+
+def flat_year(page):
+    return page.main_info.get('Year built:')
+
+def flat_features(page):
+    features_find = page.soup.select_one(FEATURES)
+    if features_find is None:
+        return None
+    features = [_text(li) for li in features_find.find_all('li')] or list(features_find.stripped_strings)
+    features = [element.lower() for element in features]
+    return features
+
+
+def flat_description(page):
+    # free text of the listing, German or English (for the keyword analytics, text_analytics.py)
+    description = page.soup.select_one(DESCRIPTION)
+    if description is None:
+        return None
+    return _text(description) or None
+
+
+def sections_text(page):
+    # normalized text of the sections that matter for change detection
+    return [[_text(element) for element in page.soup.select(selector)]
+            for selector in (COSTS, CORE_ATTRIBUTES, FEATURES)]
+
+
+def extract_listing(html, url, card_hash=None):
+    # Builds the Listing record of a detail page from its html
+    page = snapshot(html, url)
+    listing = Listing(listing_ID=listing_ID(page),
+                   object_ref=object_ref(page),
+                   address=flat_address(page),
+                   postcode=postcode(page),
+                   net_rent=net_rent_price(page),
+                   expenses=expenses_price(page),
+                   rent=rent_price(page),
+                   availability=flat_availability(page),
+                   type=flat_type(page),
+                   n_of_rooms=flat_n_rooms(page),
+                   floor=flat_floor(page),
+                   n_of_floors=flat_n_floors(page),
+                   surface_living=flat_surface(page),
+                   floor_space=flat_floor_space(page),
+                   room_height=flat_Room_height(page),
+                   last_refurbishment=flat_last_refurbishment(page),
+                   year_built=flat_year(page),
+                   link=url,
+                   features=flat_features(page),
+                   description=flat_description(page),
+                   card_hash=card_hash,
+                   )
+    payload = {name: value for name, value in listing.to_dict().items()
+               if name not in ('link', 'card_hash', 'detail_hash', 'site')}
+    listing.detail_hash = fingerprint(payload, sections_text(page))
+    return listing
+
+
+def extract_result_cards(html, page_url):
+    # get the url and the fingerprint of the card of all the flats on a result page
+    soup = make_soup(html)
+    cards = []
+    for item in soup.select(RESULT_LIST_ITEM):
+        link = item if item.name == 'a' and item.get('href') else item.select_one('a[href]')
+        if link is not None:
+            cards.append((urljoin(page_url, link['href']), fingerprint(_text(item))))
+    return cards
+
+
+def _number(text):
+    # "1'234 results", "1,234", "1 234" -> 1234
+    match = re.search(r"\d[\d',’ ]*", text or '')
+    if match is None:
+        return None
+    return int(re.sub(r"\D", '', match.group()))
+
+
+def extract_search_summary(html, listings_per_page=None):
+    # Total number of listings (the header of the result list) and number of pages (the
+    # pagination holder), as read by the notebooks
+    soup = make_soup(html)
+    total = None
+    for element in soup.select(RESULTS_NUMBER):
+        total = _number(_text(element))
+        if total is not None:
+            break
+    max_pages = None
+    holder = soup.select_one(PAGINATION)
+    if holder is not None:
+        pages = [int(n) for n in re.findall(r'\d+', _text(holder))]
+        max_pages = max(pages) if pages else None
+    return SearchSummary(total, max_pages, listings_per_page)
@@ -0,0 +1,162 @@
+# Classifies what we got back after navigating to a page, and decides whether/when to retry.
+#
+# The crawl used to find out that a page was dead only after every extractor had waited for
+# its full timeout. Now the page is classified right after driver.get():
+#   ok            -> extract the data
+#   not_found     -> listing was removed, skip it (no retry)
+#   error_page    -> homegate's "An error has occurred" page (also how the last result page ends)
+#   blocked       -> rate limited / captcha, pause the whole crawl for a while and retry
+#   driver_crash  -> the browser session is gone, restart the driver and retry
+#   transient     -> timeouts and anything else we don't recognise, retry with backoff
+
+import random
+import re
+import time
+
+from selenium.common.exceptions import (InvalidSessionIdException, NoSuchWindowException,
+                                        TimeoutException, WebDriverException)
+
+OK = 'ok'
+NOT_FOUND = 'not_found'
+ERROR_PAGE = 'error_page'
+BLOCKED = 'blocked'
+DRIVER_CRASH = 'driver_crash'
+TRANSIENT = 'transient'
+
+RETRYABLE = {BLOCKED, DRIVER_CRASH, TRANSIENT}
+
+ERROR_PAGE_TITLES = ['An error has occurred', 'Ein Fehler ist aufgetreten']
+NOT_FOUND_TITLES = ['Page not found', 'Seite nicht gefunden']
+# '404 - ...' titles, but not a listing title that happens to contain 404 (e.g. a price)
+NOT_FOUND_TITLE = re.compile(r'^\s*404\b')
+# what the http status says when we have one (plain requests, not the browser)
+STATUS_OUTCOMES = {404: NOT_FOUND, 410: NOT_FOUND, 403: BLOCKED, 429: BLOCKED}
+BLOCKED_TITLES = ['Access denied', 'Zugriff verweigert', 'Too Many Requests', 'Just a moment',
+                  'Attention Required', 'Pardon Our Interruption', 'captcha']
+# only markers of blocking pages, homegate itself loads recaptcha for the contact form
+BLOCKED_SOURCE_MARKERS = ['geo.captcha-delivery.com', 'px-captcha', 'cf-challenge', 'challenge-platform']
+CRASH_MESSAGES = ['chrome not reachable', 'disconnected', 'session deleted', 'invalid session id',
+                  'tab crashed', 'target window already closed', 'no such window', 'connection refused']
+
+
+class FetchError(Exception):
+
+    def __init__(self, outcome, url, message=''):
+        super().__init__(f'{outcome} on {url}' + (f': {message}' if message else ''))
+        self.outcome = outcome
+        self.url = url
+
+
+def classify_status(status):
+    # None when the status alone doesn't tell (2xx, other errors): look at the page then
+    return STATUS_OUTCOMES.get(status)
+
+
+def classify_page(title, page_source='', status=None):
+    outcome = classify_status(status)
+    if outcome is not None:
+        return outcome
+    title_lower = (title or '').lower()
+    if any(marker.lower() in title_lower for marker in ERROR_PAGE_TITLES):
+        return ERROR_PAGE
+    if any(marker.lower() in title_lower for marker in BLOCKED_TITLES):
+        return BLOCKED
+    if any(marker in (page_source or '') for marker in BLOCKED_SOURCE_MARKERS):
+        return BLOCKED
+    if any(marker.lower() in title_lower for marker in NOT_FOUND_TITLES) or NOT_FOUND_TITLE.match(title or ''):
+        return NOT_FOUND
+    return OK
+
+
+def classify_exception(exc):
+    if isinstance(exc, FetchError):
+        return exc.outcome
+    if isinstance(exc, (InvalidSessionIdException, NoSuchWindowException)):
+        return DRIVER_CRASH
+    if isinstance(exc, TimeoutException):
+        return TRANSIENT
+    if isinstance(exc, WebDriverException):
+        message = str(exc).lower()
+        if any(marker in message for marker in CRASH_MESSAGES):
+            return DRIVER_CRASH
+    if isinstance(exc, (ConnectionError, OSError)):
+        return DRIVER_CRASH
+    return TRANSIENT
+
+
+def check_page(driver, url):
+    # Call right after navigating: raises FetchError unless the page is worth extracting
+    outcome = classify_page(driver.title, driver.page_source)
+    if outcome != OK:
+        raise FetchError(outcome, url, driver.title)
+    return outcome
+
+
+class RetryPolicy:
+    # Exponential backoff with full jitter, a retry budget shared by the whole crawl and a
+    # global pause whenever we get blocked (doubling while the blocks keep coming).
+
+    def __init__(self, max_attempts=4, base_delay=2, max_delay=60, retry_budget=200,
+                 block_pause=120, max_block_pause=1800, sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+        self.block_pause = block_pause
+        self.max_block_pause = max_block_pause
+        self.sleep = sleep
+        self.current_block_pause = block_pause
+        self.paused_until = 0
+        self.counts = {}
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def should_retry(self, outcome, attempt):
+        return outcome in RETRYABLE and attempt < self.max_attempts and self.retry_budget > 0
+
+    def record(self, outcome):
+        self.counts[outcome] = self.counts.get(outcome, 0) + 1
+        if outcome == BLOCKED:
+            self.paused_until = max(self.paused_until, time.time() + self.current_block_pause)
+            print(f'Blocked, pausing the crawl for {self.current_block_pause} s')
+            self.current_block_pause = min(self.current_block_pause * 2, self.max_block_pause)
+        elif outcome == OK:
+            self.current_block_pause = self.block_pause
+
+    def wait_if_paused(self):
+        remaining = self.paused_until - time.time()
+        if remaining > 0:
+            self.sleep(remaining)
+
+    def wait_before_retry(self, outcome, attempt):
+        # Spend one retry from the budget and sleep before the next attempt
+        self.retry_budget -= 1
+        if outcome == BLOCKED:
+            self.wait_if_paused()
+        else:
+            self.sleep(self.backoff(attempt))
+
+    def call(self, fetch, url, on_crash=None):
+        # Runs fetch() until it succeeds, the error is not retryable or we run out of attempts.
+        # on_crash is called before retrying after a driver crash (e.g. to restart the driver).
+        attempt = 0
+        while True:
+            attempt += 1
+            self.wait_if_paused()
+            try:
+                result = fetch()
+            except Exception as e:
+                outcome = classify_exception(e)
+                self.record(outcome)
+                if not self.should_retry(outcome, attempt):
+                    if isinstance(e, FetchError):
+                        raise
+                    raise FetchError(outcome, url, str(e).splitlines()[0] if str(e) else type(e).__name__) from e
+                print(f'{outcome} on {url} (attempt {attempt}), retrying')
+                if outcome == DRIVER_CRASH and on_crash is not None:
+                    on_crash()
+                self.wait_before_retry(outcome, attempt)
+                continue
+            self.record(OK)
+            return result
@@ -0,0 +1,109 @@
+# Change detection for listings we have already seen.
+#
+# Two fingerprints per listing:
+#   card_hash   - the listing's card on the result page (price, rooms, surface, address...)
+#   detail_hash - the extracted payload plus the normalized text of the costs, 'Main
+#                 Information' and features sections of the detail page
+# On a revisit the detail page is only loaded when the card changed, and the listing is only
+# written again when the detail hash changed. The fingerprints of a listing are only stored
+# (mark_written) once the sink has taken it.
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+
+def fingerprint(*parts):
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False, default=list).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def listing_key(url):
+    # The listing number in the url (/rent/4001662556, /mieten/4001662556, /en/rent/...), the
+    # link of a listing changes with the language but the number stays the same
+    match = re.search(r'/(\d{5,})(?:[/?#]|$)', url or '')
+    return match.group(1) if match else url
+
+
+class FingerprintIndex:
+
+    def __init__(self, path='fingerprints.sqlite'):
+        self.path = path
+        # used from the pipeline's producer thread and from the consumer
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA busy_timeout=30000')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                key TEXT PRIMARY KEY,
+                link TEXT,
+                listing_ID TEXT,
+                card_hash TEXT,
+                detail_hash TEXT,
+                first_seen REAL,
+                last_seen REAL,
+                last_changed REAL
+            )''')
+        self.n_unchanged_cards = 0
+        self.n_unchanged_details = 0
+
+    def card_changed(self, link, card_hash):
+        # True when the listing is new or its card on the result page changed, i.e. when the
+        # detail page has to be loaded. Unchanged listings are just marked as seen.
+        now = time.time()
+        key = listing_key(link)
+        with self.lock:
+            row = self.conn.execute('SELECT card_hash FROM fingerprints WHERE key = ?', (key,)).fetchone()
+            if row is not None and card_hash is not None and row[0] == card_hash:
+                self.conn.execute('UPDATE fingerprints SET last_seen = ? WHERE key = ?', (now, key))
+                self.n_unchanged_cards += 1
+                return False
+        return True
+
+    def detail_changed(self, listing):
+        # True when the detail hash is new or changed, i.e. when the listing has to be written
+        # to the sink. Nothing is stored for it until mark_written(): a listing that never makes
+        # it to the sink is loaded again on the next crawl. Unchanged listings are marked as seen.
+        now = time.time()
+        key = listing_key(listing.link)
+        with self.lock:
+            row = self.conn.execute('SELECT detail_hash FROM fingerprints WHERE key = ?', (key,)).fetchone()
+            if row is None or row[0] != listing.detail_hash:
+                return True
+            self.conn.execute('UPDATE fingerprints SET link = ?, listing_ID = ?, card_hash = ?, last_seen = ? WHERE key = ?',
+                              (listing.link, listing.listing_ID, listing.card_hash, now, key))
+            self.n_unchanged_details += 1
+            return False
+
+    def mark_written(self, listing):
+        # Stores the fingerprints of a listing once the sink has taken it
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                '''INSERT INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET link = excluded.link, listing_ID = excluded.listing_ID,
+                   card_hash = excluded.card_hash, detail_hash = excluded.detail_hash,
+                   last_seen = excluded.last_seen, last_changed = excluded.last_changed''',
+                (listing_key(listing.link), listing.link, listing.listing_ID, listing.card_hash, listing.detail_hash,
+                 now, now, now))
+
+    def is_known(self, link):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM fingerprints WHERE key = ?',
+                                     (listing_key(link),)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+
+    def close(self):
+        print(f'{self.n_unchanged_cards} listings skipped (same card), '
+              f'{self.n_unchanged_details} not written again (same details)')
+        self.conn.close()
@@ -0,0 +1,189 @@
+# Bulk import of old flats.csv files into the Parquet archive (archive.py).
+#
+# The csv files were written by different versions of the code:
+#   results  - Webscrapping_Homegate notebook: Address, Price, Space, Rooms, flat_link
+#   notebook - Webscrapping_Homegate-Selenium notebook: flat_ID, address, price, ..., features
+#   scraper  - web_scraper.py: listing_ID, object_ref, ..., net_rent, expenses, rent, ...
+# and the ones saved with df.to_csv('flats.csv') have the dataframe index as first column.
+# Every file is recognized by its header and mapped to the current columns; the listing_ID
+# and postcode are taken from the link and the address when the file doesn't have them, and
+# the stringified features lists are turned back into lists.
+#
+# The files are parsed in a pool of processes (in chunks, with vectorized pandas/pyarrow
+# conversions), the listings are deduplicated on listing_ID (the most recent crawl wins, or
+# one per crawl date with --history), the ones already in the archive are left out, and the
+# rest is written to the archive in one go.
+#
+#   python import_legacy.py flats.csv old_crawls/ [--history]
+
+import datetime
+import glob
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+import config
+from archive import Archive, PARTITIONING, type_columns
+from records import LISTING_FIELDS
+
+SCHEMAS = {
+    'results': {'Address': 'address', 'Price': 'rent', 'Space': 'surface_living', 'Rooms': 'n_of_rooms',
+                'flat_link': 'link'},
+    'notebook': {'flat_ID': 'listing_ID', 'price': 'rent'},
+    'scraper': {},
+}
+INDEX_COLUMNS = {'', 'Unnamed: 0'}
+FEATURE_ITEM = re.compile(r"""'((?:[^'\\]|\\.)*)'|"((?:[^"\\]|\\.)*)\"""")
+
+
+def detect_schema(columns):
+    columns = list(columns)
+    lowered = {name.lower() for name in columns}
+    if 'listing_id' in lowered:
+        return 'scraper'
+    if 'flat_id' in lowered:
+        return 'notebook'
+    if 'flat_link' in lowered or {'address', 'price'} <= lowered:
+        return 'results'
+    raise ValueError(f'Unknown flats.csv layout: {sorted(columns)}')
+
+
+def column_names(columns, schema):
+    # csv column -> current column: the renames of the layout, then the Listing field of the
+    # same name in any case (the notebook wrote 'N_of_rooms', 'Surface_living', 'Features'...).
+    # When two columns give the same field the first one is kept.
+    renames = {old.lower(): new for old, new in SCHEMAS[schema].items()}
+    fields = {name.lower(): name for name in LISTING_FIELDS}
+    names = {}
+    for column in columns:
+        name = renames.get(column.lower()) or fields.get(column.lower())
+        if name is not None and name not in names.values():
+            names[column] = name
+    return names
+
+
+def crawl_date_of(path):
+    # the date in the file name (flats_2024-03-01.csv, flats20240301.csv) or the date of the file
+    match = re.search(r'(20\d{2})[-_]?(\d{2})[-_]?(\d{2})', os.path.basename(path))
+    if match:
+        try:
+            return datetime.date(*map(int, match.groups()))
+        except ValueError:
+            pass
+    return datetime.date.fromtimestamp(os.path.getmtime(path))
+
+
+def _features(column):
+    # "['balcony', "children's room"]" -> ['balcony', "children's room"], vectorized findall
+    found = column.str.findall(FEATURE_ITEM)
+    return found.map(lambda items: [single or double for single, double in items]
+                     if isinstance(items, list) and items else None)
+
+
+def _fill(column, values):
+    # column.fillna(values) without pandas downcasting the object column (FutureWarning)
+    column = column.copy()
+    missing = column.isna()
+    column[missing] = values[missing]
+    return column
+
+
+def convert_chunk(df, schema):
+    # a chunk of a csv (all strings) with the current column names and values
+    names = column_names(df.columns, schema)
+    df = df[list(names)].rename(columns=names)
+    for name in df.columns:
+        if name != 'features':
+            df[name] = df[name].str.strip().replace('', None)
+    out = pd.DataFrame({name: df[name] if name in df else pd.Series(None, index=df.index, dtype=object)
+                        for name in LISTING_FIELDS})
+    number_in_link = out['link'].str.extract(r'/(\d{5,})(?:[/?#]|$)', expand=False)
+    out['listing_ID'] = _fill(out['listing_ID'], number_in_link)
+    out['postcode'] = _fill(out['postcode'], out['address'].str.extract(r'\b(\d{4})\s+\D', expand=False))
+    out['site'] = _fill(out['site'], out['link'].str.extract(r'//(?:www\.)?([^./]+)\.', expand=False))
+    out['features'] = _features(out['features']) if 'features' in df else None
+    return out.dropna(subset=['listing_ID'])
+
+
+def import_file(path, chunk_size=50_000):
+    # runs in the pool: the listings of one csv as an Arrow table with the archive's types
+    header = pd.read_csv(path, nrows=0).columns
+    schema = detect_schema(name for name in header if name not in INDEX_COLUMNS)
+    crawl_date = crawl_date_of(path)
+    scraped_at = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+    tables = []
+    for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size):
+        converted = convert_chunk(chunk, schema)
+        string_columns = {name: pa.array(converted[name], pa.string()) for name in LISTING_FIELDS
+                          if name != 'features'}
+        string_columns['features'] = pa.array(converted['features'], pa.list_(pa.string()))
+        tables.append(type_columns(pa.table(string_columns).select(LISTING_FIELDS), crawl_date, scraped_at))
+    table = pa.concat_tables(tables) if tables else None
+    return path, schema, table
+
+
+def deduplicate(table, history=False):
+    # one row per listing_ID (the most recent), or per listing_ID and crawl date. Inside a file
+    # the last row wins: appended flats.csv files have every version of a listing.
+    keys = ['listing_ID', 'crawl_date'] if history else ['listing_ID']
+    order = table.select(['listing_ID', 'crawl_date', 'scraped_at']).to_pandas().iloc[::-1]
+    order = order.sort_values(['crawl_date', 'scraped_at'], ascending=False, kind='stable')
+    keep = order.drop_duplicates(subset=keys).index.sort_values()
+    return table.take(pa.array(keep))
+
+
+def without_archived(table, root):
+    # leaves out the listings the archive already has for the same crawl date
+    if not os.path.isdir(root) or not os.listdir(root):
+        return table
+    archived = Archive(root).query().columns('listing_ID', 'crawl_date').to_table().to_pandas()
+    if archived.empty:
+        return table
+    rows = table.select(['listing_ID', 'crawl_date']).to_pandas()
+    known = pd.MultiIndex.from_frame(rows).isin(pd.MultiIndex.from_frame(archived[['listing_ID', 'crawl_date']]))
+    return table.filter(pa.array(~known))
+
+
+def csv_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, '**', '*.csv'), recursive=True))
+        else:
+            yield path
+
+
+def import_legacy(paths, root='archive', history=False, workers=None):
+    files = list(csv_files(paths))
+    tables = []
+    with ProcessPoolExecutor(workers) as pool:
+        for path, schema, table in pool.map(import_file, files):
+            print(f'{path}: {schema} layout, {table.num_rows if table is not None else 0} listings')
+            if table is not None and table.num_rows:
+                tables.append(table)
+    if not tables:
+        print('Nothing to import')
+        return 0
+    table = pa.concat_tables(tables, promote_options='default')
+    n_read = table.num_rows
+    table = without_archived(deduplicate(table, history), root)
+    # rows without a postcode go to the postcode=__HIVE_DEFAULT_PARTITION__ directory
+    table = table.sort_by([('crawl_date', 'ascending'), ('postcode', 'ascending')])
+    ds.write_dataset(table, root, format='parquet', partitioning=PARTITIONING,
+                     basename_template=f"import-{datetime.datetime.now():%Y%m%d%H%M%S}-{{i}}.parquet",
+                     existing_data_behavior='overwrite_or_ignore', max_partitions=100_000)
+    n_dates = len(pc.unique(table.column('crawl_date')))
+    print(f'{n_read} listings read from {len(files)} files, {table.num_rows} imported '
+          f'into {root} ({n_dates} crawl dates)')
+    return table.num_rows
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    import_legacy(args or [config.CSV_PATH], config.ARCHIVE_ROOT, history='--history' in sys.argv,
+                  workers=config.PARSERS or None)
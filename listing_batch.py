@@ -0,0 +1,87 @@
+# Columnar storage for many listings.
+#
+# ListingBatch keeps one Python list per column instead of one dict per listing. It builds
+# an Arrow record batch in a single pass, with the categorical columns (postcode, type,
+# features...) dictionary encoded. From there the DataFrame (categorical dtypes) and the
+# Parquet file are made without going through per-row dicts.
+
+import ast
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from records import Listing, LISTING_FIELDS
+
+CATEGORICAL_COLUMNS = ['postcode', 'type', 'n_of_rooms', 'floor', 'n_of_floors', 'availability', 'site']
+
+
+def _dictionary_column(values):
+    return pa.array(values, type=pa.string()).dictionary_encode()
+
+
+def _features_column(values):
+    # list<dictionary<string>>: every feature name is stored once in the dictionary
+    offsets = [0]
+    flat_values = []
+    mask = []
+    for features in values:
+        mask.append(features is None)
+        flat_values.extend(features or ())
+        offsets.append(len(flat_values))
+    return pa.ListArray.from_arrays(pa.array(offsets, type=pa.int32()), _dictionary_column(flat_values),
+                                    mask=pa.array(mask, type=pa.bool_()))
+
+
+class ListingBatch:
+
+    def __init__(self, listings=()):
+        self.columns = {name: [] for name in LISTING_FIELDS}
+        for listing in listings:
+            self.append(listing)
+
+    def __len__(self):
+        return len(self.columns['link'])
+
+    def append(self, listing):
+        for name in LISTING_FIELDS:
+            self.columns[name].append(getattr(listing, name))
+
+    def __iter__(self):
+        for row in zip(*(self.columns[name] for name in LISTING_FIELDS)):
+            yield Listing(*row)
+
+    def clear(self):
+        for values in self.columns.values():
+            values.clear()
+
+    def to_arrow(self):
+        arrays = []
+        for name in LISTING_FIELDS:
+            if name == 'features':
+                arrays.append(_features_column(self.columns[name]))
+            elif name in CATEGORICAL_COLUMNS:
+                arrays.append(_dictionary_column(self.columns[name]))
+            else:
+                arrays.append(pa.array(self.columns[name], type=pa.string()))
+        return pa.RecordBatch.from_arrays(arrays, names=LISTING_FIELDS)
+
+    def to_pandas(self):
+        # dictionary columns come out as pandas categoricals
+        return self.to_arrow().to_pandas()
+
+    def to_parquet(self, path):
+        pq.write_table(pa.Table.from_batches([self.to_arrow()]), path)
+
+
+def read_flats_csv(path):
+    # Loads a flats.csv written by web_scraper.py with the categorical columns as category
+    # dtype and the features back as tuples (they are stored as a stringified list). A file
+    # that was appended to (see sinks.CsvSink) can have a link more than once, the last row wins.
+    df = pd.read_csv(path, dtype={name: 'category' for name in CATEGORICAL_COLUMNS})
+    if 'link' in df:
+        df = df.drop_duplicates('link', keep='last').reset_index(drop=True)
+    if 'features' in df:
+        df['features'] = df['features'].map(
+            lambda x: tuple(ast.literal_eval(x)) if isinstance(x, str) and x.startswith('[') else None)
+    return df
@@ -0,0 +1,58 @@
+# Where the watch mode sends the new listings it finds.
+#
+#   stdout                  print a line per listing
+#   file:new_listings.jsonl append the listing as a JSON line
+#   webhook:http://...      POST the listing as JSON (stand-in for a chat/mail webhook)
+
+import json
+import time
+import urllib.request
+
+
+class StdoutNotifier:
+
+    def notify(self, listing):
+        print(f"{time.ctime()} NEW: {listing.rent} | {listing.n_of_rooms} rooms | "
+              f"{listing.surface_living} | {listing.address} | {listing.link}")
+
+
+class FileNotifier:
+
+    def __init__(self, path):
+        self.path = path
+
+    def notify(self, listing):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'notified_at': time.time(), **listing.to_dict()}, ensure_ascii=False) + '\n')
+
+
+class WebhookNotifier:
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def notify(self, listing):
+        request = urllib.request.Request(self.url, data=json.dumps(listing.to_dict()).encode(),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        except OSError as e:
+            print(f'Webhook {self.url} failed: {e}')
+
+
+def make_notifiers(spec):
+    notifiers = []
+    for item in (part.strip() for part in spec.split(',')):
+        if not item:
+            continue
+        kind, _, target = item.partition(':')
+        if kind == 'stdout':
+            notifiers.append(StdoutNotifier())
+        elif kind == 'file':
+            notifiers.append(FileNotifier(target or 'new_listings.jsonl'))
+        elif kind == 'webhook':
+            notifiers.append(WebhookNotifier(target))
+        else:
+            raise ValueError(f'Unknown notifier {item!r}, expected stdout, file:<path> or webhook:<url>')
+    return notifiers
@@ -0,0 +1,173 @@
+# Producer/consumer pipeline: network on threads, html parsing on processes.
+#
+#   producer thread  --items-->  fetcher threads  --raw html-->  process pool (parse)  --> caller
+#
+# The producer (e.g. walking the result pages) and the fetchers (loading the listings) only do
+# I/O and hand the raw html over, the CPU heavy parsing runs in a ProcessPoolExecutor. Both
+# queues are bounded and the number of parse jobs in flight is capped, so when the consumer
+# (the sink) is slow everything upstream blocks instead of piling up in memory.
+#
+# The parser processes are started by a forkserver (where the platform has one) rather than
+# forked from this process: by the time they start, the producer and fetcher threads are
+# running and a fork could copy a lock one of them holds.
+
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+_DONE = object()
+
+
+def _put(q, item, stop):
+    # like q.put(item) but gives up when the pipeline is being stopped
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _parser_context():
+    return multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                                       else None)
+
+
+def run_pipeline(produce, fetch, parse, n_fetchers=2, n_parsers=None, queue_size=16, thread_cleanup=None):
+    # produce()     -> iterable of work items, runs on its own thread
+    # fetch(item)   -> tuple of arguments for parse, or None to skip the item (fetcher threads)
+    # parse(*raw)   -> result, runs in the process pool so it must be picklable (module level)
+    # thread_cleanup() is called at the end of the producer and of every fetcher thread
+    # Generator: yields the parse results in the caller's thread as they complete.
+    n_parsers = n_parsers or os.cpu_count() or 1
+    items = queue.Queue(maxsize=queue_size)
+    raw_pages = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def producer():
+        try:
+            for item in produce():
+                if not _put(items, item, stop):
+                    break
+        except Exception:
+            traceback.print_exc()
+        finally:
+            for _ in range(n_fetchers):
+                _put(items, _DONE, stop)
+            if thread_cleanup is not None:
+                thread_cleanup()
+
+    def fetcher():
+        try:
+            while True:
+                item = _get(items, stop)
+                if item is _DONE:
+                    break
+                try:
+                    raw = fetch(item)
+                except Exception as e:
+                    print(f"Error fetching {item}: {e}")
+                    continue
+                if raw is not None and not _put(raw_pages, raw, stop):
+                    break
+        finally:
+            _put(raw_pages, _DONE, stop)
+            if thread_cleanup is not None:
+                thread_cleanup()
+
+    pool = ProcessPoolExecutor(max_workers=n_parsers, mp_context=_parser_context())
+    threads = [threading.Thread(target=producer, name='producer', daemon=True)]
+    threads += [threading.Thread(target=fetcher, name=f'fetcher-{i}', daemon=True) for i in range(n_fetchers)]
+    for thread in threads:
+        thread.start()
+
+    fetchers_left = n_fetchers
+    in_flight = set()
+    max_in_flight = 2 * n_parsers
+    try:
+        with pool:
+            while fetchers_left or in_flight:
+                # hand html to the parsers while there is room, otherwise wait for results
+                if fetchers_left and len(in_flight) < max_in_flight:
+                    try:
+                        raw = raw_pages.get(timeout=0.1 if in_flight else 0.5)
+                    except queue.Empty:
+                        raw = None
+                    if raw is _DONE:
+                        fetchers_left -= 1
+                    elif raw is not None:
+                        in_flight.add(pool.submit(parse, *raw))
+                    timeout = 0
+                else:
+                    timeout = 0.5
+                if not in_flight:
+                    continue
+                done, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"Error parsing: {e}")
+                        continue
+                    yield result
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=30)
+
+
+def fan_out(items, func, n_threads=4, thread_cleanup=None):
+    # Runs func(item) for all the items on n_threads threads and yields (item, result) as they
+    # complete (result is the exception if func raised). thread_cleanup() runs at the end of
+    # every thread, e.g. to quit the thread's browser.
+    todo = queue.Queue()
+    for item in items:
+        todo.put(item)
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def worker():
+        try:
+            while not stop.is_set():
+                try:
+                    item = todo.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    results.put((item, func(item)))
+                except Exception as e:
+                    results.put((item, e))
+        finally:
+            results.put(_DONE)
+            if thread_cleanup is not None:
+                thread_cleanup()
+
+    n_threads = max(1, min(n_threads, todo.qsize()))
+    threads = [threading.Thread(target=worker, name=f'fan-out-{i}', daemon=True) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    threads_left = n_threads
+    try:
+        while threads_left:
+            result = results.get()
+            if result is _DONE:
+                threads_left -= 1
+            else:
+                yield result
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=30)
@@ -0,0 +1,34 @@
+# Token bucket shared by all the threads of the crawler: however many browsers we run, the
+# site doesn't get more than `rate` page loads per second (with bursts of up to `burst`).
+
+import threading
+import time
+
+
+class RateLimiter:
+
+    def __init__(self, rate, burst=1):
+        # rate <= 0 disables the limit
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
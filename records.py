@@ -0,0 +1,109 @@
+# The records the crawler yields: a search, the result pages of a search and the listings.
+
+import sys
+from dataclasses import dataclass, asdict, field, fields
+
+
+@dataclass
+class Search:
+    # a result list url (without the page parameter, ?ep= on homegate, see sites.py)
+    url: str
+    first_page: int = 1
+    max_pages: int = None
+    page_param: str = 'ep'
+
+    def page_url(self, page):
+        return f"{self.url}{'&' if '?' in self.url else '?'}{self.page_param}={page}"
+
+
+@dataclass
+class SearchSummary:
+    # what the first result page tells us about the whole search
+    total_listings: int = None
+    max_pages: int = None
+    listings_per_page: int = None
+
+    def last_page(self):
+        if self.max_pages:
+            return self.max_pages
+        if self.total_listings is not None and self.listings_per_page:
+            return -(-self.total_listings // self.listings_per_page)  # ceil
+        return None
+
+
+@dataclass
+class ResultPage:
+    search: Search
+    page: int
+    url: str
+    listing_urls: list = field(default_factory=list)
+    # listing url -> fingerprint of the listing's card on this page
+    card_hashes: dict = field(default_factory=dict)
+    # only filled in for the first page of a search
+    summary: SearchSummary = None
+
+
+# Listings are kept in memory by the thousands: no __dict__ per instance (slots) and the
+# values that repeat a lot across listings are interned, so all the '8004' postcodes or
+# 'balcony' features share one string object.
+INTERNED_FIELDS = ('postcode', 'type', 'n_of_rooms', 'floor', 'n_of_floors', 'availability', 'site')
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True)
+class Listing:
+    listing_ID: str = None
+    object_ref: str = None
+    address: str = None
+    postcode: str = None
+    net_rent: str = None
+    expenses: str = None
+    rent: str = None
+    availability: str = None
+    type: str = None
+    n_of_rooms: str = None
+    floor: str = None
+    n_of_floors: str = None
+    surface_living: str = None
+    floor_space: str = None
+    room_height: str = None
+    last_refurbishment: str = None
+    year_built: str = None
+    link: str = None
+    features: tuple = None
+    description: str = None
+    # name of the site adapter the listing comes from (see sites.py)
+    site: str = None
+    # fingerprints used to detect changes on revisits (see fingerprints.py)
+    card_hash: str = None
+    detail_hash: str = None
+    # key of the first listing seen of the same flat (see dedup.py)
+    cluster_id: str = None
+
+    def __post_init__(self):
+        for name in INTERNED_FIELDS:
+            setattr(self, name, _intern(getattr(self, name)))
+        if self.features is not None:
+            self.features = tuple(_intern(feature) for feature in self.features)
+
+    def __getstate__(self):
+        return tuple(getattr(self, f.name) for f in fields(self))
+
+    def __setstate__(self, state):
+        # unpickling (e.g. the listings coming back from the parser processes) makes new
+        # string objects, they are interned again
+        for f, value in zip(fields(self), state):
+            setattr(self, f.name, value)
+        self.__post_init__()
+
+    def to_dict(self):
+        flats_dict = asdict(self)
+        if self.features is not None:
+            flats_dict['features'] = list(self.features)
+        return flats_dict
+
+
+LISTING_FIELDS = [f.name for f in fields(Listing)]
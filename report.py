@@ -0,0 +1,260 @@
+# PDF report over the Parquet archive: overview, new listings, price changes and a rent
+# histogram per postcode.
+#
+# Nothing is recomputed that didn't change since the last report:
+# - every partition of the archive (crawl date x postcode) is summarized once (number of
+#   rows, the rent of every link) and the summary is cached under the fingerprint of its
+#   files. A new crawl only adds partitions, so only those are read.
+# - every section is rendered to a png named after the fingerprint of its inputs (the
+#   partitions it covers). A section whose partitions didn't change is taken from the cache.
+# A listing is in the archive once per version (SKIP_UNCHANGED and the watch mode only write
+# it again when it changed), the overview and the histograms count every listing once with
+# its latest rent. The rent changes compare a listing with its last earlier rent, whatever
+# crawl that was in.
+# The partition summaries and the sections are computed in a pool of processes
+# (matplotlib isn't thread safe), the PDF is then put together from the pngs.
+#
+#   python report.py
+
+import datetime
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import config
+from archive import Archive
+from fingerprints import fingerprint
+
+RENT_BINS = np.append(np.arange(0, 10001, 250), np.inf)
+# part of the partition fingerprints: the summaries cached by an older version are read again
+SUMMARY_VERSION = 2
+
+
+@dataclass
+class Section:
+    id: str
+    title: str
+    kind: str
+    # the fingerprint of the section's inputs, the png is cached under it
+    input_hash: str
+
+    def path(self, cache_dir):
+        return os.path.join(cache_dir, f"{self.id.replace(':', '-')}-{self.input_hash}.png")
+
+
+def inventory(root):
+    # (crawl date, postcode) -> parquet files of the partition, without reading them
+    partitions = {}
+    for fragment in Archive(root).dataset().get_fragments():
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        key = (str(keys.get('crawl_date')), str(keys.get('postcode')))
+        stat = os.stat(fragment.path)
+        partitions.setdefault(key, []).append((fragment.path, stat.st_size, stat.st_mtime_ns))
+    return {key: sorted(files) for key, files in partitions.items()}
+
+
+def _read(files, columns):
+    tables = [pq.read_table(path, columns=columns) for path, _, _ in files]
+    return pa.concat_tables(tables) if tables else pa.table({name: [] for name in columns})
+
+
+def summarize_partition(files):
+    # runs in the pool: the numbers of a partition the sections are built from
+    table = _read(files, ['link', 'rent'])
+    rents = [None if rent is None or np.isnan(rent) else rent for rent in table.column('rent').to_pylist()]
+    # link -> rent, the last row wins when a link is twice in the partition
+    return {'n': table.num_rows,
+            'rents': dict(zip(table.column('link').to_pylist(), rents))}
+
+
+def latest_rents(summaries, known_only=False):
+    # link -> its rent in the last of the summaries (in crawl order) it is in; known_only
+    # skips the versions without a rent
+    rents = {}
+    for summary in summaries:
+        rents.update((link, rent) for link, rent in summary['rents'].items()
+                     if rent is not None or not known_only)
+    return rents
+
+
+def _figure(height=6):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(8.27, height))
+    return plt, fig
+
+
+def _table_figure(rows, columns, title):
+    plt, fig = _figure(min(11, 1 + 0.25 * (len(rows) + 1)))
+    ax = fig.add_subplot(111)
+    ax.axis('off')
+    ax.set_title(title)
+    if rows:
+        table = ax.table(cellText=rows, colLabels=columns, loc='upper center', cellLoc='left')
+        table.auto_set_font_size(False)
+        table.set_fontsize(7)
+    else:
+        ax.text(0.5, 0.5, 'Nothing to show', ha='center', va='center')
+    return plt, fig
+
+
+def render_section(section, data, path):
+    # runs in the pool: draws the section to its png
+    if section.kind == 'overview':
+        rows = [[postcode, n, f'{mean:,.0f}' if mean else ''] for postcode, n, mean in data['rows']]
+        plt, fig = _table_figure(rows, ['Postcode', 'Listings', 'Average rent'], section.title)
+    elif section.kind == 'histogram':
+        plt, fig = _figure()
+        ax = fig.add_subplot(111)
+        counts = data['rent_hist'][:-1]  # the last bin is everything above 10'000
+        ax.bar(RENT_BINS[:-2], counts, width=250, align='edge', edgecolor='black')
+        used = np.nonzero(counts)[0]
+        ax.set_xlim(0, max(2000, 250 * (used.max() + 2)) if len(used) else 10000)
+        ax.set_xlabel('Rent (CHF)')
+        ax.set_ylabel('Listings')
+        ax.set_title(section.title)
+    elif section.kind == 'new_listings':
+        table = _read(data['files'], ['link', 'rent', 'n_of_rooms', 'surface_living', 'address'])
+        new = table.filter(pc.invert(pc.is_in(table.column('link'), pa.array(list(data['known']), pa.string()))))
+        rows = [[row['address'] or '', f"{row['rent']:,.0f}" if row['rent'] else '', row['n_of_rooms'] or '',
+                 row['surface_living'] or ''] for row in new.to_pylist()[:40]]
+        plt, fig = _table_figure(rows, ['Address', 'Rent', 'Rooms', 'm²'],
+                                 f"{section.title} ({new.num_rows})")
+    elif section.kind == 'price_changes':
+        after = _read(data['after'], ['link', 'rent', 'address']).to_pylist()
+        old_rents = data['old_rents']
+        rows = [[row['address'] or '', f"{old_rents[row['link']]:,.0f}", f"{row['rent']:,.0f}"]
+                for row in after if old_rents.get(row['link']) and row['rent']
+                and row['rent'] != old_rents[row['link']]]
+        plt, fig = _table_figure(rows[:40], ['Address', 'Before', 'Now'], f"{section.title} ({len(rows)})")
+    else:
+        raise ValueError(f'Unknown section kind {section.kind!r}')
+    fig.savefig(path + '.tmp.png', dpi=110, bbox_inches='tight')
+    plt.close(fig)
+    os.replace(path + '.tmp.png', path)
+    return path
+
+
+class ReportBuilder:
+
+    def __init__(self, archive_root='archive', cache_dir='report_cache', workers=None):
+        self.archive_root = archive_root
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.summaries_path = os.path.join(cache_dir, 'partitions.pkl')
+        os.makedirs(cache_dir, exist_ok=True)
+        # (crawl date, postcode) -> (fingerprint of the files, summary)
+        self.summaries = {}
+        if os.path.exists(self.summaries_path):
+            with open(self.summaries_path, 'rb') as f:
+                self.summaries = pickle.load(f)
+
+    def update_summaries(self, partitions, pool):
+        hashes = {key: fingerprint(SUMMARY_VERSION, files) for key, files in partitions.items()}
+        stale = [key for key, h in hashes.items() if self.summaries.get(key, (None,))[0] != h]
+        for key, summary in zip(stale, pool.map(summarize_partition, [partitions[key] for key in stale])):
+            self.summaries[key] = (hashes[key], summary)
+        for key in set(self.summaries) - set(hashes):
+            del self.summaries[key]  # partition gone from the archive
+        with open(self.summaries_path + '.tmp', 'wb') as f:
+            pickle.dump(self.summaries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.summaries_path + '.tmp', self.summaries_path)
+        return hashes, len(stale)
+
+    def plan(self, partitions, hashes):
+        # [(section, the data it is rendered from)]
+        dates = sorted({date for date, _ in partitions})
+        postcodes = sorted({postcode for _, postcode in partitions})
+        by_postcode = {postcode: sorted(key for key in partitions if key[1] == postcode) for postcode in postcodes}
+        all_hash = fingerprint(sorted(hashes.items()))
+        sections = []
+
+        # the latest rent of every listing of the postcode, a listing written again on a change
+        # counts once
+        rents = {}
+        for postcode in postcodes:
+            current = latest_rents(self.summaries[key][1] for key in by_postcode[postcode])
+            rents[postcode] = (len(current), np.array([rent for rent in current.values() if rent is not None], float))
+        rows = [(postcode, n, values.mean() if len(values) else None) for postcode, (n, values) in rents.items()]
+        sections.append((Section('overview', 'Listings per postcode (all crawls, latest version)', 'overview',
+                                 all_hash), {'rows': rows}))
+
+        if dates:
+            latest = dates[-1]
+            latest_keys = sorted(key for key in partitions if key[0] == latest)
+            earlier_keys = sorted(key for key in partitions if key[0] != latest)
+            known = set().union(*(self.summaries[key][1]['rents'] for key in earlier_keys))
+            sections.append((Section('new', f'New listings on {latest}', 'new_listings', all_hash),
+                             {'files': [f for key in latest_keys for f in partitions[key]], 'known': known}))
+        if len(dates) > 1:
+            # an unchanged listing isn't written on every crawl: its last earlier rent can be
+            # from any date before
+            earlier = latest_rents((self.summaries[key][1] for key in earlier_keys), known_only=True)
+            links = set().union(*(self.summaries[key][1]['rents'] for key in latest_keys))
+            sections.append((Section('changes', f'Rent changes on {latest}', 'price_changes', all_hash),
+                             {'after': [f for key in latest_keys for f in partitions[key]],
+                              'old_rents': {link: earlier[link] for link in links if link in earlier}}))
+
+        for postcode in postcodes:
+            hist = np.histogram(rents[postcode][1], RENT_BINS)[0]
+            sections.append((Section(f'hist:{postcode}', f'Rents in {postcode} (all crawls, latest version)',
+                                     'histogram', fingerprint([hashes[key] for key in by_postcode[postcode]])),
+                             {'rent_hist': hist}))
+        return sections
+
+    def build(self, output='report.pdf'):
+        partitions = inventory(self.archive_root)
+        with ProcessPoolExecutor(self.workers) as pool:
+            hashes, n_summarized = self.update_summaries(partitions, pool)
+            sections = self.plan(partitions, hashes)
+            stale = [(section, data) for section, data in sections
+                     if not os.path.exists(section.path(self.cache_dir))]
+            futures = [pool.submit(render_section, section, data, section.path(self.cache_dir))
+                       for section, data in stale]
+            for future in futures:
+                future.result()
+        self._write_pdf([section for section, _ in sections], output)
+        self._clean_cache(sections)
+        print(f'{output}: {len(sections)} sections, {len(stale)} rendered, {n_summarized} of '
+              f'{len(partitions)} partitions read')
+        return output
+
+    def _write_pdf(self, sections, output):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_pdf import PdfPages
+        with PdfPages(output) as pdf:
+            fig = plt.figure(figsize=(8.27, 11.69))
+            fig.text(0.5, 0.6, 'Flat rentals report', ha='center', fontsize=24)
+            fig.text(0.5, 0.55, datetime.datetime.now().strftime('%Y-%m-%d %H:%M'), ha='center')
+            pdf.savefig(fig)
+            plt.close(fig)
+            for section in sections:
+                image = plt.imread(section.path(self.cache_dir))
+                height, width = image.shape[:2]
+                fig = plt.figure(figsize=(8.27, min(11.69, 8.27 * height / width)))
+                ax = fig.add_axes([0, 0, 1, 1])
+                ax.imshow(image)
+                ax.axis('off')
+                pdf.savefig(fig)
+                plt.close(fig)
+
+    def _clean_cache(self, sections):
+        # drop the pngs of section versions that are not in the report any more
+        current = {os.path.basename(section.path(self.cache_dir)) for section, _ in sections}
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.png') and name not in current:
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+if __name__ == '__main__':
+    ReportBuilder(config.ARCHIVE_ROOT, config.REPORT_CACHE, config.REPORT_WORKERS or None).build(config.REPORT_PATH)
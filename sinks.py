@@ -0,0 +1,143 @@
+# Where the scraped listings are written to.
+#
+# CsvSink is what web_scraper.py always did (flats.csv), SQLiteSink is a sink that several
+# worker processes/nodes can write to at the same time, archive.ParquetSink adds the listings
+# to the partitioned Parquet archive. All take records.Listing objects.
+
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from records import LISTING_FIELDS
+from archive import ParquetSink
+
+
+class CsvSink:
+    # Writes one csv line per listing (the file used to be rebuilt from a DataFrame of all
+    # the listings after every single one). A new crawl starts a new file, append=True adds to
+    # the file of the earlier crawls instead. That's needed when only the new and changed
+    # listings are written (SKIP_UNCHANGED, watch mode): the file keeps every version of a
+    # listing and the last row of a link is the current one.
+
+    def __init__(self, path='flats.csv', append=False):
+        self.path = path
+        self.append = append
+        self.file = None
+        self.writer = None
+        self.n_written = 0
+
+    def _open(self):
+        if self.append and os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, newline='') as f:
+                header = next(csv.reader(f), None)
+            if header == LISTING_FIELDS:
+                self.file = open(self.path, 'a', newline='')
+                self.writer = csv.writer(self.file)
+                return
+            # written by another version: keep it aside (import_legacy.py reads it) and start over
+            mtime = datetime.date.fromtimestamp(os.path.getmtime(self.path))
+            old_path = f'{os.path.splitext(self.path)[0]}-{mtime:%Y%m%d}.csv'
+            os.replace(self.path, old_path)
+            print(f'{self.path} has other columns, moved to {old_path}')
+        self.file = open(self.path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(LISTING_FIELDS)
+
+    def write(self, listing, worker=None):
+        if self.writer is None:
+            self._open()
+        row = listing.to_dict()
+        self.writer.writerow(['' if row[name] is None else row[name] for name in LISTING_FIELDS])
+        self.file.flush()
+        self.n_written += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        print(f'{self.n_written} flats were added to the dataframe')
+
+
+class SQLiteSink:
+
+    columns = LISTING_FIELDS
+
+    def __init__(self, path='flats.sqlite', journal_mode='WAL'):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        # WAL only works for writers on the same host, see work_queue.py
+        self.conn.execute(f'PRAGMA journal_mode={journal_mode}')
+        self.conn.execute('PRAGMA busy_timeout=30000')
+        self.conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS flats (
+                {', '.join(f'{col} TEXT' for col in self.columns)},
+                worker TEXT,
+                scraped_at REAL,
+                UNIQUE (link)
+            )''')
+        # tables made by an older version miss the newer Listing fields
+        existing = {row[1] for row in self.conn.execute('PRAGMA table_info(flats)')}
+        for col in self.columns:
+            if col not in existing:
+                self.conn.execute(f'ALTER TABLE flats ADD COLUMN {col} TEXT')
+        self.n_written = 0
+
+    def write(self, listing, worker=None):
+        row = listing.to_dict()
+        if row.get('features') is not None:
+            row['features'] = json.dumps(row['features'])
+        values = [row.get(col) for col in self.columns] + [worker, time.time()]
+        # the same link scraped twice (e.g. a retried task) replaces the older row
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO flats ({', '.join(self.columns)}, worker, scraped_at) "
+            f"VALUES ({', '.join('?' * (len(self.columns) + 2))})", values)
+        self.n_written += 1
+
+    def to_dataframe(self):
+        df = pd.read_sql_query('SELECT * FROM flats', self.conn)
+        df['features'] = df['features'].map(lambda x: json.loads(x) if x else None)
+        return df
+
+    def close(self):
+        print(f'{self.n_written} flats were written to {self.path}')
+        self.conn.close()
+
+
+class MultiSink:
+    # Writes every listing to several sinks, e.g. flats.csv and the Parquet archive
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, listing, worker=None):
+        for sink in self.sinks:
+            sink.write(listing, worker=worker)
+
+    def flush(self):
+        for sink in self.sinks:
+            if hasattr(sink, 'flush'):
+                sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def make_sink(kind, csv_path='flats.csv', sqlite_path='flats.sqlite', archive_root='archive', journal_mode='WAL',
+              csv_append=False, crawl_date=None):
+    # kind is one sink name or several separated by commas: 'csv', 'sqlite', 'parquet'
+    kinds = [k.strip() for k in kind.split(',') if k.strip()]
+    if len(kinds) > 1:
+        return MultiSink([make_sink(k, csv_path, sqlite_path, archive_root, journal_mode, csv_append, crawl_date)
+                          for k in kinds])
+    if kind == 'csv':
+        return CsvSink(csv_path, csv_append)
+    if kind == 'sqlite':
+        return SQLiteSink(sqlite_path, journal_mode)
+    if kind == 'parquet':
+        return ParquetSink(archive_root, crawl_date)
+    raise ValueError(f'Unknown sink {kind!r}, expected csv, sqlite or parquet')
@@ -0,0 +1,182 @@
+# Site adapters: everything that is specific to one real estate portal.
+#
+# The crawler (web_scraper.py) only knows about searches, result pages and listings; how to
+# build a search url, page through the results, get past the cookie banner and read the
+# listings is up to the adapter of the site. The browsers, the rate limiters (one per host),
+# the retry policy, the pipeline and the sinks are shared by all the sites. A new portal is a
+# subclass of Site registered with @register, the crawler picks it by the host of the url.
+
+import re
+import sys
+import traceback
+from urllib.parse import urlencode, urlsplit
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+import extractors
+from diagnostics import capture_failure
+from records import Search, INTERNED_FIELDS
+
+SITES = {}
+
+
+def register(cls):
+    SITES[cls.name] = cls()
+    return cls
+
+
+def get_site(name):
+    try:
+        return SITES[name]
+    except KeyError:
+        raise ValueError(f'Unknown site {name!r}, expected one of {sorted(SITES)}') from None
+
+
+def site_for_url(url):
+    host = (urlsplit(url).hostname or '').lower()
+    for site in SITES.values():
+        if any(host == h or host.endswith('.' + h) for h in site.hosts):
+            return site
+    raise ValueError(f'No site adapter for {url}')
+
+
+def parse_listing(html, url, card_hash=None):
+    # Module level so it can be sent to the parser processes of the pipeline
+    return site_for_url(url).parse_listing(html, url, card_hash)
+
+
+class Site:
+    name = None
+    hosts = ()
+    home_url = None
+    # query parameter of the result page number
+    page_param = 'page'
+    # XPaths that are present once a result page / a listing is rendered
+    results_ready = None
+    listing_ready = None
+
+    def search(self, url, first_page=1, max_pages=None):
+        return Search(url, first_page, max_pages, page_param=self.page_param)
+
+    def search_url(self, **criteria):
+        raise NotImplementedError
+
+    def newest_first(self, url):
+        # the search sorted by newest first, for the watch mode
+        return url
+
+    def accept_cookies(self, browser, url):
+        # returns False when the page is in a state we can't scrape
+        return True
+
+    def prepare_listing(self, browser, url):
+        # everything to do on a listing page before it can be read
+        return self.accept_cookies(browser, url)
+
+    def parse_result_cards(self, html, url):
+        # [(listing url, card fingerprint)] of a result page
+        raise NotImplementedError
+
+    def parse_search_summary(self, html, listings_per_page=None):
+        raise NotImplementedError
+
+    def extract_listing(self, html, url, card_hash=None):
+        raise NotImplementedError
+
+    def parse_listing(self, html, url, card_hash=None):
+        return self.normalize(self.extract_listing(html, url, card_hash))
+
+    def normalize(self, listing):
+        # same conventions for every site: stripped strings, the site the listing is from
+        for name in ('address', 'postcode', 'net_rent', 'expenses', 'rent', 'availability', 'type',
+                     'n_of_rooms', 'floor', 'n_of_floors', 'surface_living', 'floor_space', 'room_height',
+                     'last_refurbishment', 'year_built'):
+            value = getattr(listing, name)
+            if isinstance(value, str):
+                normalized = re.sub(r'\s+', ' ', value).strip() or None
+                if normalized != value:
+                    if normalized is not None and name in INTERNED_FIELDS:
+                        normalized = sys.intern(normalized)
+                    setattr(listing, name, normalized)
+        listing.site = self.name
+        return listing
+
+
+@register
+class Homegate(Site):
+    name = 'homegate'
+    hosts = ('homegate.ch',)
+    home_url = 'https://www.homegate.ch/'
+    page_param = 'ep'
+    results_ready = '//*[@data-test="result-list-item"]'
+    listing_ready = '//div[@class="CoreAttributes_coreAttributes_e2NAm"]/dl/dd'
+
+    def search_url(self, location='city-zurich', offer='rent', category='real-estate', **filters):
+        # search_url('city-zurich', ac=2.5, ah=3000) -> 2.5+ rooms, up to CHF 3000
+        url = f'https://www.homegate.ch/{offer}/{category}/{location}/matching-list'
+        return f'{url}?{urlencode(filters)}' if filters else url
+
+    def newest_first(self, url):
+        return f"{url}{'&' if '?' in url else '?'}o=dateCreated-desc"
+
+    def accept_cookies(self, browser, url):
+        # Step 1: Handle the cookie consent or blocking element
+        if self.name in browser.consented_sites:
+            return True  # already accepted in this session (or carried over from the last one)
+        driver = browser.get()
+        try:
+            cookie_button = WebDriverWait(driver, 5).until(
+                EC.element_to_be_clickable((By.XPATH, '//button[contains(text(), "Accept")]'))
+            )
+            cookie_button.click()
+            print("Cookie consent accepted.")
+            browser.consented_sites.add(self.name)
+            browser.remember_session()
+        except TimeoutException:
+            print(f"Cookie consent button not found on {url}. Proceeding without interaction.")
+        except Exception as cookie_exception:
+            print(f"Cookie consent issue on {url}: {cookie_exception}")
+            capture_failure(driver, url, 'cookies', cookie_exception)
+            traceback.print_exc()  # Log full stack trace for debugging
+            return False
+        return True
+
+    def switch_to_english(self, browser, url):
+        # Step 2: Handle the language switcher
+        driver = browser.get()
+        try:
+            # Wait for the language switcher to be present
+            language_switcher = WebDriverWait(driver, 5).until(
+                EC.element_to_be_clickable((By.XPATH, '//button[@aria-controls="header-language-switch"]'))
+            )
+
+            # Click the language switcher to change the language
+            language_switcher.click()
+            # Wait for the dropdown to appear
+            english_option = WebDriverWait(driver, 5).until(
+                EC.element_to_be_clickable((By.XPATH, '//a[@class="HgLanguageSwitch_link_GCiHc" and normalize-space(text())="EN"]'))
+            )
+
+            # Click the English option
+            english_option.click()
+        except Exception as language_exception:
+            print(f"Language switch issue on {url}: {language_exception}")
+            traceback.print_exc()
+
+    def prepare_listing(self, browser, url):
+        if not self.accept_cookies(browser, url):
+            return False
+        self.switch_to_english(browser, url)
+        return True
+
+    def parse_result_cards(self, html, url):
+        return extractors.extract_result_cards(html, url)
+
+    def parse_search_summary(self, html, listings_per_page=None):
+        return extractors.extract_search_summary(html, listings_per_page)
+
+    def extract_listing(self, html, url, card_hash=None):
+        return extractors.extract_listing(html, url, card_hash)
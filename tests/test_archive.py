@@ -0,0 +1,54 @@
+import datetime
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from archive import Archive, ParquetSink, ARCHIVE_SCHEMA, PARTITIONING, type_columns
+from records import Listing
+
+
+def test_columns_missing_from_older_files_are_read_as_nulls(tmp_path):
+    root = str(tmp_path / 'archive')
+    # a file from before description and site were added, and the first one in the dataset
+    old = pa.table({'listing_ID': ['1'], 'postcode': ['8004'], 'rent': ['CHF 2,450.–'],
+                    'link': ['https://www.homegate.ch/rent/1']})
+    ds.write_dataset(type_columns(old, datetime.date(2026, 1, 1)), root, format='parquet',
+                     partitioning=PARTITIONING, basename_template='old-{i}.parquet')
+    sink = ParquetSink(root, crawl_date=datetime.date(2026, 2, 1))
+    sink.write(Listing(listing_ID='2', postcode='8004', rent="2'100", description='Bright flat', site='homegate',
+                       link='https://www.homegate.ch/rent/2'))
+    sink.close()
+
+    archive = Archive(root)
+    assert archive.dataset().schema == ARCHIVE_SCHEMA
+    rows = archive.query().columns('listing_ID', 'rent', 'description', 'site').to_table().to_pylist()
+    assert sorted(rows, key=lambda row: row['listing_ID']) == [
+        {'listing_ID': '1', 'rent': 2450.0, 'description': None, 'site': None},
+        {'listing_ID': '2', 'rent': 2100.0, 'description': 'Bright flat', 'site': 'homegate'}]
+    assert archive.query().postcodes([8004]).between(datetime.date(2026, 2, 1)).count() == 1
+
+
+def test_sink_without_a_crawl_date_writes_to_the_day_of_the_flush(tmp_path, monkeypatch):
+    import types
+
+    import archive
+
+    class Today(datetime.date):
+        day = datetime.date(2026, 3, 1)
+
+        @classmethod
+        def today(cls):
+            return cls.day
+
+    monkeypatch.setattr(archive, 'datetime', types.SimpleNamespace(date=Today, datetime=datetime.datetime,
+                                                                   timedelta=datetime.timedelta))
+    root = str(tmp_path / 'archive')
+    sink = ParquetSink(root, flush_every=1)
+    sink.write(Listing(listing_ID='1', postcode='8004', link='https://www.homegate.ch/rent/1'))
+    Today.day = datetime.date(2026, 3, 2)  # past midnight
+    sink.write(Listing(listing_ID='2', postcode='8004', link='https://www.homegate.ch/rent/2'))
+    sink.close()
+
+    rows = Archive(root).query().columns('listing_ID', 'crawl_date').to_table().to_pylist()
+    assert sorted((row['listing_ID'], row['crawl_date']) for row in rows) == [
+        ('1', datetime.date(2026, 3, 1)), ('2', datetime.date(2026, 3, 2))]
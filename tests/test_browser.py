@@ -0,0 +1,120 @@
+from selenium.common.exceptions import WebDriverException
+
+from browser import ManagedBrowser
+
+
+class FakeDriver:
+
+    def __init__(self, cookies_by_host=None):
+        self.cookies_by_host = cookies_by_host or {}
+        self.visited = []
+        self.added = []
+        self.alive = True
+        self.quitted = False
+
+    @property
+    def window_handles(self):
+        if not self.alive:
+            raise WebDriverException('invalid session id')
+        return ['main']
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def get_cookies(self):
+        # like Chrome: only the cookies of the page that is open
+        host = self.visited[-1].split('/')[2] if self.visited else None
+        return [dict(cookie) for cookie in self.cookies_by_host.get(host, [])]
+
+    def add_cookie(self, cookie):
+        self.added.append((self.visited[-1], cookie['name']))
+
+    def quit(self):
+        self.quitted = True
+
+
+HOME_URLS = {'homegate': 'https://www.homegate.ch/', 'immoscout': 'https://www.immoscout24.ch/'}
+
+
+def test_cookies_of_every_consented_site_are_restored_on_their_home_page():
+    old = FakeDriver({'www.homegate.ch': [{'name': 'consent', 'value': '1', 'domain': '.homegate.ch', 'path': '/'}],
+                      'www.immoscout24.ch': [{'name': 'gdpr', 'value': 'y', 'domain': 'www.immoscout24.ch',
+                                              'path': '/'}]})
+    new = FakeDriver()
+    drivers = iter([old, new])
+    browser = ManagedBrowser(lambda: next(drivers), home_urls=HOME_URLS)
+    browser.get()
+    for site, url in HOME_URLS.items():
+        old.get(url)
+        browser.consented_sites.add(site)
+        browser.remember_session()
+    browser.recycle()
+    assert browser.driver is new
+    assert new.added == [('https://www.homegate.ch/', 'consent'), ('https://www.immoscout24.ch/', 'gdpr')]
+    assert browser.consented_sites == {'homegate', 'immoscout'}
+
+
+def test_sites_without_cookies_are_not_opened():
+    drivers = iter([FakeDriver({'www.homegate.ch': [{'name': 'consent', 'value': '1', 'domain': '.homegate.ch'}]}),
+                    FakeDriver()])
+    browser = ManagedBrowser(lambda: next(drivers), home_urls=HOME_URLS)
+    browser.get().get('https://www.homegate.ch/rent/1')
+    browser.recycle()
+    assert browser.driver.visited == ['https://www.homegate.ch/']
+
+
+def make_browser(**kwargs):
+    drivers = []
+
+    def make_driver():
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    return ManagedBrowser(make_driver, **kwargs), drivers
+
+
+def test_recycled_after_max_pages():
+    browser, drivers = make_browser(max_pages=3, max_mb=None)
+    used = [browser.for_navigation() for _ in range(7)]
+    assert used == [drivers[0]] * 3 + [drivers[1]] * 3 + [drivers[2]]
+    assert drivers[0].quitted and drivers[1].quitted and not drivers[2].quitted
+    assert browser.n_recycled == 2 and browser.n_crashes == 0
+    assert browser.pages == 1
+
+
+def test_recycled_above_the_memory_threshold(monkeypatch):
+    browser, drivers = make_browser(max_pages=None, max_mb=1000, memory_check_every=2)
+    memory = iter([400, 1200, 300])
+    checked = []
+
+    def memory_mb():
+        checked.append(browser.pages)
+        return next(memory)
+
+    monkeypatch.setattr(browser, 'memory_mb', memory_mb)
+    used = [browser.for_navigation() for _ in range(5)]
+    # counted again from the start of the new session
+    assert checked == [2, 4, 2]
+    # the 4th page already goes to the new session
+    assert used == [drivers[0]] * 3 + [drivers[1]] * 2
+    assert browser.n_recycled == 1
+
+
+def test_no_recycling_without_a_memory_reading(monkeypatch):
+    browser, drivers = make_browser(max_pages=None, max_mb=1000, memory_check_every=1)
+    monkeypatch.setattr(browser, 'memory_mb', lambda: None)
+    for _ in range(3):
+        browser.for_navigation()
+    assert len(drivers) == 1 and browser.n_recycled == 0
+
+
+def test_dead_session_is_replaced():
+    browser, drivers = make_browser(max_pages=10, max_mb=None)
+    browser.for_navigation()
+    browser.for_navigation()
+    drivers[0].alive = False
+    assert browser.for_navigation() is drivers[1]
+    assert drivers[0].quitted
+    assert browser.n_crashes == 1 and browser.n_recycled == 0
+    # the page count starts over with the new session
+    assert browser.pages == 1
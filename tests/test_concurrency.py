@@ -0,0 +1,51 @@
+import pytest
+
+from concurrency import AIMDController
+from fetch_outcome import FetchError, OK, BLOCKED, TRANSIENT
+
+
+def test_limit_grows_by_one_after_a_good_window():
+    controller = AIMDController(initial=2, max_limit=3, window=5, target_p95=1.0)
+    for _ in range(5):
+        controller.acquire()
+        controller.release(0.1, OK)
+    assert controller.limit == 3 and controller.n_increases == 1
+    for _ in range(5):
+        controller.acquire()
+        controller.release(0.1, OK)
+    assert controller.limit == 3  # capped
+
+
+def test_limit_is_halved_on_slow_or_failing_windows():
+    controller = AIMDController(initial=8, window=4, target_p95=1.0, max_error_rate=0.2)
+    for latency in (0.1, 0.1, 0.1, 5.0):
+        controller.acquire()
+        controller.release(latency, OK)
+    assert controller.limit == 4 and controller.last_p95 == 5.0
+    for outcome in (OK, TRANSIENT, TRANSIENT, OK):
+        controller.acquire()
+        controller.release(0.1, outcome)
+    assert controller.limit == 2 and controller.last_error_rate == 0.5
+
+
+def test_blocked_cuts_the_limit_right_away():
+    controller = AIMDController(initial=4, min_limit=1, window=20)
+    with pytest.raises(FetchError):
+        with controller.slot():
+            raise FetchError(BLOCKED, 'u')
+    assert controller.limit == 2 and controller.in_flight == 0
+    for _ in range(3):
+        controller.acquire()
+        controller.release(0.1, BLOCKED)
+    assert controller.limit == 1
+
+
+def test_metrics_are_exported(tmp_path):
+    path = str(tmp_path / 'metrics.prom')
+    controller = AIMDController(initial=2, window=1, metrics_path=path)
+    with controller.slot():
+        pass
+    with open(path) as f:
+        metrics = dict(line.split() for line in f)
+    assert metrics['scraper_concurrency_limit'] == '3'
+    assert metrics['scraper_concurrency_increases_total'] == '1'
@@ -0,0 +1,32 @@
+import importlib
+
+import pytest
+
+import config
+
+
+@pytest.fixture
+def reload_config(monkeypatch):
+    def reload(**env):
+        for name in ('SCRAPER_MODE', 'SCRAPER_SINK', 'SCRAPER_CSV', 'SCRAPER_WORKER_ID'):
+            monkeypatch.delenv(name, raising=False)
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        return importlib.reload(config)
+    yield reload
+    monkeypatch.undo()
+    importlib.reload(config)
+
+
+def test_workers_write_to_the_shared_sinks(reload_config):
+    worker = reload_config(SCRAPER_MODE='worker', SCRAPER_WORKER_ID='node-2')
+    assert worker.SINK == 'sqlite,parquet'
+    assert worker.CSV_PATH == 'flats-node-2.csv'
+    single = reload_config()
+    assert (single.SINK, single.CSV_PATH) == ('csv,parquet', 'flats.csv')
+
+
+def test_a_worker_asked_for_csv_gets_its_own_file(reload_config):
+    worker = reload_config(SCRAPER_MODE='worker', SCRAPER_WORKER_ID='node-3', SCRAPER_SINK='csv',
+                           SCRAPER_CSV='out/flats.csv')
+    assert (worker.SINK, worker.CSV_PATH) == ('csv', 'out/flats-node-3.csv')
@@ -0,0 +1,66 @@
+import pytest
+
+from dedup import MinHasher, NearDuplicateIndex, cluster_listings, house_number, listing_tokens
+from records import Listing
+
+FEATURES = ('balcony', 'lift', 'dishwasher', 'cellar')
+
+
+def flat(listing_ID, address='Seestrasse 12, 8002 Zürich', floor='3', surface='81 m²', rooms='3.5',
+         features=FEATURES):
+    return Listing(listing_ID=listing_ID, address=address, postcode='8002', floor=floor,
+                   surface_living=surface, n_of_rooms=rooms, features=features,
+                   link=f'https://www.homegate.ch/rent/{listing_ID}')
+
+
+def test_house_number_is_not_the_postcode():
+    assert house_number('Seestrasse 12a, 8002 Zürich') == '12a'
+    assert house_number('Seestr. 7 b, 8002 Zürich') == '7b'
+    assert house_number('8002 Zürich') is None
+    assert house_number(None) is None
+
+
+def test_reposted_flat_joins_the_cluster_of_the_first_listing():
+    index = NearDuplicateIndex()
+    assert index.add(flat('4000000001')) == '4000000001'
+    # same flat, surface rounded differently by the second agency
+    assert index.add(flat('4000000002', surface='80 m²')) == '4000000001'
+    assert index.add(flat('4000000003', address='Bahnhofstrasse 1, 8001 Zürich', rooms='5.5',
+                          features=('garden',))) == '4000000003'
+    assert index.clusters() == {'4000000001': ['4000000001', '4000000002']}
+    # adding again keeps the cluster
+    assert index.add(flat('4000000002')) == '4000000001'
+
+
+@pytest.mark.parametrize('other', [{'floor': '4'}, {'address': 'Seestrasse 14, 8002 Zürich'}])
+def test_floor_and_house_number_must_match(other):
+    index = NearDuplicateIndex(threshold=0.5)
+    index.add(flat('4000000001'))
+    assert index.add(flat('4000000002', **other)) == '4000000002'
+    assert index.clusters() == {}
+
+
+def test_listings_with_few_tokens_are_not_clustered():
+    index = NearDuplicateIndex()
+    sparse = [Listing(listing_ID=f'400000000{i}', postcode='8002', link=f'https://www.homegate.ch/rent/400000000{i}')
+              for i in range(3)]
+    assert all(len(listing_tokens(listing)) < 3 for listing in sparse)
+    assert [listing.cluster_id for listing in cluster_listings(sparse, index)] == [None, None, None]
+    assert len(index) == 0
+
+
+def test_signature_of_empty_set_is_refused():
+    with pytest.raises(ValueError):
+        MinHasher().signature(set())
+
+
+def test_load_applies_the_threshold(tmp_path):
+    path = str(tmp_path / 'dedup.pkl')
+    index = NearDuplicateIndex.load(path, threshold=0.9)
+    index.add(flat('4000000001'))
+    index.save(path)
+    loaded = NearDuplicateIndex.load(path, threshold=0.6)
+    assert loaded.threshold == 0.6 and len(loaded) == 1
+    assert NearDuplicateIndex.load(path).threshold == 0.9
+    with pytest.raises(ValueError):
+        NearDuplicateIndex.load(path, num_perm=64, bands=8)
@@ -0,0 +1,71 @@
+import json
+import os
+
+from diagnostics import FailureCapture
+
+URL = 'https://www.homegate.ch/rent/4000000001'
+
+
+class FakeDriver:
+
+    current_url = URL
+    page_source = '<html><body>Access denied</body></html>'
+
+    def get_screenshot_as_png(self):
+        return b'\x89PNG' + b'\0' * 596
+
+
+def index_lines(root):
+    with open(os.path.join(root, 'index.jsonl')) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_first_failures_of_a_class_are_kept_then_one_in_sample_every(tmp_path):
+    capture = FailureCapture(str(tmp_path), keep_first=2, sample_every=3)
+    kept = [capture.should_capture('listing:timeout:TimeoutException') for _ in range(7)]
+    assert kept == [True, True, True, False, False, True, False]
+    # counted per class
+    assert capture.should_capture('result_page:blocked:FetchError')
+    capture.close()
+
+
+def test_artifacts_are_written_by_the_background_thread(tmp_path):
+    capture = FailureCapture(str(tmp_path), keep_first=1, sample_every=0)
+    artifact_id = capture.capture(FakeDriver(), URL, 'listing', ValueError('no title'))
+    assert capture.capture(FakeDriver(), URL, 'listing', ValueError('no title')) is None
+    capture.close()
+    [entry] = index_lines(tmp_path)
+    assert entry['id'] == artifact_id
+    assert entry['key'] == '4000000001' and entry['error_class'] == 'listing:transient:ValueError'
+    assert sorted(os.path.basename(path) for path in entry['files']) == [f'{artifact_id}.html.gz',
+                                                                        f'{artifact_id}.png']
+    assert entry['bytes'] == sum(os.path.getsize(path) for path in entry['files'])
+
+
+def test_ids_of_workers_sharing_the_folder_dont_collide(tmp_path):
+    first, second = FailureCapture(str(tmp_path)), FailureCapture(str(tmp_path))
+    ids = {capture.capture(None, URL, 'listing', ValueError('no title')) for capture in (first, second)}
+    first.close()
+    second.close()
+    assert len(ids) == 2
+    assert len(index_lines(tmp_path)) == 2
+
+
+def test_oldest_artifacts_are_evicted_above_the_quota_and_stay_evicted(tmp_path):
+    # room for one artifact of ~650 bytes
+    capture = FailureCapture(str(tmp_path), quota_mb=1000 / 2 ** 20)
+    ids = [capture.capture(FakeDriver(), URL, 'listing', ValueError(str(n))) for n in range(3)]
+    capture.close()
+    lines = index_lines(tmp_path)
+    assert [line['id'] for line in lines if line.get('evicted')] == ids[:2]
+    kept = [line for line in lines if not line.get('evicted')]
+    assert [os.path.exists(path) for line in kept for path in line['files']] == [False, False, False, False,
+                                                                               True, True]
+
+    # a new run (or worker) goes on from the index
+    capture = FailureCapture(str(tmp_path), quota_mb=1000 / 2 ** 20)
+    assert [artifact_id for artifact_id, _, _ in capture.artifacts] == ids[2:]
+    assert capture.bytes == kept[-1]['bytes']
+    capture.capture(FakeDriver(), URL, 'listing', ValueError('3'))
+    capture.close()
+    assert [line['id'] for line in index_lines(tmp_path) if line.get('evicted')] == ids
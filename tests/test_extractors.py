@@ -0,0 +1,48 @@
+import os
+
+from extractors import extract_listing, extract_result_cards, extract_search_summary
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+URL = 'https://www.homegate.ch/rent/4001111111'
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_extract_listing():
+    listing = extract_listing(fixture('listing.html'), URL, card_hash='card')
+    assert (listing.listing_ID, listing.object_ref) == ('4001111111', 'SEE-12-3')
+    assert listing.address == 'Seestrasse 12, 8002 Zürich'
+    assert listing.postcode == '8002'
+    assert (listing.net_rent, listing.expenses, listing.rent) == ('CHF 2,250.–', 'CHF 200.–', 'CHF 2,450.–')
+    assert (listing.type, listing.n_of_rooms, listing.floor, listing.n_of_floors) == ('Apartment', '3.5', '3rd floor', '5')
+    assert (listing.surface_living, listing.year_built, listing.availability) == ('81 m²', '1965', 'Immediately')
+    assert listing.floor_space is None
+    assert listing.features == ('balcony', 'lift')
+    assert listing.description == 'Bright flat with a view of the lake.'
+    assert (listing.link, listing.card_hash) == (URL, 'card')
+    assert listing.detail_hash
+
+
+def test_detail_hash_follows_the_content():
+    html = fixture('listing.html')
+    first = extract_listing(html, URL)
+    assert extract_listing(html, URL + '?lang=de').detail_hash == first.detail_hash
+    assert extract_listing(html.replace('2,450', '2,500'), URL).detail_hash != first.detail_hash
+
+
+def test_extract_listing_of_an_empty_page():
+    listing = extract_listing('<html><body></body></html>', URL)
+    assert listing.listing_ID is None and listing.features is None and listing.link == URL
+
+
+def test_extract_result_cards_and_summary():
+    html = fixture('result_page.html')
+    cards = extract_result_cards(html, 'https://www.homegate.ch/rent/real-estate/city-zurich/matching-list?ep=1')
+    assert [url for url, _ in cards] == ['https://www.homegate.ch/rent/4001111111',
+                                         'https://www.homegate.ch/rent/4001111112']
+    assert len({card_hash for _, card_hash in cards}) == 2
+    summary = extract_search_summary(html, len(cards))
+    assert summary.total_listings == 1234
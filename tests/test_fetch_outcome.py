@@ -0,0 +1,103 @@
+import pytest
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from fetch_outcome import (RetryPolicy, FetchError, classify_page, classify_exception, OK, NOT_FOUND,
+                           ERROR_PAGE, BLOCKED, DRIVER_CRASH, TRANSIENT)
+
+
+@pytest.mark.parametrize('title, outcome', [
+    ('3.5 room flat in Zurich', OK),
+    ('Flat for CHF 2404 a month', OK),
+    ('Loft, 404 m² in Zurich', OK),
+    ('404 - Page not found', NOT_FOUND),
+    ('404', NOT_FOUND),
+    ('Seite nicht gefunden | Homegate', NOT_FOUND),
+    ('An error has occurred', ERROR_PAGE),
+    ('Just a moment...', BLOCKED),
+])
+def test_classify_page_title(title, outcome):
+    assert classify_page(title, '<html></html>') == outcome
+
+
+def test_classify_page_blocking_source_markers():
+    assert classify_page('Homegate', '<script src="https://geo.captcha-delivery.com/c.js">') == BLOCKED
+
+
+@pytest.mark.parametrize('status, outcome', [(404, NOT_FOUND), (410, NOT_FOUND), (429, BLOCKED),
+                                             (403, BLOCKED), (200, OK)])
+def test_classify_page_status_wins_over_title(status, outcome):
+    assert classify_page('Flat in Zurich', '', status=status) == outcome
+
+
+def test_classify_exception():
+    assert classify_exception(FetchError(NOT_FOUND, 'u')) == NOT_FOUND
+    assert classify_exception(TimeoutException()) == TRANSIENT
+    assert classify_exception(WebDriverException('chrome not reachable')) == DRIVER_CRASH
+    assert classify_exception(ValueError('?')) == TRANSIENT
+
+
+def make_policy(**kwargs):
+    sleeps = []
+    return RetryPolicy(sleep=sleeps.append, **kwargs), sleeps
+
+
+def test_retry_policy_retries_transient_errors_with_backoff():
+    policy, sleeps = make_policy(max_attempts=3, base_delay=1)
+    calls = iter([TimeoutException(), TimeoutException(), 'html'])
+
+    def fetch():
+        result = next(calls)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert policy.call(fetch, 'u') == 'html'
+    assert policy.counts == {TRANSIENT: 2, OK: 1}
+    assert len(sleeps) == 2 and 0 <= sleeps[0] <= 1 and 0 <= sleeps[1] <= 2
+    assert policy.retry_budget == 198
+
+
+def test_retry_policy_does_not_retry_a_removed_listing():
+    policy, sleeps = make_policy()
+
+    def fetch():
+        raise FetchError(NOT_FOUND, 'u', '404')
+
+    with pytest.raises(FetchError) as raised:
+        policy.call(fetch, 'u')
+    assert raised.value.outcome == NOT_FOUND and sleeps == []
+
+
+def test_retry_policy_gives_up_after_max_attempts():
+    policy, _ = make_policy(max_attempts=2)
+    crashes = []
+
+    def fetch():
+        raise WebDriverException('chrome not reachable')
+
+    with pytest.raises(FetchError) as raised:
+        policy.call(fetch, 'u', on_crash=lambda: crashes.append(1))
+    assert raised.value.outcome == DRIVER_CRASH
+    assert crashes == [1]  # restarted before the one retry
+
+
+def test_retry_policy_block_pause_doubles_up_to_the_max():
+    policy, sleeps = make_policy(block_pause=100, max_block_pause=300)
+    for _ in range(3):
+        policy.record(BLOCKED)
+    assert policy.current_block_pause == 300
+    policy.wait_if_paused()
+    assert 200 < sleeps[-1] <= 300  # the longest pause asked for so far
+    policy.record(OK)
+    assert policy.current_block_pause == 100
+
+
+def test_retry_policy_budget_is_shared():
+    policy, _ = make_policy(retry_budget=1, max_attempts=5)
+
+    def fetch():
+        raise TimeoutException()
+
+    with pytest.raises(FetchError):
+        policy.call(fetch, 'u')
+    assert policy.counts[TRANSIENT] == 2 and policy.retry_budget == 0
@@ -0,0 +1,50 @@
+import pytest
+
+from fingerprints import FingerprintIndex, fingerprint, listing_key
+from records import Listing
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = FingerprintIndex(str(tmp_path / 'fingerprints.sqlite'))
+    yield index
+    index.close()
+
+
+def listing(detail_hash='d1', card_hash='c1', link='https://www.homegate.ch/rent/4001111111'):
+    return Listing(listing_ID='4001111111', link=link, card_hash=card_hash, detail_hash=detail_hash)
+
+
+def test_listing_key_ignores_the_language_of_the_link():
+    assert listing_key('https://www.homegate.ch/mieten/4001111111') == '4001111111'
+    assert listing_key('https://www.homegate.ch/en/rent/4001111111?ref=x') == '4001111111'
+    assert listing_key('https://www.homegate.ch/') == 'https://www.homegate.ch/'
+
+
+def test_fingerprint_is_stable():
+    assert fingerprint({'a': 1, 'b': [2]}) == fingerprint({'b': [2], 'a': 1})
+    assert fingerprint('x') != fingerprint('y')
+
+
+def test_a_listing_is_only_skipped_once_written(index):
+    first = listing()
+    assert index.card_changed(first.link, 'c1') and index.detail_changed(first)
+    # the sink never took it: the next crawl loads it again
+    assert index.card_changed(first.link, 'c1') and index.detail_changed(first)
+    index.mark_written(first)
+    assert not index.card_changed(first.link, 'c1')
+    assert not index.card_changed('https://www.homegate.ch/mieten/4001111111', 'c1')
+    assert index.card_changed(first.link, 'c2')
+    assert len(index) == 1 and index.is_known(first.link)
+
+
+def test_changed_details_are_written_again(index):
+    index.mark_written(listing())
+    # the card changed but the details didn't: nothing to write, the new card is remembered
+    assert not index.detail_changed(listing(card_hash='c2'))
+    assert not index.card_changed(listing().link, 'c2')
+    changed = listing(detail_hash='d2', card_hash='c3')
+    assert index.detail_changed(changed)
+    index.mark_written(changed)
+    assert not index.detail_changed(changed)
+    assert index.n_unchanged_details == 2
@@ -0,0 +1,70 @@
+import datetime
+import warnings
+
+import pandas as pd
+import pytest
+
+from archive import Archive
+from import_legacy import convert_chunk, detect_schema, import_legacy
+
+NOTEBOOK_CSV = '''\
+,flat_ID,address,price,N_of_rooms,floor,N_of_floors,Surface_living,Floor_space,Room_height,Last_refurbishment,Year_built,Features,link
+0,4001111111,"Seestrasse 12, 8002 Zürich","CHF 2,450.–",3.5,3rd floor,5,81 m²,,2.5 m,2018,1965,"['balcony', ""children's room""]",https://www.homegate.ch/rent/4001111111
+1,4001111112,"Bahnhofstrasse 1, 8001 Zürich",On request,2,,,,,,,,[],https://www.homegate.ch/rent/4001111112
+'''
+
+
+def read(text, tmp_path, name='flats.csv'):
+    path = tmp_path / name
+    path.write_text(text)
+    return path, pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+@pytest.mark.parametrize('columns, schema', [
+    (['listing_ID', 'object_ref', 'rent', 'link'], 'scraper'),
+    (['flat_ID', 'address', 'price'], 'notebook'),
+    (['flat_id', 'Address', 'Price'], 'notebook'),
+    (['Address', 'Price', 'Space', 'Rooms', 'flat_link'], 'results'),
+    (['address', 'price'], 'results'),
+])
+def test_detect_schema(columns, schema):
+    assert detect_schema(columns) == schema
+
+
+def test_detect_schema_unknown_layout():
+    with pytest.raises(ValueError):
+        detect_schema(['foo', 'bar'])
+
+
+def test_notebook_columns_are_mapped_in_any_case(tmp_path):
+    _, df = read(NOTEBOOK_CSV, tmp_path)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        out = convert_chunk(df, 'notebook')
+    first = out.iloc[0]
+    assert first['listing_ID'] == '4001111111' and first['rent'] == 'CHF 2,450.–'
+    assert (first['n_of_rooms'], first['n_of_floors'], first['surface_living']) == ('3.5', '5', '81 m²')
+    assert (first['room_height'], first['last_refurbishment'], first['year_built']) == ('2.5 m', '2018', '1965')
+    assert first['features'] == ['balcony', "children's room"]
+    assert first['postcode'] == '8002' and first['site'] == 'homegate'
+    assert out.iloc[1]['floor_space'] is None and out.iloc[1]['features'] is None
+
+
+def test_results_layout_takes_the_id_from_the_link(tmp_path):
+    _, df = read('Address,Price,Space,Rooms,flat_link\n'
+                 '"Seestrasse 12, 8002 Zürich",CHF 2450,81,3.5,https://www.homegate.ch/rent/4001111111\n'
+                 'No link,CHF 1,1,1,\n', tmp_path)
+    out = convert_chunk(df, 'results')
+    assert list(out['listing_ID']) == ['4001111111']
+    assert out.iloc[0]['surface_living'] == '81' and out.iloc[0]['postcode'] == '8002'
+
+
+def test_import_into_the_archive_skips_what_it_has(tmp_path):
+    path, _ = read(NOTEBOOK_CSV, tmp_path, 'flats_2024-03-01.csv')
+    root = str(tmp_path / 'archive')
+    assert import_legacy([str(path)], root, workers=1) == 2
+    assert import_legacy([str(path)], root, workers=1) == 0
+    rows = {row['listing_ID']: row for row in Archive(root).query().to_table().to_pylist()}
+    first = rows['4001111111']
+    assert first['crawl_date'] == datetime.date(2024, 3, 1)
+    assert (first['rent'], first['n_of_rooms'], first['year_built']) == (2450.0, 3.5, 1965)
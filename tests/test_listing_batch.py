@@ -0,0 +1,40 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from listing_batch import ListingBatch, CATEGORICAL_COLUMNS
+from records import Listing, LISTING_FIELDS
+
+LISTINGS = [
+    Listing(listing_ID='1', postcode='8004', rent='CHF 2,450.–', features=('balcony', 'lift'),
+            link='https://www.homegate.ch/rent/1'),
+    Listing(listing_ID='2', postcode='8004', features=(), link='https://www.homegate.ch/rent/2'),
+    Listing(listing_ID='3', postcode='8001', link='https://www.homegate.ch/rent/3'),
+]
+
+
+def test_to_arrow_types_and_values():
+    batch = ListingBatch(LISTINGS).to_arrow()
+    assert batch.schema.names == LISTING_FIELDS and batch.num_rows == 3
+    for name in CATEGORICAL_COLUMNS:
+        assert pa.types.is_dictionary(batch.schema.field(name).type)
+    postcode = batch.column('postcode')
+    assert postcode.dictionary.to_pylist() == ['8004', '8001'] and postcode.to_pylist() == ['8004', '8004', '8001']
+    assert batch.schema.field('rent').type == pa.string()
+    features = batch.column('features')
+    assert pa.types.is_dictionary(features.type.value_type)
+    assert features.to_pylist() == [['balcony', 'lift'], [], None]
+
+
+def test_round_trip_and_clear():
+    batch = ListingBatch(LISTINGS)
+    assert list(batch) == LISTINGS
+    df = batch.to_pandas()
+    assert str(df['postcode'].dtype) == 'category' and list(df['listing_ID']) == ['1', '2', '3']
+    batch.clear()
+    assert len(batch) == 0 and batch.to_arrow().num_rows == 0
+
+
+def test_to_parquet(tmp_path):
+    path = str(tmp_path / 'flats.parquet')
+    ListingBatch(LISTINGS).to_parquet(path)
+    assert pq.read_table(path).column('listing_ID').to_pylist() == ['1', '2', '3']
@@ -0,0 +1,19 @@
+import threading
+
+from pipeline import run_pipeline, fan_out
+
+
+def test_run_pipeline_parses_every_fetched_item_in_processes():
+    cleaned = []
+    results = run_pipeline(lambda: iter(range(20)),
+                           lambda item: None if item % 5 == 0 else (f'item {item}',),
+                           str.upper, n_fetchers=3, n_parsers=2, queue_size=4,
+                           thread_cleanup=lambda: cleaned.append(threading.current_thread().name))
+    assert sorted(results) == sorted(f'ITEM {i}' for i in range(20) if i % 5)
+    assert sorted(cleaned) == ['fetcher-0', 'fetcher-1', 'fetcher-2', 'producer']
+
+
+def test_fan_out_returns_exceptions_as_results():
+    results = dict(fan_out([1, 2, 0], lambda x: 10 // x, n_threads=2))
+    assert results[1] == 10 and results[2] == 5
+    assert isinstance(results[0], ZeroDivisionError)
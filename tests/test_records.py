@@ -0,0 +1,31 @@
+import pickle
+import sys
+
+from records import Listing, Search
+
+
+def fresh(text):
+    # an equal string that is not the interned object
+    return ''.join(list(text))
+
+
+def test_listing_interns_repeated_values():
+    listing = Listing(postcode=fresh('8004'), features=(fresh('balcony'),), address=fresh('Somewhere 1'))
+    assert listing.postcode is sys.intern('8004')
+    assert listing.features[0] is sys.intern('balcony')
+    assert not hasattr(listing, '__dict__')
+
+
+def test_listing_is_interned_again_after_unpickling():
+    listing = Listing(listing_ID='1', postcode='8004', floor='3', features=('balcony', 'lift'),
+                      link='https://www.homegate.ch/rent/1')
+    loaded = pickle.loads(pickle.dumps(listing, protocol=pickle.HIGHEST_PROTOCOL))
+    assert loaded == listing
+    assert loaded.postcode is sys.intern('8004')
+    assert loaded.floor is sys.intern('3')
+    assert all(feature is sys.intern(feature) for feature in loaded.features)
+
+
+def test_search_page_url():
+    assert Search('https://x.ch/list').page_url(2) == 'https://x.ch/list?ep=2'
+    assert Search('https://x.ch/list?a=1', page_param='page').page_url(3) == 'https://x.ch/list?a=1&page=3'
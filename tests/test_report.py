@@ -0,0 +1,117 @@
+import datetime
+import os
+import pickle
+import shutil
+import types
+
+import pytest
+
+from archive import ParquetSink
+from fingerprints import fingerprint
+from records import Listing
+from report import ReportBuilder, inventory
+
+D1, D2, D3 = datetime.date(2026, 5, 1), datetime.date(2026, 5, 8), datetime.date(2026, 5, 15)
+
+
+def link(name):
+    return f'https://www.homegate.ch/rent/{name}'
+
+
+def crawl(root, crawl_date, *listings):
+    sink = ParquetSink(root, crawl_date=crawl_date)
+    for name, postcode, rent in listings:
+        sink.write(Listing(listing_ID=name, postcode=postcode, rent=rent, address=f'{name}strasse 1',
+                           link=link(name)))
+    sink.close()
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path / 'archive')
+
+
+@pytest.fixture
+def builder(tmp_path, root):
+    return lambda: ReportBuilder(root, str(tmp_path / 'cache'), workers=1)
+
+
+def summarize(builder):
+    # update_summaries with the partitions read in this process, returns the ones read
+    read = []
+    pool = types.SimpleNamespace(map=lambda fn, jobs: [read.append(files) or fn(files) for files in jobs])
+    partitions = inventory(builder.archive_root)
+    builder.update_summaries(partitions, pool)
+    return sorted(key for key, files in partitions.items() if files in read)
+
+
+def test_only_new_and_changed_partitions_are_read_again(root, builder):
+    crawl(root, D1, ('a', '8004', '2000'), ('b', '8005', '1500'))
+    assert summarize(builder()) == [('2026-05-01', '8004'), ('2026-05-01', '8005')]
+    # the summaries are kept in the cache across reports
+    assert summarize(builder()) == []
+    crawl(root, D2, ('a', '8004', '2100'))
+    assert summarize(builder()) == [('2026-05-08', '8004')]
+    # a file added to a partition
+    crawl(root, D1, ('c', '8005', '1800'))
+    report = builder()
+    assert summarize(report) == [('2026-05-01', '8005')]
+    assert report.summaries[('2026-05-01', '8005')][1]['rents'] == {link('b'): 1500.0, link('c'): 1800.0}
+    # a partition removed from the archive
+    shutil.rmtree(os.path.join(root, 'crawl_date=2026-05-01', 'postcode=8005'))
+    report = builder()
+    assert summarize(report) == []
+    assert sorted(report.summaries) == [('2026-05-01', '8004'), ('2026-05-08', '8004')]
+
+
+def test_summaries_of_an_older_version_are_read_again(root, builder):
+    crawl(root, D1, ('a', '8004', '2000'))
+    report = builder()
+    partitions = inventory(root)
+    old = {key: (fingerprint(files), {'n': 1, 'rent_hist': None, 'rent_sum': 2000.0, 'n_rent': 1, 'links': set()})
+           for key, files in partitions.items()}
+    with open(report.summaries_path, 'wb') as f:
+        pickle.dump(old, f)
+    report = builder()
+    assert summarize(report) == [('2026-05-01', '8004')]
+    assert report.summaries[('2026-05-01', '8004')][1]['rents'] == {link('a'): 2000.0}
+
+
+def test_listings_count_once_and_rents_change_against_the_last_earlier_rent(root, builder):
+    crawl(root, D1, ('a', '8004', '2000'), ('b', '8004', '1500'))
+    # a unchanged: not written again on the second crawl (SKIP_UNCHANGED)
+    crawl(root, D2, ('b', '8004', '1500'))
+    crawl(root, D3, ('a', '8004', '2100'), ('c', '8004', '3000'))
+    report = builder()
+    summarize(report)
+    partitions = inventory(root)
+    sections = {section.id: (section, data) for section, data in report.plan(partitions, {
+        key: summary_hash for key, (summary_hash, _) in report.summaries.items()})}
+
+    assert sections['overview'][1]['rows'] == [('8004', 3, pytest.approx(2200))]
+    assert sections['hist:8004'][1]['rent_hist'].sum() == 3
+    assert sections['new'][1]['known'] == {link('a'), link('b')}
+    changes, data = sections['changes']
+    assert changes.title == 'Rent changes on 2026-05-15'
+    assert data['old_rents'] == {link('a'): 2000.0}
+
+
+def test_sections_are_only_rendered_when_their_partitions_changed(root, builder, capsys, tmp_path):
+    crawl(root, D1, ('a', '8004', '2000'), ('b', '8005', '1500'))
+    crawl(root, D2, ('a', '8004', '2100'))
+    output = str(tmp_path / 'report.pdf')
+    builder().build(output)
+    assert '5 sections, 5 rendered, 3 of 3 partitions read' in capsys.readouterr().out
+    pngs = set(os.listdir(os.path.join(tmp_path, 'cache')))
+
+    builder().build(output)
+    assert '0 rendered, 0 of 3 partitions read' in capsys.readouterr().out
+
+    crawl(root, D3, ('c', '8005', '1700'))
+    builder().build(output)
+    # everything but the histogram of 8004, whose partitions didn't change
+    assert '5 sections, 4 rendered, 1 of 4 partitions read' in capsys.readouterr().out
+    current = set(os.listdir(os.path.join(tmp_path, 'cache')))
+    assert {name for name in pngs & current if name.endswith('.png')} == \
+        {name for name in pngs if name.startswith('hist-8004-')}
+    assert os.path.getsize(output)
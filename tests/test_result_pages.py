@@ -0,0 +1,67 @@
+import types
+
+import pytest
+
+import web_scraper
+from fetch_outcome import FetchError, ERROR_PAGE, TRANSIENT
+from records import ResultPage, Search, SearchSummary
+
+SEARCH_URL = 'https://www.homegate.ch/rent/real-estate/city-zurich/matching-list'
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    # fetch_result_page stubbed: `pages.total` listings at 20 a page (None: not shown),
+    # `pages.failing` page -> exception, `pages.fetched` the pages asked for
+    state = types.SimpleNamespace(total=None, failing={}, fetched=[])
+
+    def fetch_result_page(search, page, policy, with_summary=False):
+        state.fetched.append(page)
+        if page in state.failing:
+            raise state.failing[page]
+        summary = SearchSummary(total_listings=state.total, listings_per_page=20) if with_summary else None
+        url = search.page_url(page)
+        return ResultPage(search, page, url, [f'https://www.homegate.ch/rent/40000{page:05d}'], {}, summary)
+
+    monkeypatch.setattr(web_scraper, 'fetch_result_page', fetch_result_page)
+    monkeypatch.setattr(web_scraper, 'get_browser', lambda: types.SimpleNamespace(consented_sites={'homegate'}))
+    return state
+
+
+def crawl(search, page_fetchers):
+    return [page.page for page in web_scraper.iter_result_pages(search, web_scraper.RetryPolicy(), page_fetchers)]
+
+
+def test_fan_out_fetches_every_page_of_the_total(pages):
+    pages.total = 95
+    result = crawl(SEARCH_URL, page_fetchers=3)
+    assert result[0] == 1 and sorted(result) == [1, 2, 3, 4, 5]
+    assert sorted(pages.fetched) == [1, 2, 3, 4, 5]
+
+
+def test_max_pages_caps_the_fan_out(pages):
+    pages.total = 500
+    assert sorted(crawl(Search(SEARCH_URL, first_page=2, max_pages=3), page_fetchers=3)) == [2, 3, 4]
+    assert sorted(pages.fetched) == [2, 3, 4]
+
+
+def test_page_by_page_without_a_total(pages):
+    pages.failing = {4: FetchError(ERROR_PAGE, 'past the last page')}
+    assert crawl(SEARCH_URL, page_fetchers=3) == [1, 2, 3]
+    assert pages.fetched == [1, 2, 3, 4]
+
+
+def test_max_pages_caps_the_page_by_page_crawl(pages):
+    assert crawl(Search(SEARCH_URL, max_pages=2), page_fetchers=3) == [1, 2]
+
+
+def test_fan_out_skips_a_page_that_failed(pages):
+    pages.total = 100
+    pages.failing = {3: FetchError(TRANSIENT, 'timeout'), 4: ValueError('bad html')}
+    assert sorted(crawl(SEARCH_URL, page_fetchers=2)) == [1, 2, 5]
+    assert sorted(pages.fetched) == [1, 2, 3, 4, 5]
+
+
+def test_no_pages_when_the_first_one_fails(pages):
+    pages.failing = {1: FetchError(ERROR_PAGE, 'nothing found')}
+    assert crawl(SEARCH_URL, page_fetchers=2) == []
@@ -0,0 +1,62 @@
+import csv
+
+from records import Listing, LISTING_FIELDS
+from listing_batch import read_flats_csv
+from sinks import CsvSink
+
+
+def test_csv_sink_streams_rows_without_keeping_listings(tmp_path):
+    path = tmp_path / 'flats.csv'
+    sink = CsvSink(str(path))
+    sink.write(Listing(listing_ID='1', link='https://www.homegate.ch/rent/1', features=('balcony',)))
+    sink.write(Listing(listing_ID='2', link='https://www.homegate.ch/rent/2'))
+    assert sink.n_written == 2
+    assert not any(isinstance(value, (list, tuple)) for value in vars(sink).values())
+    sink.close()
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == LISTING_FIELDS
+    assert [row['listing_ID'] for row in rows] == ['1', '2']
+    assert rows[0]['features'] == "['balcony']"
+    assert rows[1]['features'] == ''
+
+
+def read_ids(path):
+    with open(path, newline='') as f:
+        return [row['listing_ID'] for row in csv.DictReader(f)]
+
+
+def test_csv_sink_append_keeps_the_listings_of_earlier_crawls(tmp_path):
+    path = str(tmp_path / 'flats.csv')
+    for ids in (['1', '2'], ['3']):
+        sink = CsvSink(path, append=True)
+        for listing_ID in ids:
+            sink.write(Listing(listing_ID=listing_ID, link=f'https://www.homegate.ch/rent/{listing_ID}'))
+        sink.close()
+    assert read_ids(path) == ['1', '2', '3']
+    # without append a crawl starts the file over
+    sink = CsvSink(path)
+    sink.write(Listing(listing_ID='4'))
+    sink.close()
+    assert read_ids(path) == ['4']
+
+
+def test_csv_sink_append_moves_a_file_with_other_columns_aside(tmp_path):
+    path = tmp_path / 'flats.csv'
+    path.write_text('flat_ID,price\n1,2000\n')
+    sink = CsvSink(str(path), append=True)
+    sink.write(Listing(listing_ID='2'))
+    sink.close()
+    assert read_ids(path) == ['2']
+    [old] = tmp_path.glob('flats-*.csv')
+    assert old.read_text() == 'flat_ID,price\n1,2000\n'
+
+
+def test_read_flats_csv_keeps_the_last_version_of_a_listing(tmp_path):
+    path = str(tmp_path / 'flats.csv')
+    sink = CsvSink(path, append=True)
+    sink.write(Listing(listing_ID='1', rent='2000', link='https://www.homegate.ch/rent/1'))
+    sink.write(Listing(listing_ID='1', rent='2100', link='https://www.homegate.ch/rent/1'))
+    sink.close()
+    df = read_flats_csv(path)
+    assert len(df) == 1 and df.loc[0, 'rent'] == 2100
@@ -0,0 +1,50 @@
+import numpy as np
+
+from text_analytics import Normalizer, TextIndex
+
+ROWS = [
+    ('1', '8004', 'The flat was renovated in 2020 and is very bright, with a view of the lake'),
+    ('2', '8004', 'Die Wohnung ist hell und wurde 2019 renoviert, mit Aussicht auf den See'),
+    ('3', '8001', 'Small studio near the station'),
+]
+
+
+def test_language_and_stemming_of_a_listing():
+    normalizer = Normalizer()
+    assert normalizer.language('the flat is bright and has a view'.split()) == 'en'
+    assert normalizer.language('die wohnung ist hell und hat aussicht'.split()) == 'de'
+    assert normalizer.terms('Helle Wohnung') == normalizer.terms('hellen Wohnungen')[:1] + normalizer.terms('Wohnung')
+
+
+def test_index_only_adds_new_listings():
+    index = TextIndex()
+    assert index.add(ROWS) == 3
+    assert index.add(ROWS + [('4', '8001', 'Attika with terrace')]) == 1
+    assert len(index) == 4 and index.counts().shape == (4, len(index.terms))
+
+
+def test_keywords_match_listings_of_both_languages():
+    index = TextIndex()
+    index.add(ROWS)
+    scores = index.keyword_scores(['renovated', 'renoviert', 'bright'])
+    # an English keyword is stemmed like the English listing it is in, and the other way round
+    assert scores.loc['1', 'renovated'] > 0
+    assert scores.loc['2', 'renoviert'] > 0
+    assert scores.loc['1', 'bright'] > 0
+    assert scores.loc['3'].sum() == 0
+
+
+def test_tfidf_rows_are_normalized():
+    index = TextIndex()
+    index.add(ROWS)
+    norms = np.sqrt(np.asarray(index.tfidf().multiply(index.tfidf()).sum(axis=1)).ravel())
+    assert np.allclose(norms, 1)
+
+
+def test_save_and_load(tmp_path):
+    index = TextIndex()
+    index.add(ROWS)
+    path = str(tmp_path / 'text_index.pkl')
+    index.save(path)
+    loaded = TextIndex.load(path)
+    assert loaded.keys == index.keys and loaded.add(ROWS) == 0
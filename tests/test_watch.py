@@ -0,0 +1,88 @@
+import types
+
+import pytest
+
+import web_scraper
+from fingerprints import FingerprintIndex
+from records import Listing, ResultPage
+
+SEARCH_URL = 'https://www.homegate.ch/rent/real-estate/city-zurich/matching-list?o=dateCreated-desc'
+
+
+def url(number):
+    return f'https://www.homegate.ch/rent/40000000{number:02d}'
+
+
+class StopWatching(Exception):
+    pass
+
+
+@pytest.fixture
+def watch(monkeypatch, tmp_path):
+    # run_watch with the result pages stubbed: `rounds` holds the cards of every page, one
+    # dict per poll; the sleep after the last poll stops the loop
+    state = types.SimpleNamespace(rounds=[], polled=[], intervals=[], written=[], notified=[])
+    monkeypatch.setattr(web_scraper.config, 'WATCH_SEARCHES', [SEARCH_URL])
+    monkeypatch.setattr(web_scraper.config, 'WATCH_PAGES', 2)
+    monkeypatch.setattr(web_scraper.config, 'WATCH_MIN_INTERVAL', 60)
+    monkeypatch.setattr(web_scraper.config, 'WATCH_MAX_INTERVAL', 200)
+
+    def poll_result_page(search, page, policy):
+        state.polled.append((len(state.intervals), page))
+        urls = state.rounds[len(state.intervals)].get(page, [])
+        return ResultPage(search, page, search.page_url(page), urls, {link: f'card-{link}' for link in urls})
+
+    def sleep(seconds):
+        state.intervals.append(seconds)
+        if len(state.intervals) == len(state.rounds):
+            raise StopWatching
+
+    monkeypatch.setattr(web_scraper, 'poll_result_page', poll_result_page)
+    monkeypatch.setattr(web_scraper, 'scrape_listing',
+                        lambda link, card_hash: Listing(listing_ID=link[-2:], link=link, card_hash=card_hash))
+    monkeypatch.setattr(web_scraper.time, 'sleep', sleep)
+    monkeypatch.setattr(web_scraper.random, 'uniform', lambda low, high: 1.0)
+    state.index = FingerprintIndex(str(tmp_path / 'fingerprints.sqlite'))
+    state.sink = types.SimpleNamespace(write=lambda listing: state.written.append(listing.link))
+    state.notifier = types.SimpleNamespace(notify=lambda listing: state.notified.append(listing.link))
+
+    def run():
+        with pytest.raises(StopWatching):
+            web_scraper.run_watch(state.sink, web_scraper.RetryPolicy(), state.index, [state.notifier])
+
+    state.run = run
+    yield state
+    state.index.close()
+
+
+def test_first_poll_of_an_empty_index_is_only_recorded(watch):
+    watch.rounds = [{1: [url(3), url(2)], 2: [url(1)]},
+                    {1: [url(4), url(3), url(2)], 2: [url(1)]}]
+    watch.run()
+    assert watch.written == [url(3), url(2), url(1), url(4)]
+    assert watch.notified == [url(4)]
+    assert all(watch.index.is_known(url(n)) for n in range(1, 5))
+
+
+def test_known_listings_are_not_scraped_again(watch):
+    for n in (1, 2):
+        watch.index.mark_written(Listing(listing_ID=str(n), link=url(n)))
+    watch.rounds = [{1: [url(3), url(2)], 2: [url(1)]}]
+    watch.run()
+    # the index wasn't empty: the first poll notifies too
+    assert watch.written == watch.notified == [url(3)]
+    # page 2 is polled since page 1 had a new listing, it stops at page 2 without one
+    assert watch.polled == [(0, 1), (0, 2)]
+
+
+def test_interval_grows_when_nothing_is_new_and_shrinks_with_new_listings(watch):
+    watch.rounds = [{1: [url(1)]},
+                    {1: [url(1)]},
+                    {1: [url(1)]},
+                    {1: [url(2), url(1)]},
+                    {1: [url(3), url(2), url(1)]}]
+    watch.run()
+    # the baseline counts as nothing new; capped at WATCH_MAX_INTERVAL, halved down to WATCH_MIN_INTERVAL
+    assert watch.intervals == [90, 135, 200, 100, 60]
+    # sorted by newest: page 2 is only polled after a page 1 with new listings
+    assert watch.polled == [(0, 1), (0, 2), (1, 1), (2, 1), (3, 1), (3, 2), (4, 1), (4, 2)]
@@ -0,0 +1,95 @@
+import types
+
+import pytest
+
+import web_scraper
+
+
+def test_debugging_ports_are_reused(monkeypatch):
+    monkeypatch.setattr(web_scraper.config, 'CHROME_DEBUGGING_PORT', 9222)
+    monkeypatch.setattr(web_scraper.config, 'BROWSER_SERVICE', '')
+    monkeypatch.setattr(web_scraper, '_debugging_ports', set())
+    first, second = web_scraper._take_debugging_port(), web_scraper._take_debugging_port()
+    assert (first, second) == (9222, 9223)
+    # a recycled browser gives its port back, the next one takes it again
+    driver = types.SimpleNamespace(debugging_port=first, quit=lambda: None)
+    web_scraper.close_driver(driver)
+    assert web_scraper._take_debugging_port() == 9222
+    assert web_scraper._take_debugging_port() == 9224
+
+
+class FakeSession:
+
+    def __init__(self, status_code, text=''):
+        self.response = types.SimpleNamespace(status_code=status_code, text=text)
+
+    def get(self, url, timeout=None):
+        return self.response
+
+
+def test_blocked_poll_backs_off_the_controller_and_uses_the_browser(monkeypatch):
+    controller = web_scraper.AIMDController(initial=4, min_limit=1)
+    monkeypatch.setattr(web_scraper, 'concurrency', controller)
+    limiter = types.SimpleNamespace(acquire=lambda: acquired_in_flight.append(controller.in_flight))
+    acquired_in_flight = []
+    monkeypatch.setattr(web_scraper, 'rate_limiter_for', lambda url: limiter)
+    monkeypatch.setattr(web_scraper._http, 'session', FakeSession(429), raising=False)
+    browser_pages = []
+    monkeypatch.setattr(web_scraper, 'fetch_result_page',
+                        lambda search, page, policy: browser_pages.append(page) or 'from the browser')
+    policy = web_scraper.RetryPolicy(sleep=lambda seconds: None)
+    search = web_scraper.Search('https://www.homegate.ch/rent/real-estate/city-zurich/matching-list')
+
+    assert web_scraper.poll_result_page(search, 1, policy) == 'from the browser'
+    assert controller.limit == 2 and controller.in_flight == 0
+    assert policy.counts == {'blocked': 1}
+    assert browser_pages == [1]
+    assert acquired_in_flight == [0]  # the token is taken before the slot
+
+
+def test_run_single_records_only_the_listings_the_sink_took(monkeypatch, tmp_path):
+    from fingerprints import FingerprintIndex
+    from records import Listing
+
+    listings = [Listing(listing_ID=str(i), link=f'https://www.homegate.ch/rent/400000000{i}', detail_hash=str(i))
+                for i in range(2)]
+    monkeypatch.setattr(web_scraper.config, 'FETCHERS', 0)
+    monkeypatch.setattr(web_scraper.config, 'SEARCH_URLS', ['https://www.homegate.ch/rent/list'])
+    monkeypatch.setattr(web_scraper, 'iter_listings', lambda search, policy, index: iter(listings))
+
+    class FailingSink:
+        def write(self, listing, worker=None):
+            if listing.listing_ID == '1':
+                raise OSError('disk full')
+
+    index = FingerprintIndex(str(tmp_path / 'fingerprints.sqlite'))
+    with pytest.raises(OSError):
+        web_scraper.run_single(FailingSink(), web_scraper.RetryPolicy(), index)
+    assert index.is_known(listings[0].link)
+    assert not index.is_known(listings[1].link)
+    index.close()
+
+
+def test_worker_flushes_the_sink_before_acking(monkeypatch, tmp_path):
+    from records import Listing
+    from work_queue import SQLiteWorkQueue
+
+    queue = SQLiteWorkQueue(str(tmp_path / 'queue.sqlite'))
+    url = 'https://www.homegate.ch/rent/4000000001'
+    queue.enqueue(web_scraper.config.CRAWL_ID, 'listing', url, {'url': url})
+    monkeypatch.setattr(web_scraper, 'scrape_listing', lambda url, card_hash: Listing(listing_ID='1', link=url))
+    events = []
+    ack = queue.ack
+    monkeypatch.setattr(queue, 'ack', lambda task: events.append('ack') or ack(task))
+
+    class BufferingSink:
+        def write(self, listing, worker=None):
+            events.append('write')
+
+        def flush(self):
+            events.append('flush')
+
+    web_scraper.run_worker(queue, BufferingSink(), web_scraper.RetryPolicy())
+    assert events == ['write', 'flush', 'ack']
+    assert queue.is_drained(web_scraper.config.CRAWL_ID)
+    queue.close()
@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+from work_queue import SQLiteWorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / 'queue.sqlite'), lease_seconds=60, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def expire_leases(queue):
+    queue.conn.execute("UPDATE tasks SET lease_until = ? WHERE status = 'leased'", (time.time() - 1,))
+
+
+def test_enqueue_deduplicates_per_crawl(queue):
+    assert queue.enqueue('c1', 'listing', 'a', {'url': 'a'})
+    assert not queue.enqueue('c1', 'listing', 'a', {'url': 'a'})
+    assert queue.enqueue('c2', 'listing', 'a', {'url': 'a'})
+    assert queue.stats('c1')['pending'] == 1
+
+
+def test_pages_are_leased_before_listings(queue):
+    queue.enqueue('c', 'listing', 'l1')
+    queue.enqueue('c', 'page', 'p1')
+    task = queue.lease('c', 'w1')
+    assert (task.kind, task.key, task.attempts, task.worker) == ('page', 'p1', 1, 'w1')
+    assert queue.lease('c', 'w1').key == 'l1'
+    assert queue.lease('c', 'w1') is None
+
+
+def test_ack_drains_the_crawl(queue):
+    queue.enqueue('c', 'listing', 'l1')
+    task = queue.lease('c', 'w1')
+    assert not queue.is_drained('c')
+    assert queue.ack(task)
+    assert queue.is_drained('c')
+    assert queue.stats('c')['done'] == 1
+
+
+def test_failed_task_is_retried_then_buried(queue):
+    queue.enqueue('c', 'listing', 'l1')
+    assert queue.fail(queue.lease('c', 'w1'), ValueError('boom')) == 'pending'
+    task = queue.lease('c', 'w2')
+    assert task.attempts == 2
+    assert queue.fail(task, ValueError('boom')) == 'dead'
+    assert queue.lease('c', 'w1') is None
+    assert queue.is_drained('c')
+
+
+def test_expired_lease_is_taken_over(queue):
+    queue.enqueue('c', 'listing', 'l1')
+    first = queue.lease('c', 'w1')
+    assert queue.lease('c', 'w2') is None
+    expire_leases(queue)
+    second = queue.lease('c', 'w2')
+    assert second.id == first.id and second.worker == 'w2'
+    # the first worker lost the lease: it can't ack, fail or renew the task any more
+    assert not queue.extend(first)
+    assert not queue.ack(first)
+    assert queue.fail(first, ValueError('late')) is None
+    assert queue.stats('c')['leased'] == 1
+    assert queue.ack(second)
+
+
+def test_task_dies_when_its_last_lease_expires(queue):
+    queue.enqueue('c', 'listing', 'l1')
+    queue.lease('c', 'w1')
+    expire_leases(queue)
+    queue.lease('c', 'w2')
+    expire_leases(queue)
+    assert queue.lease('c', 'w3') is None
+    assert queue.stats('c')['dead'] == 1
+
+
+def test_keep_leased_renews_the_lease(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / 'queue.sqlite'), lease_seconds=0.3)
+    queue.enqueue('c', 'listing', 'l1')
+    task = queue.lease('c', 'w1')
+    with queue.keep_leased(task):
+        time.sleep(0.6)  # two lease periods
+        assert queue.lease('c', 'w2') is None
+    assert queue.ack(task)
+    queue.close()
+
+
+def test_rollback_journal_for_shared_disks(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / 'queue.sqlite'), journal_mode='DELETE')
+    assert queue.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    queue.close()
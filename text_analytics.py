@@ -0,0 +1,259 @@
+# Keyword analytics over the listing texts ('bright', 'view', 'Attika', ...).
+#
+# The description and the features of every listing are tokenized in batches: lower case,
+# German/English stop words removed, words stemmed (nltk's Snowball stemmers when nltk is
+# installed, a light suffix stripper otherwise) and umlauts folded, so 'hell', 'helle' and
+# 'hellen' are one term. Stemming is cached per distinct word, not per listing.
+#
+# The TextIndex keeps the vocabulary and a sparse term count matrix between runs; after a
+# crawl only the listings it hasn't seen yet are tokenized. TF-IDF weights are computed from
+# the counts when asked for (a sparse operation, cheap next to the tokenizing), so they
+# always reflect the whole corpus.
+#
+#   python text_analytics.py    updates the index from the archive, prints the top terms per
+#                               postcode and writes the keyword scores of every listing
+
+import collections
+import os
+import pickle
+import re
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import config
+from fingerprints import listing_key
+
+try:
+    from nltk.stem.snowball import SnowballStemmer
+except ImportError:  # light suffix stripping instead
+    SnowballStemmer = None
+
+STOPWORDS_DE = set('''
+aber alle allem allen aller alles als also am an ander andere anderen auch auf aus bei beim bin bis
+bist da damit dann das dass dem den denn der des dich die dies diese diesem diesen dieser dieses dir
+doch dort du durch ein eine einem einen einer eines er es etwa euch euer für gegen hat hatte hier
+ihr ihre im in ins ist jede jedem jeden jeder jedes kann kein keine man mehr mit muss nach nicht noch
+nur ob oder ohne sehr sein seine sich sie sind so sowie über um und uns unter vom von vor war was
+weil wenn wer werden wie wir wird wo zu zum zur zwischen sowohl bzw ca inkl
+'''.split())
+STOPWORDS_EN = set('''
+a about above after all also an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her
+here hers him his how i if in into is it its itself just me more most my no nor not of off on once
+only or other our out over own same she should so some such than that the their them then there
+these they this those through to too under until up very was we were what when where which while who
+whom why will with would you your yours incl approx
+'''.split())
+STOPWORDS = STOPWORDS_DE | STOPWORDS_EN
+UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss', 'é': 'e', 'è': 'e', 'à': 'a'})
+WORD = re.compile(r'[^\W\d_]{2,}')
+SUFFIXES = {'de': ('ungen', 'ung', 'en', 'er', 'es', 'e', 'n', 's'),
+            'en': ('ies', 'ing', 'ed', 'es', 's')}
+
+
+class Normalizer:
+
+    def __init__(self):
+        self.stemmers = ({'de': SnowballStemmer('german'), 'en': SnowballStemmer('english')}
+                         if SnowballStemmer is not None else None)
+        # (language, word) -> term, the same words come back in every listing
+        self.cache = {}
+
+    def __getstate__(self):
+        # the cache is rebuilt quickly, no need to pickle it with the index
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    @staticmethod
+    def language(words):
+        de = sum(word in STOPWORDS_DE for word in words)
+        en = sum(word in STOPWORDS_EN for word in words)
+        return 'en' if en > de else 'de'
+
+    def _stem(self, word, language):
+        if self.stemmers is not None:
+            return self.stemmers[language].stem(word)
+        for suffix in SUFFIXES[language]:
+            if len(word) - len(suffix) >= 4 and word.endswith(suffix):
+                return word[:-len(suffix)] + ('y' if suffix == 'ies' else '')
+        return word
+
+    def terms(self, text, language=None):
+        words = WORD.findall(text.lower())
+        language = language or self.language(words)
+        terms = []
+        for word in words:
+            if word in STOPWORDS:
+                continue
+            term = self.cache.get((language, word))
+            if term is None:
+                term = self.cache[language, word] = self._stem(word, language).translate(UMLAUTS)
+            terms.append(term)
+        return terms
+
+    def batch(self, texts):
+        return [self.terms(text) for text in texts]
+
+
+def listing_text(description, features):
+    return ' '.join(filter(None, [description or '', ' '.join(features or ())]))
+
+
+def rows_from_listings(listings):
+    # (key, postcode, text) of Listing records
+    for listing in listings:
+        yield listing_key(listing.link), listing.postcode, listing_text(listing.description, listing.features)
+
+
+def rows_from_archive(root):
+    # (key, postcode, text) of the listings in the Parquet archive, one record batch at a time
+    from archive import Archive
+    archive = Archive(root)
+    names = archive.dataset().schema.names
+    columns = [name for name in ('link', 'postcode', 'description', 'features') if name in names]
+    for batch in archive.query().columns(*columns).batches():
+        data = batch.to_pydict()
+        n = batch.num_rows
+        for link, postcode, description, features in zip(data['link'], data.get('postcode', [None] * n),
+                                                         data.get('description', [None] * n),
+                                                         data.get('features', [None] * n)):
+            yield listing_key(link), postcode, listing_text(description, features)
+
+
+class TextIndex:
+
+    def __init__(self):
+        self.normalizer = Normalizer()
+        self.vocabulary = {}  # term -> column
+        self.terms = []  # column -> term
+        self.df = np.zeros(0, dtype=np.int64)  # number of listings with the term
+        self.rows = {}  # listing key -> row
+        self.keys = []  # row -> listing key
+        self.postcodes = []  # row -> postcode
+        self.blocks = []  # term count matrices of the batches added since the last counts()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, rows, batch_size=5000):
+        # Tokenizes the listings the index hasn't seen yet, returns how many were added
+        added = 0
+        batch = []
+        for key, postcode, text in rows:
+            if key in self.rows or not text:
+                continue
+            self.rows[key] = len(self.keys) + len(batch)
+            batch.append((key, postcode, text))
+            if len(batch) >= batch_size:
+                added += self._add_batch(batch)
+                batch = []
+        if batch:
+            added += self._add_batch(batch)
+        return added
+
+    def _add_batch(self, batch):
+        documents = self.normalizer.batch([text for _, _, text in batch])
+        data, row_index, columns = [], [], []
+        for row, terms in enumerate(documents):
+            for term, count in collections.Counter(terms).items():
+                column = self.vocabulary.get(term)
+                if column is None:
+                    column = self.vocabulary[term] = len(self.terms)
+                    self.terms.append(term)
+                data.append(count)
+                row_index.append(row)
+                columns.append(column)
+        block = sparse.csr_matrix((np.array(data, dtype=np.float32), (row_index, columns)),
+                                  shape=(len(batch), len(self.terms)))
+        self.df = np.concatenate([self.df, np.zeros(len(self.terms) - len(self.df), dtype=np.int64)])
+        self.df += np.bincount(columns, minlength=len(self.terms))
+        self.blocks.append(block)
+        self.keys.extend(key for key, _, _ in batch)
+        self.postcodes.extend(postcode for _, postcode, _ in batch)
+        return len(batch)
+
+    def counts(self):
+        # listings x terms, the blocks are merged into one so the next call is free
+        n_terms = len(self.terms)
+        blocks = [block if block.shape[1] == n_terms else
+                  sparse.csr_matrix((block.data, block.indices, block.indptr), shape=(block.shape[0], n_terms))
+                  for block in self.blocks]
+        self.blocks = [sparse.vstack(blocks, format='csr')] if blocks else []
+        return self.blocks[0] if self.blocks else sparse.csr_matrix((0, n_terms), dtype=np.float32)
+
+    def idf(self):
+        return (np.log((1 + len(self.keys)) / (1 + self.df)) + 1).astype(np.float32)
+
+    def tfidf(self):
+        # l2 normalized tf-idf rows, sublinear tf (1 + log count)
+        counts = self.counts().copy()
+        counts.data = 1 + np.log(counts.data)
+        weights = counts.multiply(self.idf()).tocsr()
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ weights
+
+    def keyword_terms(self, keyword):
+        # the listings are stemmed in their own language: look the keyword up as both
+        terms = dict.fromkeys(self.normalizer.terms(keyword, 'de') + self.normalizer.terms(keyword, 'en'))
+        return [self.vocabulary[term] for term in terms if term in self.vocabulary]
+
+    def keyword_scores(self, keywords):
+        # listing key x keyword, the tf-idf weight of the keyword's terms in the listing
+        weights = self.tfidf()
+        scores = {}
+        for keyword in keywords:
+            columns = self.keyword_terms(keyword)
+            scores[keyword] = (np.asarray(weights[:, columns].sum(axis=1)).ravel() if columns
+                               else np.zeros(len(self.keys), dtype=np.float32))
+        return pd.DataFrame(scores, index=pd.Index(self.keys, name='key'))
+
+    def top_terms_by_postcode(self, n=10):
+        # postcode -> [(term, weight)] of the terms with the highest average tf-idf weight in
+        # the listings of the postcode
+        postcodes = pd.Categorical([str(postcode) for postcode in self.postcodes])
+        groups = sparse.csr_matrix((np.ones(len(self.keys), dtype=np.float32),
+                                    (postcodes.codes, np.arange(len(self.keys)))),
+                                   shape=(len(postcodes.categories), len(self.keys)))
+        sizes = np.asarray(groups.sum(axis=1)).ravel()
+        totals = (groups @ self.tfidf()).toarray() / sizes[:, None]
+        top = {}
+        for postcode, row in zip(postcodes.categories, totals):
+            best = np.argsort(row)[::-1][:n]
+            top[postcode] = [(self.terms[column], float(row[column])) for column in best if row[column] > 0]
+        return top
+
+    def save(self, path):
+        self.counts()
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def with_keyword_scores(df, index, keywords, prefix='kw_'):
+    # the keyword scores as columns of a dataframe of listings (with a 'link' column)
+    scores = index.keyword_scores(keywords).add_prefix(prefix)
+    keys = df['link'].map(listing_key).rename('_key')
+    return df.join(keys).join(scores, on='_key').drop(columns='_key')
+
+
+if __name__ == '__main__':
+    index = TextIndex.load(config.TEXT_INDEX)
+    added = index.add(rows_from_archive(config.ARCHIVE_ROOT))
+    index.save(config.TEXT_INDEX)
+    print(f'{added} new listings analyzed, {len(index)} listings and {len(index.terms)} terms in the index')
+    for postcode, terms in sorted(index.top_terms_by_postcode(config.TOP_TERMS).items()):
+        print(f"{postcode}: {', '.join(term for term, _ in terms)}")
+    index.keyword_scores(config.KEYWORDS).to_csv(config.KEYWORD_SCORES)
+    print(f'Keyword scores written to {config.KEYWORD_SCORES}')
@@ -22,240 +22,556 @@
 # - Write the notebook to clean the data, filter by keyword and analyze and plot the data 
 # - Write the notebook to connect to the gmaps API and filter by distance
  
+import datetime
 import time
-import re
+import itertools
+import random
+import threading
+from urllib.parse import urlsplit
 import numpy as np
 import pandas as pd
-import traceback  # For detailed exception logging
+import requests
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import WebDriverException
+
+import config
+from work_queue import SQLiteWorkQueue
+from sinks import make_sink
+from fetch_outcome import RetryPolicy, FetchError, check_page, classify_status, NOT_FOUND, ERROR_PAGE, BLOCKED
+from records import Search, ResultPage
+from pipeline import run_pipeline, fan_out
+from rate_limit import RateLimiter
+from concurrency import AIMDController
+from browser import ManagedBrowser, chromedriver_path
+from browser_service import lease_driver, release_driver
+from dedup import NearDuplicateIndex, cluster_listings
+from notify import make_notifiers
+import diagnostics
+from diagnostics import capture_failure
+from fingerprints import FingerprintIndex
+from sites import SITES, site_for_url, parse_listing
 
 # I was having issues because ChromeDriverManager().install() matches the version of the Chrome browser installed on the system and 
 # it was too old, so I had to update the version on the system manually.
-options = Options()
-options.add_argument("--headless")  # Run in headless mode
-options.add_argument("--disable-gpu")  # Disable GPU acceleration
-options.add_argument("--no-sandbox")  # Disable sandboxing
-options.add_argument('--disable-dev-shm-usage')
-options.add_argument("--window-size=1500,1080")
-options.add_argument("--disable-blink-features=AutomationControlled")  # Avoid detection
-options.add_argument("--remote-debugging-port=9222")  # Debugging port
-driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-print(time.ctime())
-# stablishing the connection with HOMEGATE
-driver.get("https://www.homegate.ch/mieten/immobilien/ort-zuerich/trefferliste")
-print(driver.title)
-
-# ## Defining function to get the elements from the website
-
-def listing_ID():
+def make_driver():
+    # a warm Chrome of the browser service (browser_service.py) when there is one
+    if config.BROWSER_SERVICE:
+        driver = lease_driver(config.BROWSER_SERVICE, client=f'{config.WORKER_ID}/{threading.current_thread().name}')
+        if driver is not None:
+            return driver
+    options = Options()
+    options.add_argument("--headless")  # Run in headless mode
+    options.add_argument("--disable-gpu")  # Disable GPU acceleration
+    options.add_argument("--no-sandbox")  # Disable sandboxing
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument("--window-size=1500,1080")
+    options.add_argument("--disable-blink-features=AutomationControlled")  # Avoid detection
+    # Debugging port, every open browser of this process has its own one.
+    # Set CHROME_DEBUGGING_PORT=0 when running several workers on the same machine
+    port = _take_debugging_port() if config.CHROME_DEBUGGING_PORT else None
+    if port is not None:
+        options.add_argument(f"--remote-debugging-port={port}")
     try:
-        listing_ID = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "dl.ListingTechReferences_techReferencesList_jlZwL"))
-            )
-        id_raw= listing_ID.text
-        id_flat = re.split('[\n]', id_raw)[1]
-        return id_flat
-    except:
-        print(f'No id_flat value for {url}')
-        return None
-
-def object_ref():
+        driver = webdriver.Chrome(service=Service(chromedriver_path()), options=options)
+    except Exception:
+        _release_debugging_port(port)
+        raise
+    driver.debugging_port = port
+    return driver
+
+# Debugging ports of the open browsers. Recycled and replaced browsers take the lowest free
+# port again, so a long crawl stays in a small range of ports.
+_debugging_ports = set()
+_debugging_ports_lock = threading.Lock()
+
+def _take_debugging_port():
+    with _debugging_ports_lock:
+        port = config.CHROME_DEBUGGING_PORT
+        while port in _debugging_ports:
+            port += 1
+        _debugging_ports.add(port)
+        return port
+
+def _release_debugging_port(port):
+    with _debugging_ports_lock:
+        _debugging_ports.discard(port)
+
+def close_driver(driver, retire=False):
+    # leased Chromes go back to the browser service, the others are closed
     try:
-        object_ref = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "dl.ListingTechReferences_techReferencesList_jlZwL"))
-            )
-        ref_raw= object_ref.text
-        ref_flat = re.split('[\n]', ref_raw)[3]
-        return ref_flat
-    except:
-        print(f'No object_ref value for {url}')
-        return None 
-
-        
-def flat_address():
+        if not (config.BROWSER_SERVICE and release_driver(config.BROWSER_SERVICE, driver, retire)):
+            driver.quit()
+    finally:
+        _release_debugging_port(getattr(driver, 'debugging_port', None))
+
+# All the browsers of this process share one page load budget per host
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def rate_limiter_for(url):
+    host = urlsplit(url).hostname
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter(config.REQUESTS_PER_SECOND, config.REQUESTS_BURST)
+        return _rate_limiters[host]
+
+# and the number of page loads in flight, adapted to how fast and how well the site answers
+concurrency = AIMDController(initial=config.CONCURRENCY_INITIAL, min_limit=config.CONCURRENCY_MIN,
+                             max_limit=config.CONCURRENCY_MAX, target_p95=config.CONCURRENCY_TARGET_P95,
+                             max_error_rate=config.CONCURRENCY_MAX_ERROR_RATE,
+                             window=config.CONCURRENCY_WINDOW, metrics_path=config.CONCURRENCY_METRICS)
+
+# Every thread has its own browser (the pipeline fetches on several threads), managed by a
+# ManagedBrowser that recycles it when it gets too big and replaces it when it crashes
+_local = threading.local()
+
+def get_browser():
+    if getattr(_local, 'browser', None) is None:
+        _local.browser = ManagedBrowser(make_driver, max_pages=config.BROWSER_MAX_PAGES,
+                                        max_mb=config.BROWSER_MAX_MB,
+                                        memory_check_every=config.BROWSER_MEMORY_CHECK_EVERY,
+                                        home_urls={name: site.home_url for name, site in SITES.items()},
+                                        close_driver=close_driver)
+    return _local.browser
+
+def get_driver():
+    return get_browser().get()
+
+def quit_driver():
+    browser = getattr(_local, 'browser', None)
+    _local.browser = None
+    if browser is not None:
+        browser.quit()
+
+def restart_driver(reopen_url=None):
+    # used after a driver crash, the page being loaded is retried by the RetryPolicy
+    get_browser().replace(reopen_url)
+
+
+def load_listing(listing_url):
+    # Opens the listing in a new tab and returns (html, url) once the 'Main Information' is
+    # rendered, or None when the page could not be scraped. Raises FetchError right after
+    # loading when the page is an error/blocked/removed page.
+    site = site_for_url(listing_url)
+    browser = get_browser()
+    driver = browser.for_navigation()
+    driver.execute_script("window.open('');")  # Open a new tab
+    driver.switch_to.window(driver.window_handles[1])  # Switch to new tab
     try:
-        address_find = WebDriverWait(driver, 5).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "address.AddressDetails_address_i3koO"))
-                    )
-        address = address_find.text
-        return address
-    except:
-        print(f'None address value for {url}')
-        return None
-
-def postcode():
-    try:
-        postcode_find = WebDriverWait(driver, 5).until(
-            EC.presence_of_element_located((By.XPATH, "//address[contains(@class, 'AddressDetails_address')]//span[2]"))
-        )
-        postcode_text = postcode_find.text.split()[0]  
-        return postcode_text
-    except:
-        print(f'No postcode value for {url}')
-        return None
-
-def net_rent_price():
-    try:
-        # Find the element containing the net_rent
-        net_rent_elements = WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.XPATH, "//div[@data-test='costs']//dl//dt/following-sibling::dd/span[contains(., 'CHF')]"))
+        rate_limiter_for(listing_url).acquire()  # waiting for a token doesn't hold a slot
+        with concurrency.slot():
+            driver.get(listing_url)
+            check_page(driver, listing_url)
+        if not site.prepare_listing(browser, listing_url):
+            return None
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_all_elements_located((By.XPATH, site.listing_ready))
             )
-        if len(net_rent_elements) > 1:
-            net_rent_price = net_rent_elements[0].text 
-        else:
-            net_rent_price = None  # Handle cases where there is only one element
-
-        return net_rent_price
-    
+        return driver.page_source, driver.current_url
     except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        print(f'No net price value for {url}')
+        capture_failure(driver, listing_url, 'listing', e)
+        raise
+    finally:
+        try:
+            driver.close()  # Close the tab
+            driver.switch_to.window(driver.window_handles[0])  # Switch back to main page
+        except WebDriverException:
+            pass  # the session is gone, the retry policy restarts the driver
+
+def scrape_listing(listing_url, card_hash=None):
+    loaded = load_listing(listing_url)
+    if loaded is None:
         return None
+    html, current_url = loaded
+    return parse_listing(html, current_url, card_hash)
 
-def expenses_price():
+def load_result_page(url):
+    # Navigates the main window to a result page, returns its html
+    driver = get_browser().for_navigation()
     try:
-        # Find the element containing the expenses
-        expenses_elements = WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located ((By.XPATH, "//div[@data-test='costs']//dl//dt/following-sibling::dd/span[contains(., 'CHF')]"))
-            )
-        if len(expenses_elements) > 1:
-            expenses_price = expenses_elements[1].text
-        else:
-            expenses_price = None
-
-        return expenses_price
-    
+        rate_limiter_for(url).acquire()  # waiting for a token doesn't hold a slot
+        with concurrency.slot():
+            driver.get(url)
+            check_page(driver, url)
+        WebDriverWait(driver, 10).until(
+                    EC.presence_of_all_elements_located((By.XPATH, site_for_url(url).results_ready))
+                    )
+        return driver.page_source
     except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        print(f'No expenses value for {url}')
-        return None
-
-def rent_price():
+        capture_failure(driver, url, 'result_page', e)
+        raise
+
+
+def _as_search(search):
+    return search if isinstance(search, Search) else site_for_url(search).search(search)
+
+def fetch_result_page(search, page, policy, with_summary=False):
+    # Raises FetchError (error_page/not_found past the last page)
+    url = search.page_url(page)
+    site = site_for_url(url)
+    html = policy.call(lambda: load_result_page(url), url, on_crash=restart_driver)
+    cards = site.parse_result_cards(html, url)
+    summary = site.parse_search_summary(html, len(cards)) if with_summary else None
+    return ResultPage(search, page, url, [card_url for card_url, _ in cards], dict(cards), summary)
+
+def _report_page_error(page, e):
+    if e.outcome in (ERROR_PAGE, NOT_FOUND):
+        print(f"No more pages to navigate (page {page}).")
+    else:
+        print(f"Could not navigate to page {page}: {e}")
+
+def iter_result_pages(search, policy=None, page_fetchers=1):
+    # Yields the ResultPage of every page of the search. The first page tells us how many
+    # results/pages there are, the other pages are then fetched by page_fetchers threads at
+    # once (within the rate limit), in whatever order they complete. When the first page
+    # doesn't show the total we go page by page until we get past the last one.
+    search = _as_search(search)
+    policy = policy or RetryPolicy()
     try:
-        # Find the element containing the rent
-        rent_element = driver.find_element(By.XPATH, "//div[@data-test='costs']//dl//dd[strong]//span[contains(., 'CHF')]")
-        rent_price = rent_element.text
-        return rent_price
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        print(f'No rent price value for {url}')
-        return None
+        first_page = fetch_result_page(search, search.first_page, policy, with_summary=True)
+    except FetchError as e:
+        _report_page_error(search.first_page, e)
+        return
+    site_for_url(first_page.url).accept_cookies(get_browser(), first_page.url)
+    print(f'{time.ctime()} Navigated to page {search.first_page}.')
+    yield first_page
+
+    last_page = first_page.summary.last_page()
+    if search.max_pages is not None:
+        cap = search.first_page + search.max_pages - 1
+        last_page = min(last_page, cap) if last_page else cap
+    if last_page is not None:
+        pages = range(search.first_page + 1, last_page + 1)
+        print(f'{first_page.summary.total_listings} listings on {last_page} pages.')
+    else:
+        pages = itertools.count(search.first_page + 1)
+
+    if last_page is not None and page_fetchers > 1:
+        for page, result in fan_out(pages, lambda page: fetch_result_page(search, page, policy),
+                                    page_fetchers, thread_cleanup=quit_driver):
+            if isinstance(result, FetchError):
+                _report_page_error(page, result)
+                continue
+            if isinstance(result, Exception):
+                print(f"Could not read page {page}: {result}")
+                continue
+            print(f'{time.ctime()} Navigated to page {page}.')
+            yield result
+        return
+
+    for page in pages:
+        try:
+            result_page = fetch_result_page(search, page, policy)
+        except FetchError as e:
+            _report_page_error(page, e)
+            return
+        print(f'{time.ctime()} Navigated to page {page}.')
+        yield result_page
+
+def iter_changed_cards(result_pages, index=None):
+    # (url, card_hash) of the listings to load: all of them, or with an index only the new
+    # ones and the ones whose card on the result page changed since the last visit
+    for result_page in result_pages:
+        for listing_url in result_page.listing_urls:
+            card_hash = result_page.card_hashes.get(listing_url)
+            if index is None or index.card_changed(listing_url, card_hash):
+                yield listing_url, card_hash
+
+def iter_listings(search, policy=None, index=None):
+    # Yields a Listing for every flat of the search, one at a time. With a FingerprintIndex
+    # unchanged listings are skipped (see iter_changed_cards and FingerprintIndex.detail_changed);
+    # call index.mark_written(listing) once a listing is stored
+    policy = policy or RetryPolicy()
+    result_pages = iter_result_pages(search, policy, config.PAGE_FETCHERS)
+    for listing_url, card_hash in iter_changed_cards(result_pages, index):
+        try:
+            listing = policy.call(lambda: scrape_listing(listing_url, card_hash), listing_url,
+                                  on_crash=restart_driver)
+        except FetchError as e:
+            print(f"Error scraping {listing_url}: {e}")
+            continue  # Skip to next listing
+        if listing is not None and (index is None or index.detail_changed(listing)):
+            yield listing
 
-def flat_availability():
-    try:
-        if 'Available from:' in main_info_dict:
-            return main_info_dict.get('Available from:')
-        else:
-            raise Exception('error')
-    except:
-        return None
-    
-def flat_type():
-    try:
-        if 'Type:' in main_info_dict:
-            return main_info_dict.get('Type:')
-        else:
-            raise Exception('error')
-    except:
-        return None
+def iter_listings_parallel(search, policy=None, index=None, n_fetchers=2, n_parsers=None, queue_size=16):
+    # Same as iter_listings, but the result pages are walked on one thread, the listings are
+    # loaded by n_fetchers threads (one browser each) and parsed in a pool of n_parsers processes
+    policy = policy or RetryPolicy()
 
-def flat_n_rooms():
-    try:
-        if 'No. of rooms:' in main_info_dict:
-            return main_info_dict.get('No. of rooms:')
-        else:
-            raise Exception('error')        
-    except:
-        return None
+    def produce():
+        return iter_changed_cards(iter_result_pages(search, policy, config.PAGE_FETCHERS), index)
 
-def flat_floor():
-    try:
-        if 'Floor:' in main_info_dict:
-            return main_info_dict.get('Floor:')
-        else:
-            raise Exception('error')        
-    except:
-        return None
-    
-def flat_n_floors():
-    try:
-        if 'Number of floors:' in main_info_dict:
-            return main_info_dict.get('Number of floors:')
-        else:
-            raise Exception('error')        
-    except:
-        return None
-    
-def flat_surface():
-    try:
-        if 'Surface living:' in main_info_dict:
-            return main_info_dict.get('Surface living:')
-        else:
-            raise Exception('error')        
-    except:
-        return None
-    
-def flat_floor_space():
-    try:
-        if 'Floor space:' in main_info_dict:
-            return main_info_dict.get('Floor space:')
-        else:
-            raise Exception('error')        
-    except:
-        return None
-    
-def flat_Room_height():
-    try:
-        if 'Room height:' in main_info_dict:
-            return main_info_dict.get('Room height:')
-        else:
-            raise Exception('error')        
-    except:
-        return None
-
-def flat_last_refurbishment():
+    def fetch(card):
+        listing_url, card_hash = card
+        try:
+            loaded = policy.call(lambda: load_listing(listing_url), listing_url, on_crash=restart_driver)
+        except FetchError as e:
+            print(f"Error scraping {listing_url}: {e}")
+            return None
+        if loaded is None:
+            return None
+        html, current_url = loaded
+        return html, current_url, card_hash
+
+    for listing in run_pipeline(produce, fetch, parse_listing, n_fetchers=n_fetchers, n_parsers=n_parsers,
+                                queue_size=queue_size, thread_cleanup=quit_driver):
+        if index is None or index.detail_changed(listing):
+            yield listing
+
+
+def run_single(sink, policy, index=None, duplicates=None):
+    # Walk every result page of every search and scrape every listing in this process
+    def crawl(search_url):
+        if config.FETCHERS > 0:
+            return iter_listings_parallel(search_url, policy, index, n_fetchers=config.FETCHERS,
+                                          n_parsers=config.PARSERS or None, queue_size=config.PIPELINE_QUEUE_SIZE)
+        return iter_listings(search_url, policy, index)  # the original sequential crawl
+
+    listings = itertools.chain.from_iterable(crawl(search_url) for search_url in config.SEARCH_URLS)
+    if duplicates is not None:
+        listings = cluster_listings(listings, duplicates)
+    for listing in listings:
+        sink.write(listing)
+        if index is not None:
+            index.mark_written(listing)
+    print(f'Fetch outcomes: {policy.counts}')
+
+
+_http = threading.local()
+
+def poll_result_page(search, page, policy):
+    # Result page for the watch mode: a plain http request (like the requests notebook), much
+    # lighter than a browser page load. Falls back to the browser when the page doesn't come
+    # back with the listing cards (blocked, rendered by javascript...).
+    url = search.page_url(page)
+    if getattr(_http, 'session', None) is None:
+        _http.session = requests.Session()
+        _http.session.headers['User-Agent'] = config.HTTP_USER_AGENT
     try:
-        if 'Last refurbishment:' in main_info_dict:
-            return main_info_dict.get('Last refurbishment:')
+        rate_limiter_for(url).acquire()
+        with concurrency.slot():
+            response = _http.session.get(url, timeout=15)
+            if classify_status(response.status_code) == BLOCKED:
+                # raised in the slot so the concurrency controller backs off as for a blocked page
+                raise FetchError(BLOCKED, url, f'http {response.status_code}')
+        if classify_status(response.status_code) == NOT_FOUND:
+            raise FetchError(NOT_FOUND, url, f'http {response.status_code}')  # the browser won't find it either
+        if response.status_code == 200:
+            cards = site_for_url(url).parse_result_cards(response.text, url)
+            if cards:
+                return ResultPage(search, page, url, [card_url for card_url, _ in cards], dict(cards))
+        print(f'Polling {url} over http gave {response.status_code}, using the browser')
+    except requests.RequestException as e:
+        print(f'Polling {url} over http failed ({e}), using the browser')
+    except FetchError as e:
+        if e.outcome != BLOCKED:
+            raise
+        policy.record(BLOCKED)  # pauses the crawl, the browser below waits for the pause to end
+        print(f'Polling {url} over http was blocked ({e}), using the browser')
+    return fetch_result_page(search, page, policy)
+
+
+def run_watch(sink, policy, index, notifiers):
+    # Polls the first result page(s) of every saved search (sorted by newest) and sends the
+    # listings the index has never seen to the notifiers. The interval shrinks while new
+    # listings keep coming and grows back when nothing happens.
+    searches = [_as_search(url) for url in config.WATCH_SEARCHES or
+                [site_for_url(url).newest_first(url) for url in config.SEARCH_URLS]]
+    interval = config.WATCH_MIN_INTERVAL
+    first_poll = len(index) == 0
+    if first_poll:
+        print('The index is empty, the first poll only records the current listings')
+    while True:
+        n_new = 0
+        for search in searches:
+            for page in range(1, config.WATCH_PAGES + 1):
+                try:
+                    result_page = poll_result_page(search, page, policy)
+                except FetchError as e:
+                    print(f'Could not poll {search.page_url(page)}: {e}')
+                    break
+                new_cards = [(listing_url, card_hash) for listing_url, card_hash in result_page.card_hashes.items()
+                             if not index.is_known(listing_url)]
+                for listing_url, card_hash in new_cards:
+                    try:
+                        listing = policy.call(lambda: scrape_listing(listing_url, card_hash), listing_url,
+                                              on_crash=restart_driver)
+                    except FetchError as e:
+                        print(f"Error scraping {listing_url}: {e}")
+                        continue
+                    if listing is None:
+                        continue
+                    sink.write(listing)
+                    index.mark_written(listing)
+                    if not first_poll:
+                        n_new += 1
+                        for notifier in notifiers:
+                            notifier.notify(listing)
+                if not new_cards:
+                    break  # sorted by newest: nothing new here, nothing new further down
+        if hasattr(sink, 'flush'):
+            sink.flush()
+        first_poll = False
+        if n_new:
+            interval = max(config.WATCH_MIN_INTERVAL, interval / 2)
         else:
-            raise Exception('error')        
-    except:
-        return None
-    
-def flat_year():
+            interval = min(config.WATCH_MAX_INTERVAL, interval * 1.5)
+        # a bit of jitter so the polls don't look like clockwork
+        time.sleep(interval * random.uniform(0.8, 1.2))
+
+
+def run_coordinator(queue, policy):
+    # Seeds the crawl with the result pages and waits until the workers are done. When the
+    # first page tells us how many pages there are they are all queued at once, otherwise the
+    # workers turn every page task into listing tasks plus a task for the following page.
+    new_pages = 0
+    for search_url in config.SEARCH_URLS:
+        search = _as_search(search_url)
+        try:
+            last_page = fetch_result_page(search, 1, policy, with_summary=True).summary.last_page()
+        except FetchError as e:
+            print(f'Could not read the number of pages of {search_url}: {e}')
+            last_page = None
+        pages = range(1, last_page + 1) if last_page else [1]
+        for page in pages:
+            page_url = search.page_url(page)
+            new_pages += queue.enqueue(config.CRAWL_ID, 'page', page_url,
+                                       {'url': page_url, 'page': page, 'search': search_url,
+                                        'fan_out': last_page is not None})
+    quit_driver()  # the coordinator doesn't need its browser any more
+    print(f'Crawl {config.CRAWL_ID} seeded with {new_pages} new result pages')
+    while not queue.is_drained(config.CRAWL_ID):
+        print(f'{time.ctime()} {queue.stats(config.CRAWL_ID)}')
+        time.sleep(30)
+    print(f'Crawl {config.CRAWL_ID} finished: {queue.stats(config.CRAWL_ID)}')
+
+
+def process_page_task(queue, task, policy, index=None):
+    search = _as_search(task.payload.get('search', config.SEARCH_URLS[0]))
     try:
-        if 'Year built:' in main_info_dict:
-            return main_info_dict.get('Year built:')
-        else:
-            raise Exception('error')        
-    except:
-        return None
-    
-    
-def flat_features():
+        result_page = fetch_result_page(search, task.payload['page'], policy)
+    except FetchError as e:
+        if e.outcome not in (ERROR_PAGE, NOT_FOUND):
+            raise
+        print(f"No more pages to navigate after page {task.payload['page'] - 1}.")
+        return
+    new_urls = 0
+    for listing_url, card_hash in iter_changed_cards([result_page], index):
+        new_urls += queue.enqueue(config.CRAWL_ID, 'listing', listing_url, {'url': listing_url, 'card_hash': card_hash})
+    if not task.payload.get('fan_out'):
+        next_page = task.payload['page'] + 1
+        next_url = search.page_url(next_page)
+        queue.enqueue(config.CRAWL_ID, 'page', next_url, {'url': next_url, 'page': next_page, 'search': search.url})
+    print(f"{time.ctime()} Page {task.payload['page']}: {new_urls} new listings queued.")
+
+
+def process_listing_task(sink, task, policy, index=None):
+    listing_url = task.payload['url']
+    card_hash = task.payload.get('card_hash')
     try:
-        features_find = WebDriverWait(driver, 2).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "ul.FeaturesFurnishings_list_S54KV"))
-        )
-        features_raw = features_find.text
-        features = (re.split('[\n]', features_raw))
-        features = [element.lower() for element in features]
-        return features
-    except:
-        return None
+        listing = policy.call(lambda: scrape_listing(listing_url, card_hash), listing_url, on_crash=restart_driver)
+    except FetchError as e:
+        if e.outcome not in (ERROR_PAGE, NOT_FOUND):
+            raise
+        print(f"Skipping {listing_url}: {e}")  # removed listing, retrying won't help
+        return
+    if listing is None:
+        raise Exception(f"Could not scrape {listing_url}")
+    if index is None or index.detail_changed(listing):
+        sink.write(listing, worker=config.WORKER_ID)
+        # the task is acked right after: a buffered sink (Parquet) can't keep the listing
+        # until a later flush, the worker may be stopped before it
+        if hasattr(sink, 'flush'):
+            sink.flush()
+        if index is not None:
+            index.mark_written(listing)
+
+
+def run_worker(queue, sink, policy, index=None):
+    # Pull tasks until the crawl is drained. Failing tasks go back to the queue and get
+    # retried (by this or another worker) until they run out of attempts.
+    while True:
+        task = queue.lease(config.CRAWL_ID, config.WORKER_ID)
+        if task is None:
+            if queue.is_drained(config.CRAWL_ID):
+                break
+            # other workers still hold leases, their tasks may come back to the queue
+            time.sleep(5)
+            continue
+        try:
+            # the retries of policy.call (block pauses included) can outlast the lease
+            with queue.keep_leased(task):
+                if task.kind == 'page':
+                    process_page_task(queue, task, policy, index)
+                else:
+                    process_listing_task(sink, task, policy, index)
+            if not queue.ack(task):
+                print(f'{task.kind} {task.key} was taken over by another worker, result not acked')
+        except Exception as e:
+            status = queue.fail(task, e) or 'lease lost'
+            print(f"Error on {task.kind} {task.key} (attempt {task.attempts}, {status}): {e}")
+    print(f'Worker {config.WORKER_ID} done: {queue.stats(config.CRAWL_ID)}, fetch outcomes: {policy.counts}')
+
+
+if __name__ == '__main__':
+    print(time.ctime())
+    if config.FAILURES:
+        diagnostics.configure(config.FAILURES_DIR, config.FAILURES_KEEP_FIRST, config.FAILURES_SAMPLE_EVERY,
+                              config.FAILURES_QUOTA_MB)
+    policy = RetryPolicy(max_attempts=config.RETRY_ATTEMPTS, base_delay=config.RETRY_BASE_DELAY,
+                         retry_budget=config.RETRY_BUDGET, block_pause=config.BLOCK_PAUSE)
+    index = FingerprintIndex(config.FINGERPRINT_DB) if config.SKIP_UNCHANGED else None
+    if config.SCRAPER_MODE == 'single':
+        # unchanged listings aren't written again: add to flats.csv instead of replacing it
+        # a crawl that runs past midnight stays in the partition of the day it started
+        sink = make_sink(config.SINK, config.CSV_PATH, config.SQLITE_SINK_PATH, config.ARCHIVE_ROOT,
+                         config.JOURNAL_MODE, csv_append=config.SKIP_UNCHANGED, crawl_date=datetime.date.today())
+        duplicates = NearDuplicateIndex.load(config.DEDUP_INDEX, threshold=config.DEDUP_THRESHOLD) if config.DEDUP else None
+        try:
+            run_single(sink, policy, index, duplicates)
+        finally:
+            sink.close()  # writes out what the Parquet sink still buffers, also on Ctrl-C
+        if duplicates is not None:
+            print(f'{len(duplicates.clusters())} flats posted more than once')
+            duplicates.save(config.DEDUP_INDEX)
+    elif config.SCRAPER_MODE == 'coordinator':
+        queue = SQLiteWorkQueue(config.QUEUE_PATH, config.LEASE_SECONDS, config.MAX_ATTEMPTS, config.JOURNAL_MODE)
+        run_coordinator(queue, policy)
+    elif config.SCRAPER_MODE == 'worker':
+        queue = SQLiteWorkQueue(config.QUEUE_PATH, config.LEASE_SECONDS, config.MAX_ATTEMPTS, config.JOURNAL_MODE)
+        sink = make_sink(config.SINK, config.CSV_PATH, config.SQLITE_SINK_PATH, config.ARCHIVE_ROOT,
+                         config.JOURNAL_MODE, csv_append=config.SKIP_UNCHANGED, crawl_date=datetime.date.today())
+        try:
+            run_worker(queue, sink, policy, index)
+        finally:
+            sink.close()
+    elif config.SCRAPER_MODE == 'watch':
+        if index is None:
+            index = FingerprintIndex(config.FINGERPRINT_DB)
+        sink = make_sink(config.WATCH_SINK, config.CSV_PATH, config.SQLITE_SINK_PATH, config.ARCHIVE_ROOT,
+                         config.JOURNAL_MODE, csv_append=True)
+        try:
+            run_watch(sink, policy, index, make_notifiers(config.WATCH_NOTIFY))
+        except KeyboardInterrupt:
+            print('Stopped watching.')
+        finally:
+            sink.close()
+    else:
+        raise ValueError(f'Unknown SCRAPER_MODE {config.SCRAPER_MODE!r}')
+    if index is not None:
+        index.close()
+    concurrency.export_metrics()
+    print(f'Concurrency at the end: {concurrency.metrics()}')
+    quit_driver()
+    diagnostics.close()
 
 
-flats_lst = []
-more_pages = True
-current_page = 1
 
 # testing new atributes:
 # url='https://www.homegate.ch/mieten/4001662556'
@@ -326,152 +642,6 @@ current_page = 1
 #     driver.switch_to.window(driver.window_handles[0])  # Switch back to main page
 #     time.sleep(1)  # Allow time for focus switch
 
-while more_pages:
-
-    # get all the elements containing the flats
-    entire_page = WebDriverWait(driver, 10).until(
-                EC.presence_of_all_elements_located((By.XPATH, '//*[@data-test="result-list-item"]'))
-                )
-    # get all the urls from the current page
-    urls = [
-    item.find_element(By.XPATH, './/a[@href]').get_attribute("href")  # Use relative XPath
-    for item in entire_page
-    ]
-    # # get the entire_page url
-    # entire_page_url = driver.current_url
-       
-    for url in urls:
-        try:
-            # driver.get(url)
-            driver.execute_script(f"window.open('{url}');")  # Open in new tab
-            driver.switch_to.window(driver.window_handles[1])  # Switch to new tab
-
-            # Step 1: Handle the cookie consent or blocking element
-            try:
-                cookie_button = WebDriverWait(driver, 5).until(
-                    EC.element_to_be_clickable((By.XPATH, '//button[contains(text(), "Accept")]'))
-                )
-                cookie_button.click()
-                print("Cookie consent accepted.")
-            except TimeoutException:
-                print(f"Cookie consent button not found on {url}. Proceeding without interaction.")
-            except Exception as cookie_exception:
-                print(f"Cookie consent issue on {url}: {cookie_exception}")
-                with open("page_source_error.html", "w") as f:
-                    f.write(driver.page_source)
-                traceback.print_exc()  # Log full stack trace for debugging
-                continue  # Skip to the next URL
-            
-            # Step 2: Handle the language switcher
-            try:
-                # Wait for the language switcher to be present
-                language_switcher = WebDriverWait(driver, 5).until(
-                    EC.element_to_be_clickable((By.XPATH, '//button[@aria-controls="header-language-switch"]'))
-                )
-
-                # Click the language switcher to change the language
-                language_switcher.click()
-                # Wait for the dropdown to appear
-                english_option = WebDriverWait(driver, 5).until(
-                    EC.element_to_be_clickable((By.XPATH, '//a[@class="HgLanguageSwitch_link_GCiHc" and normalize-space(text())="EN"]'))
-                )
-
-                # Click the English option
-                english_option.click()
-            except Exception as language_exception:
-                print(f"Language switch issue on {url}: {language_exception}")
-                traceback.print_exc()
-                #continue  # Skip to the next URL
-
-            # Creating a dictionary with the 'Main Information'
-            key_type_find = WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.XPATH, '//div[@class="CoreAttributes_coreAttributes_e2NAm"]/dl/dt'))
-            )
-            key_type = []
-            for type in key_type_find:
-                key_type.append(type.text)
-
-            value_type_find = WebDriverWait(driver, 10).until(
-                        EC.presence_of_all_elements_located((By.XPATH, '//div[@class="CoreAttributes_coreAttributes_e2NAm"]/dl/dd'))
-                        )
-            value_type = []
-            for type in value_type_find:
-                value_type.append(type.text)
-            main_info_dict = dict(zip(key_type, value_type))
-
-            # Creating a dictionary with the 'entire_page Information'
-            flats_dict = {'listing_ID': listing_ID(),
-                            'object_ref': object_ref(),
-                            'address': flat_address(),
-                            'postcode': postcode(),
-                            'net_rent': net_rent_price(),
-                            'expenses': expenses_price(),
-                            'rent': rent_price(),
-                            'availability': flat_availability(), 
-                            'type': flat_type(), 
-                            'n_of_rooms': flat_n_rooms(),
-                            'floor': flat_floor(),
-                            'n_of_floors': flat_n_floors(),
-                            'surface_living': flat_surface(),
-                            'floor_space': flat_floor_space(),
-                            'room_height': flat_Room_height(),
-                            'last_refurbishment': flat_last_refurbishment(),
-                            'year_built': flat_year(),
-                            'link': driver.current_url,
-                            'features': flat_features(),
-                        }
-            flats_lst.append(flats_dict)
-        except Exception as e:
-            print(f"Error scraping {url}: {e}")
-            continue  # Skip to next listing
-        
-        df = pd.DataFrame(flats_lst)
-        df.to_csv('flats.csv', index=False)
-        driver.close()  # Close the tab
-        driver.switch_to.window(driver.window_handles[0])  # Switch back to main page
-        time.sleep(1)  # Allow time for focus switch
-    
-    # go to the next page
-    try:
-        
-        # Step 1: Handle the cookie consent or blocking element
-        try:
-            cookie_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, '//button[contains(text(), "Accept")]'))
-            )
-            cookie_button.click()
-            print("Cookie consent accepted.")
-        except TimeoutException:
-            print(f"Cookie consent button not found on {url}. Proceeding without interaction.")
-        except Exception as cookie_exception:
-            print(f"Cookie consent issue on {url}: {cookie_exception}")
-            with open("page_source_error.html", "w") as f:
-                f.write(driver.page_source)
-            traceback.print_exc()  # Log full stack trace for debugging
-            continue  # Skip to the next URL
-        
-        # Step 2: find the next_page button and click it
-        next_page_url = f"https://www.homegate.ch/rent/real-estate/city-zurich/matching-list?ep={current_page + 1}"
-        driver.get(next_page_url)
-
-        if 'An error has occurred' in driver.title:
-            more_pages = False
-            print("No more pages to navigate.")
-            print(f'{len(flats_lst)} flats were added to the dataframe')
-            df = df.append(flats_lst, ignore_index=True)
-            df.to_csv('flats.csv')
-        else:
-            current_page += 1  # Increment manually
-            time.sleep(2)  # Wait for the page to load
-            print(f'{time.ctime()} Navigated to the next page {current_page}.')
-
-    except Exception as e:
-        print(f"Could not navigate to the next page: {e}")        
-        
-    
-        
-
-
 # df= df.drop(df.iloc[:,:3],1)
 
 # df.listing_ID.nunique()
@@ -0,0 +1,172 @@
+# A small lease based work queue on top of SQLite.
+#
+# The coordinator puts result pages and listing urls in the queue, any number of workers
+# lease tasks from it. A leased task is invisible to the other workers until its lease
+# runs out (visibility timeout); if the worker dies before calling ack() the task shows
+# up again and is picked up by somebody else. Failed tasks are retried until they run out
+# of attempts and are then marked as 'dead'.
+#
+# Tasks are deduplicated per crawl on (kind, key), so the same listing showing up on two
+# result pages (or being enqueued by two workers) is only scraped once.
+#
+# Only the worker holding the lease can ack or fail a task: a worker that lost its lease
+# (e.g. it was paused for longer than lease_seconds) finds out instead of overwriting the
+# result of the worker that took the task over. keep_leased() renews the lease while a task
+# is being worked on.
+#
+# The default journal mode (WAL) needs every process on the same host, as it relies on shared
+# memory. For workers on several hosts with the queue on a shared disk use journal_mode='DELETE'
+# (SCRAPER_JOURNAL_MODE=DELETE), and a network filesystem with working file locks.
+
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class Task:
+    id: int
+    crawl: str
+    kind: str
+    key: str
+    payload: dict
+    attempts: int
+    worker: str = None
+
+
+class SQLiteWorkQueue:
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3, journal_mode='WAL'):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.journal_mode = journal_mode
+        # isolation_level=None -> we handle the transactions ourselves (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute(f'PRAGMA journal_mode={journal_mode}')
+        self.conn.execute('PRAGMA busy_timeout=30000')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                crawl TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL NOT NULL DEFAULT 0,
+                worker TEXT,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (crawl, kind, key)
+            )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (crawl, status, lease_until)')
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, crawl, kind, key, payload=None):
+        # Returns True if the task is new, False if it was already in the queue for this crawl
+        now = time.time()
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO tasks (crawl, kind, key, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (crawl, kind, key, json.dumps(payload or {}), now, now))
+        return cursor.rowcount == 1
+
+    def lease(self, crawl, worker, kinds=None):
+        # Takes the oldest pending task (or one whose lease expired) and leases it to `worker`.
+        # Result pages go first so that the listing urls reach the queue as soon as possible.
+        now = time.time()
+        query = '''SELECT id, crawl, kind, key, payload, attempts FROM tasks
+                   WHERE crawl = ? AND (status = 'pending' OR (status = 'leased' AND lease_until < ?))'''
+        params = [crawl, now]
+        if kinds:
+            query += f" AND kind IN ({','.join('?' * len(kinds))})"
+            params += list(kinds)
+        query += " ORDER BY kind = 'page' DESC, id LIMIT 1"
+
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute(query, params).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            task_id, crawl, kind, key, payload, attempts = row
+            if attempts >= self.max_attempts:
+                # the lease expired on its last attempt, the worker probably crashed on it
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'dead', updated_at = ? WHERE id = ?", (now, task_id))
+                self.conn.execute('COMMIT')
+                return self.lease(crawl, worker, kinds)
+            self.conn.execute(
+                "UPDATE tasks SET status = 'leased', attempts = attempts + 1, lease_until = ?, worker = ?, updated_at = ? WHERE id = ?",
+                (now + self.lease_seconds, worker, now, task_id))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return Task(task_id, crawl, kind, key, json.loads(payload), attempts + 1, worker)
+
+    def extend(self, task):
+        # Renew the lease of a task that takes longer than lease_seconds, False if it was lost
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE tasks SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (now + self.lease_seconds, now, task.id, task.worker))
+        return cursor.rowcount == 1
+
+    @contextlib.contextmanager
+    def keep_leased(self, task):
+        # Extends the lease every lease_seconds / 3 until the block exits. The renewals run on
+        # their own thread and connection, as the worker may be sleeping in a block pause.
+        stop = threading.Event()
+
+        def renew():
+            queue = SQLiteWorkQueue(self.path, self.lease_seconds, self.max_attempts, self.journal_mode)
+            try:
+                while not stop.wait(self.lease_seconds / 3):
+                    if not queue.extend(task):
+                        print(f'Lost the lease of {task.kind} {task.key}')
+                        break
+            finally:
+                queue.close()
+
+        thread = threading.Thread(target=renew, name=f'lease-{task.id}', daemon=True)
+        thread.start()
+        try:
+            yield task
+        finally:
+            stop.set()
+            thread.join()
+
+    def ack(self, task):
+        # False if the lease ran out and the task was taken over by another worker
+        cursor = self.conn.execute(
+            "UPDATE tasks SET status = 'done', updated_at = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (time.time(), task.id, task.worker))
+        return cursor.rowcount == 1
+
+    def fail(self, task, error):
+        # Put the task back in the queue, or bury it when it has no attempts left.
+        # None if the lease ran out and the task was taken over by another worker.
+        status = 'dead' if task.attempts >= self.max_attempts else 'pending'
+        cursor = self.conn.execute(
+            "UPDATE tasks SET status = ?, lease_until = 0, last_error = ?, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (status, str(error)[:1000], time.time(), task.id, task.worker))
+        return status if cursor.rowcount == 1 else None
+
+    def stats(self, crawl):
+        rows = self.conn.execute(
+            'SELECT status, COUNT(*) FROM tasks WHERE crawl = ? GROUP BY status', (crawl,)).fetchall()
+        stats = {'pending': 0, 'leased': 0, 'done': 0, 'dead': 0}
+        stats.update(dict(rows))
+        return stats
+
+    def is_drained(self, crawl):
+        stats = self.stats(crawl)
+        return stats['pending'] == 0 and stats['leased'] == 0